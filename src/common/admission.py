@@ -0,0 +1,84 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import time
+
+SHED_POLICIES = ("newest", "oldest")
+
+
+class AdmissionQueue:
+    """
+    Queue of requests waiting to enter the net.
+
+    When the queue is full, either the new request (``newest``) or the request
+    waiting for the longest time (``oldest``) is shed. Requests waiting longer
+    than the deadline are shed when they reach the head of the queue. A shed
+    request is rejected by :py:meth:`RequestContext.reject`.
+
+    :param max_size: Maximum number of waiting requests, 0 for an unbounded queue.
+    :param deadline: Maximum waiting time (sec), ``None`` for no deadline.
+    :param policy: One of :py:data:`SHED_POLICIES`.
+    :param on_shed: Called by the item of a shed request.
+    """
+
+    def __init__(self, max_size=0, deadline=None, policy="newest", on_shed=None):
+        if policy not in SHED_POLICIES:
+            raise RuntimeError(f"Unknown shed policy '{policy}'")
+        self._queue = asyncio.Queue()
+        self._max_size = max_size
+        self._deadline = deadline
+        self._policy = policy
+        self._on_shed = on_shed
+        self.admitted = 0
+        self.shed_full = 0
+        """Number of requests shed because the queue is full."""
+        self.shed_expired = 0
+        """Number of requests shed because they waited longer than the deadline."""
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def _shed(self, entry):
+        _, item, request = entry
+        if self._on_shed is not None:
+            self._on_shed(item)
+        request.reject()
+
+    def put(self, item, request):
+        """
+        :param item: Queued item, e.g. a token.
+        :param request: :py:class:`RequestContext` of the item.
+        :return: ``False`` if the new request is shed.
+        """
+        entry = (time.monotonic(), item, request)
+        if self._max_size > 0 and self._queue.qsize() >= self._max_size:
+            self.shed_full += 1
+            if self._policy == "newest":
+                self._shed(entry)
+                return False
+            self._shed(self._queue.get_nowait())
+        self._queue.put_nowait(entry)
+        self.admitted += 1
+
+        return True
+
+    async def get(self):
+        """
+        :return: The item of the oldest request which is not expired.
+        """
+        while True:
+            entry = await self._queue.get()
+            if self._deadline is None or time.monotonic() - entry[0] <= self._deadline:
+                return entry[1]
+            self.shed_expired += 1
+            self._shed(entry)
+
+    def stats(self):
+        return {
+            "max_size": self._max_size,
+            "deadline": self._deadline,
+            "policy": self._policy,
+            "admitted": self.admitted,
+            "shed_full": self.shed_full,
+            "shed_expired": self.shed_expired,
+        }
@@ -0,0 +1,87 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import math
+
+import numpy as np
+
+ARRIVAL_KINDS = ("constant", "poisson", "trace")
+
+
+def arrival_times(kind, rate, duration, trace=None, rng=None):
+    """
+    Precomputes the arrival times of tokens.
+
+    :param kind: One of :py:data:`ARRIVAL_KINDS`.
+    :param rate: Average number of arrivals per second.
+    :param duration: Arrivals after this time are not generated.
+    :param trace: File including an arrival time (sec) at each line, used when
+                  ``kind`` is ``"trace"``.
+    :param rng: ``numpy.random.Generator`` used by poisson arrivals.
+    :return: Sorted arrival times relative to the start of production.
+    """
+    match kind:
+        case "constant":
+            return np.arange(1, math.floor(rate * duration) + 1) / rate
+        case "poisson":
+            if rng is None:
+                rng = np.random.default_rng()
+            times = np.empty(0)
+            while times.size == 0 or times[-1] < duration:
+                start = times[-1] if times.size else 0.0
+                size = math.ceil(rate * duration) + 16
+                times = np.append(
+                    times, start + np.cumsum(rng.exponential(1.0 / rate, size))
+                )
+            return times[times <= duration]
+        case "trace":
+            times = np.sort(np.atleast_1d(np.loadtxt(trace, dtype=float)))
+            return times[times <= duration]
+
+    raise RuntimeError(f"Unknown arrival schedule '{kind}'")
+
+
+class ArrivalSchedule:
+    """
+    Emits the tokens of an absolute arrival schedule.
+
+    Waking up late never shifts the following arrivals. All arrivals which are
+    due are emitted at once instead.
+
+    :param times: Sorted arrival times, see :py:func:`arrival_times`.
+    """
+
+    def __init__(self, times):
+        self._times = times
+        self._next = 0
+        self.max_burst = 0
+        """Largest number of arrivals emitted at a single wake up."""
+
+    def due(self, elapsed):
+        """
+        :param elapsed: Time passed since the start of production.
+        :return: Number of arrivals due since the last call.
+        """
+        i = int(np.searchsorted(self._times, elapsed, side="right"))
+        count = i - self._next
+        self._next = i
+        self.max_burst = max(self.max_burst, count)
+        return count
+
+    def next_at(self):
+        """
+        :return: Time of the next arrival or ``None`` if the schedule is finished.
+        """
+        if self._next < len(self._times):
+            return float(self._times[self._next])
+        return None
+
+    def __len__(self):
+        return len(self._times)
+
+    def rate(self):
+        """
+        :return: Average rate of the whole schedule.
+        """
+        if len(self._times) == 0:
+            return 0.0
+        return len(self._times) / float(self._times[-1])
@@ -0,0 +1,189 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import sys
+import asyncio
+import getopt
+import json
+import tempfile
+import time
+from itertools import product
+from multiprocessing import Process, SimpleQueue
+
+from .loop import EVENT_LOOPS, HTTP_PARSERS, available, use_event_loop
+from .jsonl import write_record
+
+
+def USAGE():
+    """
+    Measures the throughput of each event loop and HTTP parser combination.
+
+    Tokens per second is the number of tokens consumed by the
+    :doc:`PI Controller </src.pi_controller>` simulation. Requests per second is
+    measured by a closed loop HTTP client sending requests through the
+    :doc:`HTTP balancer </src.http_balancer>` simulation.
+
+    **Arguments:**
+
+      -T <time (sec)>
+        duration of the PI controller simulation
+
+        Default: 2
+      -n <count>
+        number of HTTP requests
+
+        Default: 2000
+      -C <count>
+        number of concurrent HTTP requests
+
+        Default: 32
+      -o <filename>
+        output file name to write results. If empty, prints to stdout.
+
+    **Example**
+
+      make bench-loops args="-T 5 -C 64"
+    """
+    print(USAGE.__doc__)
+
+
+def _client(host, port, concurrency, count, result):
+    """
+    Sends ``count`` POST requests by ``concurrency`` workers and puts the
+    number of requests replied per second to ``result``.
+    """
+    body = b"X" * 1024
+    request = (
+        b"POST / HTTP/1.0\r\nHost: %s\r\nContent-Length: %d\r\n\r\n"
+        % (host.encode("ascii"), len(body))
+        + body
+    )
+    remaining = count
+    replied = 0
+
+    async def worker():
+        nonlocal remaining, replied
+        while remaining > 0:
+            remaining -= 1
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            response = await reader.read()
+            """The server closes HTTP/1.0 connections after the response."""
+            writer.close()
+            if response.startswith(b"HTTP/1.1 200"):
+                replied += 1
+
+    async def main():
+        for i in range(200):
+            try:
+                _, writer = await asyncio.open_connection(host, port)
+                writer.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.05)
+        """Wait until the proxy starts."""
+
+        T = time.time()
+        await asyncio.gather(*(worker() for i in range(concurrency)))
+        result.put(replied / (time.time() - T))
+
+    use_event_loop("asyncio")
+    """The client is the same for all combinations."""
+    asyncio.run(main())
+
+
+def _tokens_per_sec(event_loop, duration, output_file):
+    from ..pi_controller.main import main
+
+    args = ["", "-T", duration, "-p", 5000, "-r", "exponential,0.0005"]
+    args += ["-m", "pool", "-E", event_loop, "-o", output_file]
+    main([str(a) for a in args])
+    with open(output_file, "r") as fh:
+        trial = json.loads(fh.readlines()[-1])
+
+    return sum(stats["count"] for stats in trial["stats"].values()) / duration
+
+
+def _requests_per_sec(event_loop, http, concurrency, count, output_file):
+    from ..http_balancer.main import main
+
+    result = SimpleQueue()
+    client = Process(
+        target=_client, args=("127.0.0.1", 5000, concurrency, count, result)
+    )
+    client.start()
+    args = ["", "-T", 1, "-c", "C1", "-r", "exponential,0.0005", "-A", client.pid]
+    args += ["-E", event_loop, "-U", http, "-o", output_file]
+    main([str(a) for a in args])
+    client.join()
+
+    return result.get()
+
+
+def main(argv):
+    """
+    Main entry point of the benchmark.
+
+    :param argv: Command line arguments
+    :return: Exit status
+    """
+    DURATION = 2.0
+    REQUEST_COUNT = 2000
+    CONCURRENCY = 32
+    OUTPUT_FILE = sys.stdout
+
+    opts, args = getopt.getopt(argv[1:], "T:n:C:o:h")
+
+    for o, a in opts:
+        if o == "-T":
+            DURATION = float(a)
+        elif o == "-n":
+            REQUEST_COUNT = int(a)
+        elif o == "-C":
+            CONCURRENCY = int(a)
+        elif o == "-o":
+            OUTPUT_FILE = open(a, "a")
+        elif o == "-h":
+            USAGE()
+            return 0
+
+    loops = [name for name in EVENT_LOOPS if available(name)]
+    parsers = [name for name in HTTP_PARSERS if available(name)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tokens_per_sec = {}
+        for event_loop in loops:
+            trial_file = f"{tmp_dir}/{event_loop}.jsonl"
+            tokens_per_sec[event_loop] = _tokens_per_sec(
+                event_loop, DURATION, trial_file
+            )
+        """Tokens per second does not depend on the HTTP parser."""
+
+        for event_loop, http in product(loops, parsers):
+            trial_file = f"{tmp_dir}/{event_loop}_{http}.jsonl"
+            results.append(
+                {
+                    "event_loop": event_loop,
+                    "http_parser": http,
+                    "tokens_per_sec": tokens_per_sec[event_loop],
+                    "requests_per_sec": _requests_per_sec(
+                        event_loop, http, CONCURRENCY, REQUEST_COUNT, trial_file
+                    ),
+                }
+            )
+
+    print(f"{'loop':<10}{'http':<12}{'tokens/sec':>12}{'requests/sec':>14}")
+    for r in results:
+        print(
+            f"{r['event_loop']:<10}{r['http_parser']:<12}"
+            f"{r['tokens_per_sec']:>12.1f}{r['requests_per_sec']:>14.1f}"
+        )
+        if OUTPUT_FILE is not sys.stdout:
+            write_record(OUTPUT_FILE, r)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
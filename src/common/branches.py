@@ -0,0 +1,67 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+from soyutnet.constants import GENERIC_ID, GENERIC_LABEL
+
+
+def add_branches(net, reg, p1, branch_count, label, consumer, controller, window=1):
+    """
+    Connects parallel consumer branches to the place ``p1``.
+
+    Branch ``i`` (starting from 1) consists of the places ``p{i}1``, ``p{i}2``,
+    the transitions ``t{i}1``, ``t{i}2``, ``t{i}3``, the consumer ``e{i}`` and
+    the controller place ``k{i}``. So, the branch index can be obtained from the
+    names of consumers and controllers by ``int(place._name[1:]) - 1``.
+
+    :param net: ``SoyutNet`` instance.
+    :param reg: PT registry the branches are registered to.
+    :param p1: Place which redirects the tokens to the branches.
+    :param branch_count: Number of branches.
+    :param label: Label of the tokens travelling through the branches.
+    :param consumer: Consumer function of ``e{i}``.
+    :param controller: Processor function of ``k{i}``.
+    :param window: Number of initial tokens of ``k{i}``, i.e. the maximum number
+                   of requests a branch can take before its controller lets it
+                   take another one.
+    :return: Consumer places.
+    """
+    consumers = []
+    for i in range(1, branch_count + 1):
+        pi1 = net.Place(f"p{i}1")
+        oi2 = net.Observer(verbose=True)
+        pi2 = net.Place(f"p{i}2", observer=oi2)
+        ti1 = net.Transition(f"t{i}1")
+        ti2 = net.Transition(f"t{i}2")
+        ti3 = net.Transition(f"t{i}3")
+        ei = net.SpecialPlace(f"e{i}", consumer=consumer)
+
+        ki = net.Place(
+            f"k{i}",
+            initial_tokens={GENERIC_LABEL: [GENERIC_ID] * window},
+            processor=controller,
+        )
+        """Add initial tokens, otherwise PT nets will stuck at its initial state."""
+
+        for pt in (pi1, pi2, ti1, ti2, ti3, ei, ki):
+            reg.register(pt)
+
+        (
+            p1.connect(ti1, labels=[label])
+            .connect(pi1, weight=2, labels=[GENERIC_LABEL, label])
+            .connect(ti2, weight=2, labels=[GENERIC_LABEL, label])
+            .connect(pi2, labels=[label])
+            .connect(ti3, labels=[label])
+            .connect(ei, labels=[label]),
+            ti2.connect(ki).connect(ti1),
+        )
+        consumers.append(ei)
+
+    return consumers
+
+
+def others_mean(values, index):
+    """
+    :param values: NumPy array holding a value for each branch.
+    :param index: Branch index.
+    :return: Mean of the values of the branches other than ``index``.
+    """
+    return (values.sum() - values[index]) / (len(values) - 1)
@@ -0,0 +1,208 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+from .echo import read_body
+
+
+class ResponseCache:
+    """
+    Caches the responses of an ASGI app keyed by the method, path and the
+    digest of the request body.
+
+    The least recently used responses are evicted when the stored bytes exceed
+    ``max_bytes``. If ``ttl`` is given, a response also expires after ``ttl``
+    seconds. Concurrent identical requests are coalesced, i.e. the app serves
+    the first one and the others wait for its response.
+
+    Since the key depends on the whole body, the request body is read before
+    calling the app even if the app streams the response.
+
+    :param max_bytes: Maximum total size of the stored responses.
+    :param ttl: Lifetime (sec) of a response. ``None`` means it never expires.
+    """
+
+    def __init__(self, max_bytes, ttl=None):
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        """Responses and their storage times, the most recently used one is at the end."""
+        self._flights = {}
+        """Futures of the responses being produced by the app"""
+        self.size = 0
+        """Total size of the stored responses"""
+        self.hits = 0
+        """Number of requests replied by a stored response."""
+        self.coalesced = 0
+        """Number of requests replied by the response of a concurrent identical request."""
+        self.misses = 0
+        """Number of requests served by the app."""
+        self.evictions = 0
+        """Number of responses dropped to keep the size under the budget."""
+        self.expirations = 0
+        """Number of responses dropped because they are older than the TTL."""
+        self.bytes_saved = 0
+        """Total body size of the responses which are not produced by the app."""
+
+    @staticmethod
+    def _key(scope, body):
+        return (
+            scope["method"],
+            scope["path"],
+            scope.get("query_string", b""),
+            hashlib.sha256(body).digest(),
+        )
+
+    @staticmethod
+    def _entry_size(entry):
+        status, headers, body = entry
+        return len(body) + sum(len(name) + len(value) for name, value in headers)
+
+    def _lookup(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        entry, stored_at = item
+        if self._ttl is not None and time.monotonic() - stored_at >= self._ttl:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+
+        return entry
+
+    def _drop(self, key):
+        entry, stored_at = self._entries.pop(key)
+        self.size -= self._entry_size(entry)
+
+    def _store(self, key, entry):
+        size = self._entry_size(entry)
+        if size > self._max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        while self.size + size > self._max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+        self._entries[key] = (entry, time.monotonic())
+        self.size += size
+
+    @staticmethod
+    async def _replay(send, entry):
+        status, headers, body = entry
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def _produce(self, scope, body, send, app):
+        """
+        Calls the app with the request body read already and records the
+        response while it is sent.
+
+        :return: The response as (status, headers, body), or ``None`` if it
+                 is not successful or larger than the budget.
+        """
+        received = False
+
+        async def receive():
+            nonlocal received
+            if received:
+                return {"type": "http.disconnect"}
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        response = {"status": None, "headers": [], "chunks": [], "size": 0}
+
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif (
+                message["type"] == "http.response.body"
+                and response["chunks"] is not None
+            ):
+                chunk = message.get("body", b"")
+                response["size"] += len(chunk)
+                if response["size"] <= self._max_bytes:
+                    response["chunks"].append(chunk)
+                else:
+                    response["chunks"] = None
+                    """Larger than the budget, the chunks are not kept."""
+            await send(message)
+
+        await app(scope, receive, recording_send)
+        if response["status"] != 200 or response["chunks"] is None:
+            return None
+
+        return (response["status"], response["headers"], b"".join(response["chunks"]))
+
+    async def serve(self, scope, receive, send, app):
+        """
+        Replies an HTTP request by a cached response or by calling ``app``.
+
+        :param scope: ASGI HTTP scope.
+        :param receive: ASGI receive function.
+        :param send: ASGI send function.
+        :param app: ASGI app producing the response of a miss.
+        """
+        body = await read_body(receive)
+        key = self._key(scope, body)
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            self.bytes_saved += len(entry[2])
+            await self._replay(send, entry)
+            return
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            entry = await asyncio.shield(flight)
+            """Cancelling a waiter does not cancel the flight of the others."""
+            if entry is not None:
+                self.coalesced += 1
+                self.bytes_saved += len(entry[2])
+                await self._replay(send, entry)
+                return
+
+        self.misses += 1
+        if flight is not None:
+            await self._produce(scope, body, send, app)
+            """The concurrent request failed, so this one is served without coalescing."""
+            return
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        entry = None
+        try:
+            entry = await self._produce(scope, body, send, app)
+        finally:
+            del self._flights[key]
+            flight.set_result(entry)
+        if entry is not None:
+            self._store(key, entry)
+
+    def stats(self):
+        served = self.hits + self.coalesced + self.misses
+        return {
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": self.size,
+            "bytes_saved": self.bytes_saved,
+            "hit_ratio": (self.hits + self.coalesced) / served if served else 0.0,
+        }
+
+
+def new_cache(max_bytes, ttl=None):
+    """
+    :param max_bytes: Byte budget of the cache, zero disables caching.
+    :param ttl: Lifetime (sec) of a response.
+    :return: :py:class:`ResponseCache` or ``None`` if ``max_bytes`` is zero.
+    """
+    return ResponseCache(max_bytes, ttl) if max_bytes > 0 else None
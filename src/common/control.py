@@ -0,0 +1,71 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import json
+import socket
+
+
+async def serve_control(path, handler):
+    """
+    Starts a control server listening on a Unix domain socket.
+
+    Each command is a JSON object sent on a single line. The reply returned by
+    ``handler`` is written back the same way.
+
+    :param path: Socket path.
+    :param handler: Async function receiving the command and returning the reply.
+    :return: ``asyncio.Server`` instance.
+    """
+
+    async def handle(reader, writer):
+        try:
+            while line := await reader.readline():
+                reply = await handler(json.loads(line))
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except asyncio.CancelledError:
+            pass
+            """The simulation may end before the client closes the connection."""
+        finally:
+            writer.close()
+
+    return await asyncio.start_unix_server(handle, path)
+
+
+def send_command(path, **command):
+    """
+    Sends a command to a control server and waits for its reply.
+
+    :param path: Socket path.
+    :param command: Command fields.
+    :return: Reply.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(command).encode() + b"\n")
+        with sock.makefile("rb") as fh:
+            return json.loads(fh.readline())
+
+
+async def wait_command(path, cmd):
+    """
+    Starts a control server and waits until it receives the command ``cmd``.
+
+    :param path: Socket path.
+    :param cmd: Expected value of the ``cmd`` field.
+    :return: The command.
+    """
+    received = asyncio.get_running_loop().create_future()
+
+    async def handler(command):
+        if command.get("cmd") != cmd:
+            return {"ok": False}
+        if not received.done():
+            received.set_result(command)
+        return {"ok": True}
+
+    server = await serve_control(path, handler)
+    try:
+        return await received
+    finally:
+        server.close()
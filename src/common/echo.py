@@ -0,0 +1,86 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+
+ECHO_MODES = ("buffer", "delay", "stream")
+"""
+* buffer: the whole body is read, then it is sent back after the delay,
+* delay: each chunk is sent back as soon as it is read after the delay,
+* stream: each chunk is sent back as soon as it is read, then the response
+  ends after the delay.
+"""
+
+
+async def read_body(receive):
+    """
+    Reads the entire body of an ASGI request.
+
+    The chunks are joined once at the end, so the time is linear in the body
+    size.
+    """
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+
+    return b"".join(chunks)
+
+
+def _content_length(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            return value
+    return None
+
+
+async def _process(delay, body, work):
+    if work is None:
+        await asyncio.sleep(delay)
+    else:
+        await work(delay, body)
+
+
+async def echo(scope, receive, send, delay, mode="buffer", work=None):
+    """
+    Echoes the request body back in an HTTP response and imitates a time
+    consuming process by sleeping ``delay`` seconds.
+
+    In ``delay`` and ``stream`` modes, a single chunk of the body is kept in
+    memory. The length of the response is the Content-Length of the request, or
+    the response is chunked if it is not given.
+
+    :param scope: ASGI HTTP scope.
+    :param receive: ASGI receive function.
+    :param send: ASGI send function.
+    :param delay: Processing time (sec).
+    :param mode: One of :py:data:`ECHO_MODES`.
+    :param work: :py:class:`src.common.work.WorkModel` doing CPU-bound work
+                 instead of sleeping. The streaming modes do not keep the body,
+                 so its ``hash`` model hashes zero bytes.
+    """
+    headers = [(b"content-type", b"text/plain")]
+    if mode == "buffer":
+        body = await read_body(receive)
+        await _process(delay, body, work)
+        headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+        return
+
+    if (length := _content_length(scope)) is not None:
+        headers.append((b"content-length", length))
+    if mode == "delay":
+        await _process(delay, b"", work)
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    more_body = True
+    while more_body:
+        message = await receive()
+        more_body = message.get("more_body", False)
+        if body := message.get("body", b""):
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+            """Uvicorn stops reading the request while the response cannot be sent."""
+    if mode == "stream":
+        await _process(delay, b"", work)
+    await send({"type": "http.response.body", "body": b""})
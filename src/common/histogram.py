@@ -0,0 +1,116 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import math
+
+import numpy as np
+
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+
+class LogHistogram:
+    """
+    Histogram of positive durations with logarithmically spaced buckets.
+
+    Its memory does not grow by the number of recorded values. A quantile is
+    reported as the upper edge of the bucket it falls into, so its relative
+    error is bounded by the bucket width.
+
+    :param low: Upper edge of the first bucket, smaller values are counted in it.
+    :param high: Lower edge of the last bucket, larger values are counted in it.
+    :param buckets_per_decade: Resolution of the histogram.
+    """
+
+    def __init__(self, low=1e-6, high=1e3, buckets_per_decade=20):
+        self._low = low
+        self._scale = buckets_per_decade
+        size = math.ceil(math.log10(high / low) * buckets_per_decade) + 2
+        self._counts = np.zeros(size, dtype=np.int64)
+        self._edges = low * 10.0 ** (np.arange(size) / buckets_per_decade)
+        """Upper edges of the buckets."""
+        self._edges[-1] = math.inf
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    def record(self, value):
+        i = 0
+        if value > self._low:
+            i = min(
+                math.ceil(math.log10(value / self._low) * self._scale),
+                len(self._counts) - 1,
+            )
+        self._counts[i] += 1
+        self._count += 1
+        self._sum += value
+        self._max = max(self._max, value)
+
+    def merge(self, other):
+        """
+        Adds the values recorded by ``other`` which must have the same buckets.
+        """
+        self._counts += other._counts
+        self._count += other._count
+        self._sum += other._sum
+        self._max = max(self._max, other._max)
+
+    def quantile(self, q):
+        if self._count == 0:
+            return 0.0
+        i = np.searchsorted(np.cumsum(self._counts), q * self._count)
+        return float(min(self._edges[i], self._max))
+
+    def summary(self):
+        """
+        :return: Number of values, their mean and maximum and the quantiles in
+                 :py:data:`QUANTILES`.
+        """
+        result = {
+            "count": self._count,
+            "mean": self._sum / self._count if self._count else 0.0,
+            "max": self._max,
+        }
+        for name, q in QUANTILES.items():
+            result[name] = self.quantile(q)
+
+        return result
+
+
+class BranchLatencies:
+    """
+    Keeps a :py:class:`LogHistogram` for each metric of each branch.
+
+    :param branch_count: Number of branches.
+    """
+
+    def __init__(self, branch_count):
+        self._histograms = [{} for i in range(branch_count)]
+
+    def record(self, metric, index, value):
+        """
+        :param metric: Metric name, e.g. ``"sensor_wait"``.
+        :param index: Branch index.
+        :param value: Duration in seconds.
+        """
+        histograms = self._histograms[index]
+        if metric not in histograms:
+            histograms[metric] = LogHistogram()
+        histograms[metric].record(value)
+
+    def merge(self, other):
+        """
+        Adds the values recorded by ``other``, e.g. by another process.
+        """
+        for histograms, others in zip(self._histograms, other._histograms):
+            for metric, h in others.items():
+                if metric not in histograms:
+                    histograms[metric] = LogHistogram()
+                histograms[metric].merge(h)
+
+    def summary(self):
+        """
+        :return: Summaries of the metrics keyed by consumer names ``e1``, ``e2``, ...
+        """
+        return {
+            f"e{i + 1}": {name: h.summary() for name, h in histograms.items()}
+            for i, histograms in enumerate(self._histograms)
+        }
@@ -0,0 +1,163 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+CHUNK_SIZE = 1 << 16
+"""Maximum size of a response body chunk read from the upstream server."""
+HOP_BY_HOP = frozenset(
+    (
+        b"connection",
+        b"keep-alive",
+        b"proxy-authenticate",
+        b"proxy-authorization",
+        b"te",
+        b"trailer",
+        b"transfer-encoding",
+        b"upgrade",
+    )
+)
+"""Headers which belong to a single connection and are not forwarded."""
+SERVER_HEADERS = frozenset((b"date", b"server"))
+"""
+Response headers added by the ASGI server itself. They are not forwarded,
+otherwise the relayed response would carry those of both servers.
+"""
+
+
+def write_request_head(writer, scope, version=None):
+    """
+    Writes the request line and headers of an ASGI request to the upstream
+    server by a single ``writelines`` call.
+
+    :param writer: ``asyncio.StreamWriter`` connected to the upstream server.
+    :param scope: ASGI HTTP scope.
+    :param version: HTTP version sent to the upstream server, e.g. ``"1.1"`` to
+                    keep the connection alive. Version of the request if ``None``.
+    :return: ``True`` if the body must be sent by chunked transfer encoding,
+             because its length is not known.
+    """
+    target = scope.get("raw_path") or scope.get("path", "/").encode("ascii")
+    if query := scope.get("query_string", b""):
+        target += b"?" + query
+    version = (version or scope.get("http_version", "1.0")).encode("ascii")
+
+    lines = [scope.get("method", "GET").encode("ascii"), b" ", target]
+    lines += [b" HTTP/", version, b"\r\n"]
+    has_length = False
+    for name, value in scope.get("headers", []):
+        if name in HOP_BY_HOP:
+            continue
+        has_length = has_length or name == b"content-length"
+        lines += [name, b": ", value, b"\r\n"]
+    chunked = not has_length and version != b"1.0"
+    if chunked:
+        lines.append(b"transfer-encoding: chunked\r\n")
+    lines.append(b"\r\n")
+    writer.writelines(lines)
+
+    return chunked
+
+
+async def relay_request_body(receive, writer, chunked=False):
+    """
+    Sends the ASGI request body to the upstream server chunk by chunk.
+
+    :param receive: ASGI receive function.
+    :param writer: ``asyncio.StreamWriter`` connected to the upstream server.
+    :param chunked: See :py:func:`write_request_head`.
+    """
+    more_body = True
+    while more_body:
+        message = await receive()
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if chunked and body:
+            writer.writelines([b"%x\r\n" % len(body), body, b"\r\n"])
+        elif body:
+            writer.write(body)
+        await writer.drain()
+        """Apply back pressure so a large body is never buffered as a whole."""
+    if chunked:
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def read_response_head(reader):
+    """
+    :param reader: ``asyncio.StreamReader`` connected to the upstream server.
+    :return: HTTP version, status code and list of headers with lower case names.
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head[:-4].split(b"\r\n")
+    version, status = lines[0].split(b" ", 2)[:2]
+    headers = []
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        headers.append((name.strip().lower(), value.strip()))
+
+    return version, int(status), headers
+
+
+def _keep_alive(version, headers):
+    """
+    :return: ``True`` if the connection can carry another request after the response.
+    """
+    fields = dict(headers)
+    if fields.get(b"connection", b"").lower() == b"close" or version != b"HTTP/1.1":
+        return False
+    return b"content-length" in fields or b"transfer-encoding" in fields
+
+
+async def _body_chunks(reader, headers):
+    fields = dict(headers)
+    if b"chunked" in fields.get(b"transfer-encoding", b"").lower():
+        while size := int((await reader.readuntil(b"\r\n")).split(b";", 1)[0], 16):
+            yield await reader.readexactly(size)
+            await reader.readexactly(2)
+        while await reader.readuntil(b"\r\n") != b"\r\n":
+            """Skip trailers"""
+    elif b"content-length" in fields:
+        remaining = int(fields[b"content-length"])
+        while remaining > 0:
+            data = await reader.read(min(remaining, CHUNK_SIZE))
+            if not data:
+                raise ConnectionError("Upstream closed before the end of body")
+            remaining -= len(data)
+            yield data
+    else:
+        while data := await reader.read(CHUNK_SIZE):
+            yield data
+
+
+async def relay_response(reader, send, on_head=None):
+    """
+    Relays the response of the upstream server to the ASGI client.
+
+    The body is sent in chunks as they are read, so the proxy keeps at most
+    :py:data:`CHUNK_SIZE` bytes of a response.
+
+    :param reader: ``asyncio.StreamReader`` connected to the upstream server.
+    :param send: ASGI send function.
+    :param on_head: Called without arguments when the response head is received.
+    :return: Number of body bytes relayed and whether the upstream connection
+             can be reused.
+    """
+    version, status, headers = await read_response_head(reader)
+    if on_head is not None:
+        on_head()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                h
+                for h in headers
+                if h[0] not in HOP_BY_HOP and h[0] not in SERVER_HEADERS
+            ],
+        }
+    )
+    size = 0
+    async for data in _body_chunks(reader, headers):
+        size += len(data)
+        await send({"type": "http.response.body", "body": data, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+    return size, _keep_alive(version, headers)
@@ -0,0 +1,55 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import os
+import json
+
+
+def write_record(fh, record):
+    """
+    Appends a record as a single line to a JSON Lines file.
+
+    The line is flushed immediately, so a crashed trial never corrupts the
+    records written before it and the file can be read while it grows.
+
+    :param fh: File object opened in text mode.
+    :param record: JSON serializable object.
+    """
+    fh.write(json.dumps(record) + os.linesep)
+    fh.flush()
+
+
+def iter_records(fn):
+    """
+    Reads the records of a JSON Lines file one by one.
+
+    Lines which can not be parsed (e.g. the last line of a trial which is
+    still being written) are skipped. The trials of the former
+    ``{ "trials": [...] }`` result files are also read, since each of them
+    is on its own line followed by a comma.
+
+    :param fn: File name.
+    :return: Record generator.
+    """
+    with open(fn, "r") as fh:
+        for line in fh:
+            line = line.strip().rstrip(",")
+            if not line.startswith("{"):
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and record:
+                yield record
+
+
+def results_file(stem):
+    """
+    :param stem: Name of a results file without its extension.
+    :return: ``<stem>.jsonl``, or ``<stem>.json`` written in the former format if
+             only it exists.
+    """
+    fn = f"{stem}.jsonl"
+    if not os.path.exists(fn) and os.path.exists(f"{stem}.json"):
+        return f"{stem}.json"
+    return fn
@@ -0,0 +1,153 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import os
+import asyncio
+
+from .control import wait_command
+
+DRAIN_TIMEOUT = 5.0
+"""Maximum time (sec) to wait for the requests in flight at the end of a trial."""
+
+
+async def wait_readable(fd):
+    """
+    Waits until the file descriptor ``fd`` becomes readable, e.g. the read end
+    of a pipe whose write ends are all closed.
+    """
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+    try:
+        await ready
+    finally:
+        loop.remove_reader(fd)
+
+
+async def wait_exit(pid, interval=0.05):
+    """
+    Waits until the process ``pid`` exits.
+
+    On Linux, the exit is notified by a pidfd, so no polling is required.
+    Otherwise, the process status is checked at each ``interval`` seconds.
+
+    :param pid: Process ID, e.g. of the load generator.
+    :param interval: Polling interval (sec) if pidfd is not supported.
+    """
+    try:
+        fd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return
+    except (AttributeError, OSError):
+        import psutil
+
+        try:
+            proc = psutil.Process(pid)
+            while proc.is_running() and proc.status() != psutil.STATUS_ZOMBIE:
+                await asyncio.sleep(interval)
+        except psutil.NoSuchProcess:
+            pass
+        return
+
+    try:
+        await wait_readable(fd)
+        """A pidfd becomes readable when the process exits, even before it is reaped."""
+    finally:
+        os.close(fd)
+
+
+async def wait_trial_end(done_path=None, pid=None, runtime=None):
+    """
+    Waits until the end of a trial signalled by
+
+    * the ``done`` command of the load generator at the control socket ``done_path``,
+    * exit of the load generator process ``pid``.
+
+    If both are given, the trial ends at whichever comes first, so it does not
+    hang if the load generator dies before sending ``done``. If neither is
+    given, the trial ends after ``runtime`` seconds or never if it is ``None``.
+    """
+    waits = []
+    if done_path is not None:
+        waits.append(asyncio.create_task(wait_command(done_path, "done")))
+    if pid is not None:
+        waits.append(asyncio.create_task(wait_exit(pid)))
+    if not waits:
+        if runtime is not None:
+            await asyncio.sleep(runtime)
+        else:
+            await asyncio.get_running_loop().create_future()
+        return
+
+    try:
+        done, pending = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in waits:
+            task.cancel()
+        await asyncio.gather(*waits, return_exceptions=True)
+        """The control server is closed before returning."""
+    for task in done:
+        task.result()
+
+
+class InFlight:
+    """
+    Counts the requests being processed, so a server can be shut down as soon
+    as they are replied.
+
+    .. code:: python
+
+        with in_flight:
+            await handle(request)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+    def __enter__(self):
+        self.count += 1
+        self._drained.clear()
+        return self
+
+    def __exit__(self, *exc):
+        self.count -= 1
+        if self.count == 0:
+            self._drained.set()
+
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        """
+        Waits until all requests are replied.
+
+        :param timeout: Maximum waiting time (sec), ``None`` for no limit.
+        :return: ``False`` if some requests are still in flight.
+        """
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+async def stop_server(server, in_flight=None):
+    """
+    Stops a Uvicorn server.
+
+    If the requests in flight are replied within :py:data:`DRAIN_TIMEOUT`, the
+    listening sockets and connections are closed at once. Otherwise, or if
+    ``in_flight`` is not given, ``uvicorn.Server.shutdown`` is called which
+    waits for a grace period.
+
+    :param server: ``uvicorn.Server`` instance or ``None``.
+    :param in_flight: :py:class:`InFlight` counter of the server's requests.
+    """
+    if server is None:
+        return
+    if in_flight is None or not await in_flight.drain():
+        await server.shutdown()
+        return
+    for listener in server.servers:
+        listener.close()
+    for connection in list(server.server_state.connections):
+        connection.shutdown()
+    server.should_exit = True
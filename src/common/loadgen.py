@@ -0,0 +1,337 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import sys
+import asyncio
+import getopt
+import time
+from multiprocessing import Process, SimpleQueue
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from .control import send_command
+from .http_relay import read_response_head, _body_chunks, _keep_alive
+from .loop import use_event_loop
+
+
+def USAGE():
+    """
+    Sends HTTP requests to a server and measures the time to receive each
+    response. It replaces the ``ab`` command of the HTTP simulations.
+
+    In closed loop mode, each client sends its next request after the response of
+    the previous one. In open loop mode, the requests are sent at the arrival times
+    of a Poisson process regardless of the responses.
+
+    **Arguments:**
+
+      loadgen [options] <url>
+
+      -n <count>
+        total number of requests
+
+        Default: 1000
+      -c <count>
+        number of concurrent clients in closed loop mode
+
+        Default: 1
+      -R <rate (Hz)>
+        average request rate. If provided, the requests are sent in open loop mode.
+      -w <count>
+        number of processes sending requests
+
+        Default: 1
+      -p <filename>
+        file including the body of POST requests. If not provided, GET requests are sent.
+      -k
+        if provided, keeps the connections alive with HTTP/1.1
+      -e <filename>
+        CSV file of the percentiles of response time in the format of ``ab -e``
+      -l <filename>
+        file including the response time (ms) of each request at each line
+      -D <path>
+        control socket of the simulation which is notified at the end
+      -S <seed>
+        seed of the arrival times in open loop mode
+
+    **Example**
+
+      python -m src.common.loadgen -n 1000 -c 8 -p test.txt -e result.csv http://localhost:5000/
+    """
+    print(USAGE.__doc__)
+
+
+def _request_bytes(url, body, keep_alive):
+    parts = urlsplit(url)
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    method = b"GET" if body is None else b"POST"
+    version = b"1.1" if keep_alive else b"1.0"
+    lines = [method, b" ", target.encode("ascii"), b" HTTP/", version, b"\r\n"]
+    lines += [b"Host: ", parts.netloc.encode("ascii"), b"\r\n"]
+    if keep_alive:
+        lines.append(b"Connection: keep-alive\r\n")
+    if body is not None:
+        lines += [b"Content-Type: text/plain\r\n"]
+        lines += [b"Content-Length: %d\r\n" % len(body), b"\r\n", body]
+    else:
+        lines.append(b"\r\n")
+
+    return b"".join(lines)
+
+
+async def _read_response(reader):
+    """
+    Reads a response whose body is delimited by its Content-Length, chunked
+    or ends when the server closes the connection.
+
+    :return: Status code and whether the connection can be reused.
+    """
+    version, status, headers = await read_response_head(reader)
+    async for data in _body_chunks(reader, headers):
+        pass
+
+    return status, _keep_alive(version, headers)
+
+
+class _Client:
+    """
+    Requests sent by a single process.
+
+    :param host: Hostname of the server.
+    :param port: Port of the server.
+    :param request: Request bytes.
+    :param keep_alive: Reuse connections.
+    """
+
+    def __init__(self, host, port, request, keep_alive):
+        self._host = host
+        self._port = port
+        self._request = request
+        self._keep_alive = keep_alive
+        self._idle = []
+        self.latencies = []
+        """Response time of each successful request (sec)"""
+        self.failed = 0
+
+    async def send(self, sent_at=None):
+        """
+        Sends a request and records its response time.
+
+        :param sent_at: Scheduled time of the request. If the request is sent
+                        late, the delay is included in the response time.
+        """
+        sent_at = time.perf_counter() if sent_at is None else sent_at
+        try:
+            if self._idle:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(self._host, self._port)
+            writer.write(self._request)
+            status, reusable = await _read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            self.failed += 1
+            return
+        if self._keep_alive and reusable:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        if 200 <= status < 300:
+            self.latencies.append(time.perf_counter() - sent_at)
+        else:
+            self.failed += 1
+
+    async def closed_loop(self, count, concurrency):
+        remaining = count
+
+        async def client():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await self.send()
+
+        await asyncio.gather(*(client() for i in range(concurrency)))
+
+    async def open_loop(self, count, rate, rng):
+        times = np.cumsum(rng.exponential(1.0 / rate, count))
+        """Poisson arrivals"""
+        T = time.perf_counter()
+        tasks = []
+        for t in times:
+            delay = T + t - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.send(T + t)))
+        await asyncio.gather(*tasks)
+
+    def close(self):
+        for reader, writer in self._idle:
+            writer.close()
+
+
+def _worker(url, request, count, concurrency, rate, keep_alive, seed, result):
+    parts = urlsplit(url)
+    client = _Client(parts.hostname, parts.port or 80, request, keep_alive)
+
+    async def main():
+        if rate is None:
+            await client.closed_loop(count, concurrency)
+        else:
+            await client.open_loop(count, rate, np.random.default_rng(seed))
+        client.close()
+
+    use_event_loop("asyncio")
+    asyncio.run(main())
+    result.put((client.latencies, client.failed))
+
+
+async def _wait_server(host, port, timeout=30.0):
+    T = time.time()
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.time() - T > timeout:
+                raise
+            await asyncio.sleep(0.05)
+
+
+def percentiles(latencies):
+    """
+    :param latencies: Response times (sec).
+    :return: Response time (ms) below which ``i`` percent of the requests are
+             replied for ``i`` in 0, ..., 99 computed as ``ab`` does.
+    """
+    values = np.sort(np.asarray(latencies)) * 1e3
+    if values.size == 0:
+        return np.zeros(100)
+    return values[(values.size * np.arange(100)) // 100]
+
+
+def write_percentiles(filename, latencies):
+    with open(filename, "w") as fh:
+        fh.write("Percentage served,Time in ms\n")
+        for i, value in enumerate(percentiles(latencies)):
+            fh.write(f"{i},{value:.3f}\n")
+
+
+def notify_done(path, **stats):
+    """
+    Tells the simulation listening on the control socket ``path`` that all
+    requests are replied.
+    """
+    for i in range(100):
+        try:
+            return send_command(path, cmd="done", **stats)
+        except (FileNotFoundError, ConnectionRefusedError):
+            time.sleep(0.05)
+    """The simulation may not have started its control server yet."""
+
+
+def main(argv):
+    """
+    Main entry point of the load generator.
+
+    :param argv: Command line arguments
+    :return: Exit status
+    """
+    COUNT = 1000
+    CONCURRENCY = 1
+    RATE = None
+    WORKERS = 1
+    BODY = None
+    KEEP_ALIVE = False
+    CSV_FILE = None
+    RAW_FILE = None
+    DONE_PATH = None
+    SEED = None
+
+    opts, args = getopt.getopt(argv[1:], "n:c:R:w:p:ke:l:D:S:h")
+
+    for o, a in opts:
+        if o == "-n":
+            COUNT = int(a)
+        elif o == "-c":
+            CONCURRENCY = int(a)
+        elif o == "-R":
+            RATE = float(a)
+        elif o == "-w":
+            WORKERS = int(a)
+        elif o == "-p":
+            with open(a, "rb") as fh:
+                BODY = fh.read()
+        elif o == "-k":
+            KEEP_ALIVE = True
+        elif o == "-e":
+            CSV_FILE = a
+        elif o == "-l":
+            RAW_FILE = a
+        elif o == "-D":
+            DONE_PATH = a
+        elif o == "-S":
+            SEED = int(a)
+        elif o == "-h":
+            USAGE()
+            return 0
+
+    if len(args) != 1:
+        USAGE()
+        return 1
+    url = args[0]
+    parts = urlsplit(url)
+    request = _request_bytes(url, BODY, KEEP_ALIVE)
+
+    WORKERS = max(1, min(WORKERS, CONCURRENCY if RATE is None else COUNT))
+    seeds = np.random.SeedSequence(SEED).spawn(WORKERS)
+    result = SimpleQueue()
+    procs = []
+    asyncio.run(_wait_server(parts.hostname, parts.port or 80))
+    T = time.time()
+    for i in range(WORKERS):
+        count = COUNT // WORKERS + (i < COUNT % WORKERS)
+        concurrency = CONCURRENCY // WORKERS + (i < CONCURRENCY % WORKERS)
+        rate = None if RATE is None else RATE / WORKERS
+        """Merged Poisson processes are also a Poisson process."""
+        proc = Process(
+            target=_worker,
+            args=(url, request, count, concurrency, rate, KEEP_ALIVE, seeds[i], result),
+        )
+        proc.start()
+        procs.append(proc)
+
+    latencies = []
+    failed = 0
+    for proc in procs:
+        worker_latencies, worker_failed = result.get()
+        latencies += worker_latencies
+        failed += worker_failed
+    for proc in procs:
+        proc.join()
+    elapsed = time.time() - T
+
+    if CSV_FILE is not None:
+        write_percentiles(CSV_FILE, latencies)
+    if RAW_FILE is not None:
+        np.savetxt(RAW_FILE, np.asarray(latencies) * 1e3, fmt="%.3f")
+
+    completed = len(latencies)
+    print(f"Complete requests:      {completed}")
+    print(f"Failed requests:        {failed}")
+    print(f"Time taken for tests:   {elapsed:.3f} seconds")
+    print(f"Requests per second:    {completed / elapsed:.2f} [#/sec]")
+    if completed > 0:
+        print("Percentage of the requests served within a certain time (ms)")
+        values = percentiles(latencies)
+        for p in (50, 66, 75, 80, 90, 95, 98, 99):
+            print(f"  {p}%  {values[p]:8.3f}")
+        print(f" 100%  {max(latencies) * 1e3:8.3f} (longest request)")
+
+    if DONE_PATH is not None:
+        notify_done(DONE_PATH, completed=completed, failed=failed)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,48 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import importlib.util
+
+EVENT_LOOPS = ("asyncio", "uvloop")
+HTTP_PARSERS = ("h11", "httptools")
+
+
+def available(name):
+    """
+    :param name: Event loop or HTTP parser name.
+    :return: ``True`` if it can be used in this environment.
+    """
+    return name == "asyncio" or importlib.util.find_spec(name) is not None
+
+
+def use_event_loop(name):
+    """
+    Selects the event loop implementation used by ``asyncio.run`` and so
+    ``soyutnet.run``.
+
+    :param name: One of :py:data:`EVENT_LOOPS`.
+    """
+    if name not in EVENT_LOOPS:
+        raise RuntimeError(f"Unknown event loop '{name}'")
+    if not available(name):
+        raise RuntimeError(f"Event loop '{name}' requires the '{name}' package.")
+
+    if name == "uvloop":
+        import uvloop
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    else:
+        asyncio.set_event_loop_policy(None)
+
+
+def http_parser(name):
+    """
+    :param name: One of :py:data:`HTTP_PARSERS`.
+    :return: Value of the ``http`` argument of ``uvicorn.Config``.
+    """
+    if name not in HTTP_PARSERS:
+        raise RuntimeError(f"Unknown HTTP parser '{name}'")
+    if not available(name):
+        raise RuntimeError(f"HTTP parser '{name}' requires the '{name}' package.")
+
+    return name
@@ -0,0 +1,91 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class ConnectionPool:
+    """
+    Keeps persistent asyncio stream connections to a single TCP endpoint.
+
+    A pool with ``max_size=0`` never keeps a connection, so each request
+    opens and closes its own connection.
+
+    :param host: Hostname.
+    :param port: Port.
+    :param max_size: Maximum number of idle connections.
+    :param idle_timeout: Idle connections older than this (sec) are not reused.
+                         ``None`` means they never expire.
+    """
+
+    def __init__(self, host, port, max_size=1, idle_timeout=None):
+        self._host = host
+        self._port = port
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._idle = deque()
+        """Connections ready for reuse and their release times, the most recently released one is at the end."""
+        self.hits = 0
+        """Number of acquired connections which are reused."""
+        self.misses = 0
+        """Number of acquired connections which are newly opened."""
+        self.evictions = 0
+        """Number of idle connections dropped because they expired or were closed."""
+
+    def _healthy(self, conn, released_at):
+        reader, writer = conn
+        if writer.is_closing() or reader.at_eof():
+            return False
+        """The server closed the connection while idle."""
+        if self._idle_timeout is None:
+            return True
+        return time.monotonic() - released_at < self._idle_timeout
+
+    async def acquire(self):
+        while self._idle:
+            conn, released_at = self._idle.pop()
+            if self._healthy(conn, released_at):
+                self.hits += 1
+                return conn
+            conn[1].close()
+            self.evictions += 1
+
+        self.misses += 1
+        return await asyncio.open_connection(self._host, self._port)
+
+    async def release(self, conn, reuse=True):
+        reader, writer = conn
+        if reuse and len(self._idle) < self._max_size and not writer.is_closing():
+            self._idle.append((conn, time.monotonic()))
+            return
+
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Acquire a connection and give it back to the pool afterwards.
+
+        A connection which raised an exception is never reused.
+        """
+        conn = await self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            await self.release(conn, reuse=False)
+            raise
+        await self.release(conn)
+
+    async def close(self):
+        while self._idle:
+            conn, released_at = self._idle.pop()
+            await self.release(conn, reuse=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,69 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import time
+
+STAGES = (
+    ("queue", "enqueued", "injected"),
+    ("net", "injected", "picked_up"),
+    ("connect", "picked_up", "connected"),
+    ("upstream", "connected", "first_byte"),
+    ("response", "first_byte", "completed"),
+)
+"""Stages of a proxied request as (name, start, end) timestamp names.
+
+* queue: waiting for admission to the net,
+* net: travelling through the places and the controller gate of a branch,
+* connect: acquiring a connection to the HTTP server,
+* upstream: sending the request until the first byte of the response,
+* response: relaying the response body.
+"""
+
+
+class RequestContext:
+    """
+    An ASGI request travelling through the net as the binding of a token.
+
+    The ASGI app awaits :py:attr:`done` which is resolved by the consumer
+    after the response is sent. Unlike a condition variable, the completion is
+    never lost if it happens before the app starts waiting. Its result is
+    ``False`` if the request is rejected before entering the net, then the
+    app sends the response itself.
+
+    :param traced: If ``True``, the request records the timestamps of
+                   :py:data:`STAGES`.
+    """
+
+    __slots__ = ("scope", "receive", "send", "done", "stamps")
+
+    def __init__(self, scope, receive, send, traced=False):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.done = asyncio.get_running_loop().create_future()
+        self.stamps = {"enqueued": time.perf_counter()} if traced else None
+
+    def stamp(self, name):
+        """Records the time of the event ``name`` if the request is traced."""
+        if self.stamps is not None:
+            self.stamps[name] = time.perf_counter()
+
+    def stages(self):
+        """
+        :return: Durations (sec) of the recorded stages keyed by their names.
+        """
+        if self.stamps is None:
+            return {}
+        return {
+            name: self.stamps[end] - self.stamps[start]
+            for name, start, end in STAGES
+            if start in self.stamps and end in self.stamps
+        }
+
+    def complete(self):
+        if not self.done.done():
+            self.done.set_result(True)
+
+    def reject(self):
+        if not self.done.done():
+            self.done.set_result(False)
@@ -0,0 +1,132 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import sys
+import time
+from bisect import bisect_left
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+BLOCK_SIZE = 4096
+"""Number of service times generated at once."""
+KINDS = ("exponential", "normal")
+_created = {}
+"""Blocks created by this process (or inherited by fork), keyed by their names."""
+
+
+def _unit_samples(kind, rng, shape):
+    """
+    :return: Samples of the distribution ``kind`` with unit mean (exponential)
+             or unit variance (normal) which are scaled by the RNG params later.
+    """
+    if kind == "normal":
+        return rng.standard_normal(shape)
+    return rng.standard_exponential(shape)
+
+
+def _attach(name):
+    if name in _created:
+        return _created[name]
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    """Only the process which created the block should unlink it."""
+    return shm
+
+
+class SharedSamples:
+    """
+    Unit service times generated once by the parent process and read by the
+    servers through ``multiprocessing.shared_memory``.
+
+    Each server reads its own row and starts over when it reaches the end.
+
+    :param rows: Number of servers.
+    :param size: Number of samples for each server.
+    :param seed: Seed of the generator, ``None`` for a random seed.
+    """
+
+    def __init__(self, rows, size=BLOCK_SIZE, seed=None):
+        shape = (len(KINDS), rows, size)
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(shape)) * np.dtype(np.float64).itemsize
+        )
+        samples = np.ndarray(shape, dtype=np.float64, buffer=self._shm.buf)
+        rng = np.random.default_rng(seed)
+        for i, kind in enumerate(KINDS):
+            samples[i] = _unit_samples(kind, rng, (rows, size))
+        _created[self._shm.name] = self._shm
+        self.spec = (self._shm.name, shape)
+        """Passed to the servers by ``SHARED_SAMPLES`` argument."""
+
+    def close(self):
+        _created.pop(self._shm.name, None)
+        self._shm.close()
+        self._shm.unlink()
+
+
+class ServiceTimeSampler:
+    """
+    Imitates the processing time of a server.
+
+    The samples are taken from blocks generated in advance, and the load change
+    by time is found by a binary search. So, a new processing time costs O(1)
+    while the simulation is running.
+
+    :param args: Server arguments, ``ID``, ``RNG_PARAMS``, ``RUNTIME`` and
+                 ``LOAD`` are used. If ``SEED`` is given, the same processing
+                 times are generated at each run. If ``SHARED_SAMPLES`` is given,
+                 the samples are read from a :py:class:`SharedSamples` block.
+    :param clock: Time source used to apply the load change by time.
+    :param block_size: Number of samples generated at once.
+    """
+
+    def __init__(self, args, clock=time.time, block_size=BLOCK_SIZE):
+        self._kind = args["RNG_PARAMS"][0]
+        if self._kind not in KINDS:
+            self._kind = KINDS[0]
+        self._params = tuple(args["RNG_PARAMS"][1:])
+        self._runtime = args["RUNTIME"]
+        self._load_at = [l[0] for l in args["LOAD"]]
+        self._load_factor = [l[1] for l in args["LOAD"]]
+        self._factor = 1.0
+        self._clock = clock
+        self.start_time = None
+        """Load change by time is relative to this, set at the first call if ``None``."""
+
+        self._shm = None
+        seed = args.get("SEED")
+        self._rng = np.random.default_rng(None if seed is None else [seed, args["ID"]])
+        if args.get("SHARED_SAMPLES") is None:
+            self._block = _unit_samples(self._kind, self._rng, block_size)
+        else:
+            name, shape = args["SHARED_SAMPLES"]
+            self._shm = _attach(name)
+            samples = np.ndarray(shape, dtype=np.float64, buffer=self._shm.buf)
+            self._block = samples[KINDS.index(self._kind), args["ID"] % shape[1]]
+        self._next = 0
+
+    def load_factor(self):
+        if self.start_time is None:
+            self.start_time = self._clock()
+        delta_time = (self._clock() - self.start_time) / self._runtime
+        i = bisect_left(self._load_at, delta_time)
+        """The first load change with ``l[0] >= delta_time``."""
+        if i < len(self._load_at):
+            self._factor = self._load_factor[i]
+
+        return self._factor
+
+    def __call__(self):
+        if self._next == len(self._block):
+            if self._shm is None:
+                self._block = _unit_samples(self._kind, self._rng, len(self._block))
+            self._next = 0
+        x = self._block[self._next]
+        self._next += 1
+
+        mean = self._params[0] * self.load_factor()
+        if self._kind == "normal":
+            return float(mean + self._params[1] * x)
+        return float(mean * x)
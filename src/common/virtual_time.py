@@ -0,0 +1,217 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import selectors
+
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    """
+    Polls I/O without blocking and lets the event loop decide how far the
+    virtual clock moves when there is nothing to run.
+    """
+
+    def __init__(self, loop):
+        super().__init__()
+        self._loop = loop
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+
+        if self._loop._wake_idle_tasks():
+            return events
+
+        if timeout is None:
+            """Nothing is scheduled, only I/O can wake the loop up."""
+            return super().select(None)
+
+        self._loop._now += timeout
+
+        return events
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose clock only advances when all tasks are waiting for a timer.
+
+    ``asyncio.sleep`` returns immediately in wall-clock time while the loop's
+    :py:meth:`time` moves forward by the requested amount.
+
+    Tasks polling for a state change can park themselves by :py:meth:`idle`
+    instead of spinning on ``asyncio.sleep(0)`` which would stop the clock.
+
+    :param state_probe: Optional function returning a comparable snapshot of
+      the state a parked task is polling, or ``None`` if it is unknown. A task
+      with a known state is woken up only after its snapshot changes, others
+      after any callback is scheduled.
+    """
+
+    def __init__(self, state_probe=None):
+        self._now = 0.0
+        self._state_probe = state_probe
+        self._idle_waiters = []
+        self._task_order = {}
+        self._seen_states = {}
+        self._progress = False
+        self._waking = False
+        super().__init__(selector=_VirtualTimeSelector(self))
+
+    def time(self):
+        return self._now
+
+    def call_soon(self, *args, **kwargs):
+        if not self._waking:
+            self._progress = True
+            """Any scheduled callback is a task or a future making progress."""
+
+        return super().call_soon(*args, **kwargs)
+
+    def _asyncgen_finalizer_hook(self, agen):
+        self._asyncgens.discard(agen)
+        if not self.is_closed():
+            self.call_soon_threadsafe(self._close_asyncgen, agen)
+
+    def _close_asyncgen(self, agen):
+        """
+        Closing an abandoned async generator is not a progress of the tasks.
+        Otherwise, tasks leaving ``async for`` loops early would keep waking
+        up each other forever.
+        """
+        self._waking = True
+        try:
+            self.create_task(agen.aclose())
+        finally:
+            self._waking = False
+
+    def _probe(self, task):
+        if self._state_probe is None:
+            return None
+
+        return self._state_probe(task)
+
+    def idle(self):
+        """
+        :return: A future resolved after other tasks made progress.
+        """
+        task = asyncio.current_task(self)
+        order = self._task_order.setdefault(task, len(self._task_order))
+        state = self._seen_states.pop(task, None)
+        if state is None and self._probe(task) is not None:
+            state = ()
+            """Not seen yet, so it is woken up by the first check."""
+        waiter = self.create_future()
+        self._idle_waiters.append((order, task, state, waiter))
+
+        return waiter
+
+    def _wake_idle_tasks(self):
+        progress, self._progress = self._progress, False
+        waiters = []
+        parked = []
+        for item in self._idle_waiters:
+            order, task, state, waiter = item
+            if waiter.done():
+                continue
+            current = self._probe(task)
+            if progress if state is None else state != current:
+                waiters.append(item)
+                self._seen_states[task] = current
+                """
+                The state is compared to the one before the task runs again,
+                so the changes made by the task itself wake it up too.
+                """
+            else:
+                parked.append(item)
+
+        self._idle_waiters = parked
+        if not waiters:
+            return False
+
+        waiters.sort(key=lambda item: item[0])
+        """Wake tasks up in a fixed order so runs are reproducible."""
+        self._waking = True
+        try:
+            for item in waiters:
+                item[-1].set_result(None)
+        finally:
+            self._waking = False
+
+        return True
+
+
+async def sleep(amount=0.0):
+    """
+    Replacement of ``asyncio.sleep`` for tasks running on
+    :py:class:`VirtualTimeEventLoop`.
+
+    Non-positive delays park the task until other tasks made progress.
+
+    :param amount: Sleep amount in seconds.
+    """
+    if amount > 0:
+        await asyncio.sleep(amount)
+    else:
+        await asyncio.get_running_loop().idle()
+
+
+def marking_probe(reg):
+    """
+    Creates a ``state_probe`` for :py:class:`VirtualTimeEventLoop` which
+    returns the tokens held by a PT and its input and output arcs.
+
+    :param reg: PT registry.
+    :return: State probe function.
+    """
+    pts = {}
+    for _, pt in reg.entries():
+        if any(
+            getattr(pt, name, None) is not None
+            for name in ("_consumer", "_producer", "_processor")
+        ):
+            """Callbacks may depend on a state which is not in the marking."""
+            continue
+        queues = [arc._queue._queue for arc in pt._input_arcs + pt._output_arcs]
+        pts[f"loop{pt.ident()}"] = (pt._tokens, queues)
+
+    def probe(task):
+        pt = pts.get(task.get_name())
+        if pt is None:
+            return None
+
+        tokens, queues = pt
+        """
+        Tokens in the arcs are compared instead of their counts, otherwise a
+        token replaced by another one while the task was running would go
+        unnoticed.
+        """
+        return (
+            tuple(map(len, tokens.values())),
+            tuple(map(tuple, queues)),
+        )
+
+    return probe
+
+
+def run(main, state_probe=None):
+    """
+    Equivalent of ``asyncio.run`` using :py:class:`VirtualTimeEventLoop`.
+
+    :param main: Coroutine to run.
+    :param state_probe: See :py:class:`VirtualTimeEventLoop`.
+    :return: The result of ``main``.
+    """
+    loop = VirtualTimeEventLoop(state_probe=state_probe)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
@@ -0,0 +1,154 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import hashlib
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+WORK_MODELS = ("sleep", "busy", "hash", "numpy")
+"""
+* sleep: the server waits without using the CPU,
+* busy: a pure Python loop which holds the GIL,
+* hash: SHA-256 over the request body, which releases the GIL,
+* numpy: products of a 128x128 matrix, which release the GIL.
+"""
+
+EXECUTORS = ("inline", "thread", "process")
+"""
+* inline: the work runs in the event loop and blocks it,
+* thread: the work runs in a thread pool,
+* process: the work runs in a process pool.
+"""
+
+HASH_BLOCK = 1 << 16
+"""Minimum size of the data hashed at once, smaller bodies are repeated."""
+
+CALIBRATION_TIME = 0.05
+"""Minimum duration (sec) of the calibration of a kernel"""
+
+_matrix = None
+
+
+def _busy(units, body):
+    x = 0
+    for i in range(units):
+        x ^= i
+    return x
+
+
+def _hash(units, body):
+    data = body * max(1, HASH_BLOCK // len(body)) if body else bytes(HASH_BLOCK)
+    h = hashlib.sha256()
+    while units > 0:
+        h.update(data)
+        units -= len(data)
+    return h.digest()
+
+
+def _numpy(units, body):
+    global _matrix
+    if _matrix is None:
+        _matrix = np.random.default_rng(0).random((128, 128)) / 128
+    for _ in range(units):
+        np.matmul(_matrix, _matrix)
+    return None
+
+
+KERNELS = {"busy": _busy, "hash": _hash, "numpy": _numpy}
+"""Kernels taking the amount of work and the request body, keyed by the work models"""
+
+
+def _calibrate(kernel):
+    """
+    :return: Amount of work done by ``kernel`` in a second.
+    """
+    kernel(1, b"")
+    units = 1
+    while True:
+        T = time.perf_counter()
+        kernel(units, b"")
+        elapsed = time.perf_counter() - T
+        if elapsed >= CALIBRATION_TIME:
+            return units / elapsed
+        units *= 2
+
+
+def parse_work(value):
+    """
+    Parses a work model option.
+
+    :param value: ``<model>[,<executor>[,<workers>]]``
+    :return: Model, executor and number of workers, ``None`` if not given.
+    :raises ValueError: If the option is invalid.
+    """
+    parts = value.split(",")
+    model = parts[0]
+    executor = parts[1] if len(parts) > 1 else EXECUTORS[0]
+    workers = int(parts[2]) if len(parts) > 2 and parts[2] else None
+    if model not in WORK_MODELS or executor not in EXECUTORS:
+        raise ValueError(value)
+    if workers is not None and workers < 1:
+        raise ValueError(value)
+
+    return model, executor, workers
+
+
+class WorkModel:
+    """
+    Imitates the processing time of a server by CPU-bound work.
+
+    The amount of work done in a second is calibrated at the beginning, so a
+    processing time is converted to an amount of work. When the CPU is shared
+    by other tasks, the work takes longer than the processing time.
+
+    The process pool is started immediately by fork, i.e. before the event
+    loop and its threads.
+
+    :param model: One of :py:data:`WORK_MODELS` except ``sleep``.
+    :param executor: One of :py:data:`EXECUTORS`.
+    :param workers: Number of threads or processes of the pool. If ``None``,
+                    the default of :py:mod:`concurrent.futures` is used.
+    """
+
+    def __init__(self, model, executor="inline", workers=None):
+        self.model = model
+        self.executor = executor
+        self._kernel = KERNELS[model]
+        self.rate = _calibrate(self._kernel)
+        """Amount of work done in a second"""
+        self._pool = None
+        if executor == "thread":
+            self._pool = ThreadPoolExecutor(workers)
+        elif executor == "process":
+            ctx = multiprocessing.get_context("fork")
+            self._pool = ProcessPoolExecutor(workers, mp_context=ctx)
+            self._pool.submit(self._kernel, 1, b"").result()
+            """All workers of a fork context are started at the first submission."""
+
+    async def __call__(self, duration, body=b""):
+        """
+        Does the work of the processing time ``duration`` (sec).
+
+        :param body: Request body, used by the ``hash`` model.
+        """
+        units = max(0, int(duration * self.rate))
+        if self._pool is None:
+            self._kernel(units, body)
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._pool, self._kernel, units, body)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+def new_work(model, executor="inline", workers=None):
+    """
+    :return: :py:class:`WorkModel` or ``None`` if the server sleeps.
+    """
+    return None if model == "sleep" else WorkModel(model, executor, workers)
@@ -2,24 +2,34 @@
 
 import os
 import sys
-import shutil
 import subprocess
 import random
 import string
 import time
 import math
+import tempfile
 from itertools import product
 
-from .main import main, USAGE
+from .main import main, USAGE, start_fleet, stop_fleet
 from .results import main as show_results
 from ..common.clean import clean
+from ..common.jsonl import results_file
+from ..common.work import parse_work
 from ..pi_controller import results as pi_controller_results
 
 DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.realpath(f"{DIR}/../..")
 MEAN_VALS = [0.01]
-CONT = ["none", "C1", "C2", "C3"]
+CONT = ["none", "C1", "C2", "C3", "JSQ", "LOR", "P2C", "AW"]
 TOTAL_PRODUCED = 1000
 AB_CONCURRENCY = [1] + list(range(8, 192 + 1, 8))
+WINDOWS = [1, 4, 16]
+"""Concurrency windows of the branches (``-W``)"""
+
+
+def _option(argv, name, default):
+    """Value of a simulation option which is also needed by the backend fleet."""
+    return argv[argv.index(name) + 1] if name in argv else default
 
 
 def _results(argv):
@@ -28,39 +38,66 @@ def _results(argv):
     show_results(args + argv[1:])
 
     pi_controller_results.main(
-        ["", "-i", f"{DIR}/results.json", "-o", f"{DIR}/result_0.png"]
+        ["", "-i", results_file(f"{DIR}/results"), "-o", f"{DIR}/result_0.png"]
     )
 
     return 0
 
 
 def _main(argv):
-    ab_path = shutil.which("ab")
-    if ab_path is None:
-        raise RuntimeError(
-            "This simulation requires 'ab' command from apache2-utils package."
-        )
-
     with open(DIR + "/test.txt", "w") as fh:
         i = 1024
         while i > 0:
             fh.write(random.SystemRandom().choice(string.ascii_uppercase))
             i -= 1
 
-    ab_cmd = ["/bin/bash", f"{DIR}/start_ab.sh"]
-    ab_cmd += [f"{TOTAL_PRODUCED}", f"{DIR+'/test.txt'}", "http://localhost:5000/"]
+    loadgen_cmd = [
+        sys.executable,
+        "-m",
+        "src.common.loadgen",
+        "-n",
+        f"{TOTAL_PRODUCED}",
+    ]
+    loadgen_cmd += ["-p", f"{DIR}/test.txt"]
 
     results_fh = open(DIR + "/results.txt", "w")
     results_fh.truncate(0)
 
-    log_file = f"{DIR}/results.json"
-    with open(log_file, "w") as fh:
-        fh.write('{ "trials": [' + os.linesep)
+    log_file = f"{DIR}/results.jsonl"
+    open(log_file, "w").close()
+    """Each trial appends its result to the log file as a single line."""
+
+    branches = int(_option(argv, "-N", 2))
+    fleet_dir = tempfile.TemporaryDirectory()
+    fleet = start_fleet(
+        fleet_dir.name,
+        ports=[8888 + i for i in range(branches)],
+        event_loop=_option(argv, "-E", "asyncio"),
+        http=_option(argv, "-U", "h11"),
+        work=parse_work(_option(argv, "-u", "sleep")),
+    )
+    """The backend servers are reconfigured for each trial instead of restarted."""
+    done_path = f"{fleet_dir.name}/done.sock"
+    """The load generator reports the end of each trial to this socket."""
 
-    for c, j_ac, mean in product(CONT, enumerate(AB_CONCURRENCY), MEAN_VALS):
+    for c, j_ac, mean, w in product(
+        CONT, enumerate(AB_CONCURRENCY), MEAN_VALS, WINDOWS
+    ):
         j, ac = j_ac
-        csv_fn = f"{DIR}/result_{c}_{ac}_{j}.csv"
-        proc = subprocess.Popen(ab_cmd + [str(ac), csv_fn, c], stdout=results_fh)
+        if c == "AW" and w == 1:
+            continue
+            """A window of one request cannot adapt."""
+        suffix = f"{ac}_{j}" if w == 1 else f"{ac}_{j}_W{w}"
+        csv_fn = f"{DIR}/result_{c}_{suffix}.csv"
+        results_fh.write(f"Controller {c}\n")
+        results_fh.flush()
+        proc = subprocess.Popen(
+            loadgen_cmd
+            + ["-c", str(ac), "-e", csv_fn, "-l", f"{DIR}/latency_{c}_{suffix}.txt"]
+            + ["-D", done_path, "http://localhost:5000/"],
+            stdout=results_fh,
+            cwd=ROOT_DIR,
+        )
 
         args = [
             "",
@@ -74,18 +111,24 @@ def _main(argv):
             TOTAL_PRODUCED * 4 * mean,
             "-A",
             str(proc.pid),
+            "-D",
+            done_path,
             "-C",
             ac,
+            "-F",
+            fleet_dir.name,
+            "-W",
+            w,
         ]
         args += argv[1:]
         print("Starting simulation with arguments:")
         print("  ", args)
         main(args)
-        with open(log_file, "a") as fh:
-            fh.write(f",{os.linesep}")
+        proc.wait()
+
+    stop_fleet(fleet_dir.name, fleet)
+    fleet_dir.cleanup()
 
-    with open(log_file, "a") as fh:
-        fh.write("{}]}" + os.linesep)
     i += 1
 
     return 0
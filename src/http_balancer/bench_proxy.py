@@ -0,0 +1,137 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import sys
+import asyncio
+import getopt
+import resource
+import tempfile
+import time
+from multiprocessing import Process, SimpleQueue
+
+from .main import main as balancer_main
+from ..common.jsonl import write_record
+from ..common.loop import use_event_loop
+
+SIZES = [1 << 10, 1 << 16, 1 << 20, 1 << 24, 1 << 26]
+"""Request body sizes from 1 KB to 64 MB."""
+
+
+def USAGE():
+    """
+    Measures the latency and throughput of the HTTP balancer proxy for
+    several request body sizes. The body is echoed back by the HTTP servers,
+    so it passes through the proxy twice.
+
+    **Arguments:**
+
+      -s <sizes>
+        comma separated body sizes in bytes
+
+        Default: 1024,65536,1048576,16777216,67108864
+      -n <count>
+        number of requests sent for each size
+
+        Default: 8
+      -o <filename>
+        output file name to write results. If empty, prints to stdout.
+
+    **Example**
+
+      make bench-proxy args="-n 4"
+    """
+    print(USAGE.__doc__)
+
+
+def _client(size, count, result):
+    """
+    Sends ``count`` requests with a body of ``size`` bytes one after another
+    and puts the average latency (sec) to ``result``.
+    """
+    body = b"X" * size
+    head = b"POST / HTTP/1.0\r\nContent-Length: %d\r\n\r\n" % size
+
+    async def request():
+        reader, writer = await asyncio.open_connection("127.0.0.1", 5000)
+        writer.writelines([head, body])
+        await writer.drain()
+        received = 0
+        while data := await reader.read(1 << 16):
+            received += len(data)
+        writer.close()
+        if received < size:
+            raise RuntimeError(f"Incomplete response {received} < {size}")
+
+    async def main():
+        for i in range(200):
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", 5000)
+                writer.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.05)
+        """Wait until the proxy starts."""
+
+        T = time.time()
+        for i in range(count):
+            await request()
+        result.put((time.time() - T) / count)
+
+    use_event_loop("asyncio")
+    asyncio.run(main())
+
+
+def main(argv):
+    """
+    Main entry point of the benchmark.
+
+    :param argv: Command line arguments
+    :return: Exit status
+    """
+    sizes = SIZES
+    COUNT = 8
+    OUTPUT_FILE = sys.stdout
+
+    opts, args = getopt.getopt(argv[1:], "s:n:o:h")
+
+    for o, a in opts:
+        if o == "-s":
+            sizes = [int(val) for val in a.split(",")]
+        elif o == "-n":
+            COUNT = int(a)
+        elif o == "-o":
+            OUTPUT_FILE = open(a, "a")
+        elif o == "-h":
+            USAGE()
+            return 0
+
+    print(f"{'size (B)':>10}{'latency (ms)':>14}{'MB/s':>10}{'max RSS (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sorted(sizes):
+            result = SimpleQueue()
+            client = Process(target=_client, args=(size, COUNT, result))
+            client.start()
+            args = ["", "-c", "C1", "-r", "exponential,0.0001", "-A", client.pid]
+            args += ["-o", f"{tmp_dir}/trial.jsonl"]
+            balancer_main([str(a) for a in args])
+            client.join()
+
+            latency = result.get()
+            record = {
+                "size": size,
+                "latency": latency,
+                "throughput": size / latency / 1e6,
+                "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3,
+            }
+            """Sizes are run in increasing order, so max RSS belongs to the last one."""
+            print(
+                f"{size:>10}{1e3 * record['latency']:>14.2f}"
+                f"{record['throughput']:>10.1f}{record['max_rss']:>14.1f}"
+            )
+            if OUTPUT_FILE is not sys.stdout:
+                write_record(OUTPUT_FILE, record)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
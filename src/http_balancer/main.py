@@ -1,151 +1,292 @@
 # SPDX-License-Identifier:  CC-BY-SA-4.0
 
+import os
 import sys
 import asyncio
+import multiprocessing
 from multiprocessing import Process, Semaphore
+import socket
 import time
 import getopt
-import json
+import tempfile
 
+import numpy as np
 import soyutnet
 from soyutnet import SoyutNet
-from soyutnet.constants import GENERIC_ID, GENERIC_LABEL
+from soyutnet.constants import GENERIC_LABEL
 
 import uvicorn
-import psutil
 
 from ..common import logged
+from ..common.jsonl import write_record
+from ..common.control import serve_control, send_command
+from ..common.lifecycle import InFlight, stop_server, wait_readable, wait_trial_end
+from ..common.branches import add_branches
+from ..common.histogram import BranchLatencies
+from ..common.sampler import BLOCK_SIZE, ServiceTimeSampler, SharedSamples
+from ..common.loop import use_event_loop, http_parser
+from ..common.pool import ConnectionPool
+from ..common.request import RequestContext
+from ..common.admission import SHED_POLICIES, AdmissionQueue
+from ..common.http_relay import write_request_head, relay_request_body, relay_response
+from ..common.echo import ECHO_MODES, echo
+from ..common.cache import new_cache
+from ..common.work import new_work, parse_work
+from .policies import POLICIES, BranchState, Reading
 
 
 def server_main(args, cond):
-    import random
-    from secrets import token_bytes
+    use_event_loop(args["LOOP"])
 
-    random.seed(token_bytes(16))
-
-    RNG_PARAMS = list(args["RNG_PARAMS"])
+    print(f"Process {args['ID']} started")
 
-    def normal_rng(*args):
-        return random.gauss(*args)
+    rand = None
+    cache = None
+    work = new_work(*args["WORK"])
+    """
+    The work model is built once before the event loop starts, since its
+    process pool is forked.
+    """
 
-    def exponential_rng(*args):
-        return random.expovariate(1.0 / args[0])
+    def configure(params):
+        """
+        Applies the RNG params, load profile and response cache of a trial.
 
-    print(f"Process {args['ID']} started")
+        :param params: Items of ``args`` to be updated.
+        :return: ``False`` if the params ask for another work model, which is
+                 not applied.
+        """
+        nonlocal rand, cache
+        work_params = tuple(params.get("WORK", args["WORK"]))
+        """The params of a control command are JSON, i.e. ``WORK`` is a list."""
+        if work_params != tuple(args["WORK"]):
+            return False
+        args.update(params)
+        rand = ServiceTimeSampler(args)
+        cache = new_cache(*args.get("CACHE", (0, None)))
+        """Each trial starts with an empty cache."""
 
-    _rand = None
-    match RNG_PARAMS[0]:
-        case "normal":
-            _rand = normal_rng
-        case _:
-            _rand = exponential_rng
-
-    start_time = None
-    total_time = args["RUNTIME"]
-    load_vs_time = args["LOAD"]
-
-    def rand():
-        nonlocal start_time
-        nonlocal RNG_PARAMS
-        if start_time is None:
-            start_time = time.time()
-
-        def adjust_load():
-            delta_time = (time.time() - start_time) / total_time
-            for l in load_vs_time:
-                if l[0] >= delta_time:
-                    RNG_PARAMS[1] = l[1] * args["RNG_PARAMS"][1]
-                    break
+        return True
 
-        adjust_load()
-        return _rand(*(RNG_PARAMS[1:]))
+    configure({})
 
     # [[http-server-defs-start]]
 
-    async def read_body(receive):
-        """
-        Read and return the entire body from an incoming ASGI message.
-        """
-        body = b""
-        more_body = True
-
-        while more_body:
-            message = await receive()
-            body += message.get("body", b"")
-            more_body = message.get("more_body", False)
-
-        return body
+    async def echo_app(scope, receive, send):
+        await echo(scope, receive, send, rand(), args.get("ECHO", "buffer"), work)
+        """Imitate a time consuming process by delay."""
 
     async def uvicorn_app(scope, receive, send):
         """
         Echo the request body back in an HTTP response.
         """
-        body = await read_body(receive)
-        delay_amount = rand()
-        await asyncio.sleep(delay_amount)
-        """Imitate a time consuming process by delay."""
-        await send(
-            {
-                "type": "http.response.start",
-                "status": 200,
-                "headers": [
-                    (b"content-type", b"text/plain"),
-                    (b"content-length", str(len(body)).encode()),
-                ],
-            }
-        )
-        await send(
-            {
-                "type": "http.response.body",
-                "body": body,
-            }
-        )
+        if scope["type"] != "http":
+            return
+        nonlocal served
+        with in_flight:
+            if cache is None:
+                await echo_app(scope, receive, send)
+            else:
+                await cache.serve(scope, receive, send, echo_app)
+            served += 1
 
     # [[http-server-defs-end]]
 
     uvicorn_server = None
+    in_flight = InFlight()
+    """Requests being processed"""
+    served = 0
+    """Number of requests served since the beginning of the trial"""
+
+    async def control(command):
+        """
+        Handles the commands of a long-lived backend fleet.
+
+        ``configure`` applies the params of the next trial unless they ask
+        for another work model than the server started with, ``begin`` starts
+        its load profile, ``end`` waits until all requests are replied and
+        reports the stats of the trial and ``stop`` shuts the server down.
+        """
+        nonlocal served
+        reply = {"ok": True}
+        match command["cmd"]:
+            case "configure":
+                reply["ok"] = configure(command["args"])
+            case "begin":
+                rand.start_time = time.time()
+                served = 0
+            case "end":
+                await in_flight.drain(None)
+                reply["served"] = served
+                reply["cache"] = None if cache is None else cache.stats()
+            case "stop":
+                uvicorn_server.should_exit = True
+            case _:
+                reply = {"ok": False}
+
+        return reply
 
     async def canceller():
         nonlocal uvicorn_server
-        if args["AB_PID"] is None:
-            await asyncio.sleep(args["RUNTIME"])
-        else:
-            try:
-                ab_proc = psutil.Process(args["AB_PID"])
-                while ab_proc.is_running() and ab_proc.status() != psutil.STATUS_ZOMBIE:
-                    await asyncio.sleep(1)
-            except psutil.NoSuchProcess:
-                pass
-            await asyncio.sleep(3)
-        if uvicorn_server is not None:
-            await uvicorn_server.shutdown()
+        await wait_trial_end(pid=args["AB_PID"], runtime=args["RUNTIME"])
+        await stop_server(uvicorn_server, in_flight)
+        """The requests proxied by the balancer are replied before the load generator exits."""
         for task in asyncio.all_tasks():
             task.cancel()
 
     async def uvicorn_main():
         nonlocal uvicorn_server
-        asyncio.create_task(canceller())
+        control_server = None
+        if args.get("CONTROL") is None:
+            asyncio.create_task(canceller())
+        else:
+            control_server = await serve_control(args["CONTROL"], control)
+            """Trial boundaries are signalled by the control commands."""
         config = uvicorn.Config(
             uvicorn_app,
             host=args["HOST"],
             port=args["PORT"],
             log_level="critical",
-            http="h11",
+            http=http_parser(args["HTTP"]),
         )
         uvicorn_server = uvicorn.Server(config)
         cond.release()
         """Let parent process know this process started."""
         await uvicorn_server.serve()
+        if control_server is not None:
+            control_server.close()
 
     try:
         asyncio.run(uvicorn_main())
     except asyncio.exceptions.CancelledError:
         pass
 
+    if work is not None:
+        work.close()
     print(f"Process {args['ID']} ends")
     return 0
 
 
+def control_path(directory, index):
+    """
+    :param directory: Control socket directory of the backend fleet.
+    :param index: Server index.
+    :return: Control socket path of the server.
+    """
+    return f"{directory}/server{index}.sock"
+
+
+def start_fleet(
+    directory,
+    host="127.0.0.1",
+    ports=(8888, 8889),
+    event_loop="asyncio",
+    http="h11",
+    work=("sleep", "inline", None),
+):
+    """
+    Starts a backend fleet which serves the trials of a whole sweep.
+
+    The servers wait for the ``configure`` and ``begin`` commands of each trial
+    on their control sockets in ``directory``.
+
+    :param directory: Control socket directory.
+    :param host: Hostname of the HTTP servers.
+    :param ports: Ports of the HTTP servers.
+    :param event_loop: Event loop implementation of the servers.
+    :param http: HTTP parser of the servers.
+    :param work: Work model of the servers, built once at their startup. A
+                 trial with another work model is rejected.
+    :return: Server processes.
+    """
+    procs = []
+    init_conditions = []
+    for i, port in enumerate(ports):
+        args = {
+            "ID": i,
+            "RUNTIME": 1,
+            "HOST": host,
+            "PORT": port,
+            "RNG_PARAMS": ("exponential", 1 / 2),
+            "LOAD": [],
+            "AB_PID": None,
+            "CONTROL": control_path(directory, i),
+            "ECHO": "buffer",
+            "CACHE": (0, None),
+            "WORK": work,
+            "LOOP": event_loop,
+            "HTTP": http,
+        }
+        cond = Semaphore(value=0)
+        proc = Process(target=server_main, args=(args, cond))
+        proc.start()
+        procs.append(proc)
+        init_conditions.append(cond)
+
+    [cond.acquire() for cond in init_conditions]
+    """Make sure TCP and control servers started"""
+
+    return procs
+
+
+def stop_fleet(directory, procs):
+    """
+    Stops a backend fleet started by :py:func:`start_fleet`.
+
+    :param directory: Control socket directory.
+    :param procs: Server processes.
+    """
+    for i in range(len(procs)):
+        send_command(control_path(directory, i), cmd="stop")
+    for proc in procs:
+        proc.join()
+
+
+def end_trial(directory, count):
+    """
+    Waits until the servers of a backend fleet reply all requests of a trial.
+
+    :param directory: Control socket directory.
+    :param count: Number of servers.
+    :return: Response cache stats of the servers, ``None`` if disabled.
+    """
+    return [
+        send_command(control_path(directory, i), cmd="end").get("cache")
+        for i in range(count)
+    ]
+
+
+def add_counts(total, stats, keys):
+    """
+    Adds the counters ``keys`` of ``stats`` to ``total``.
+
+    :param total: Stats merged so far, updated in place.
+    :param stats: Stats of a shard.
+    :param keys: Names of the counters, other items are copied if missing.
+    """
+    for key, value in stats.items():
+        if key in keys and key in total:
+            total[key] += value
+        else:
+            total.setdefault(key, value)
+
+
+def merge_consumer_stats(total, stats):
+    """
+    Merges the consumer stats of a shard, the consumers of all shards are
+    considered as a single consumer of each branch.
+    """
+    for ident, s in stats.items():
+        if ident not in total:
+            total[ident] = dict(s)
+            continue
+        t = total[ident]
+        t["count"] += s["count"]
+        t["errors"] = t.get("errors", 0) + s.get("errors", 0)
+        t["started_at"] = min(t["started_at"], s["started_at"])
+        t["last_at"] = max(t.get("last_at", t["started_at"]), s.get("last_at", 0.0))
+
+
 def USAGE():
     """
     .. _usage_http_balancer:
@@ -156,8 +297,8 @@ def USAGE():
         total simulation time in seconds (:math:`T`)
 
         Default: 10
-      -c <none|C1|C2|C3>
-        :ref:`controller <controllers>` type
+      -c <none|C1|C2|C3|JSQ|LOR|P2C|AW>
+        :ref:`controller <controllers>` type or load balancing policy
 
         Default: C1
       -o <filename>
@@ -178,9 +319,9 @@ def USAGE():
       -H hostname
         Default: 127.0.0.1
       -P ports
-        port1,port2
+        port1,port2,...
 
-        Default: 8888,8889
+        Default: 8888,8889,... (one port for each branch)
       -r <option>
         random number generator params
           e.g. exponential,0.1
@@ -197,10 +338,117 @@ def USAGE():
 
         Default: 1e-2,1e-4
 
-      -A ab command's PID
+      -A load generator's PID
 
       -C number of concurrent requests expected
 
+      -N <count>
+        number of branches (HTTP servers), at least 2
+
+        Default: 2
+
+      -S <seed>
+        seed of the processing times of servers. If provided, the same random
+        values are generated at each run.
+
+      -M
+        if provided, the processing times are generated once by the main process
+        and shared with the HTTP servers through shared memory. Not supported
+        with ``-F``.
+
+      -k <size>[,<idle timeout (sec)>]
+        number of persistent HTTP/1.1 connections kept to each HTTP server.
+        Idle connections are dropped after the timeout. 0 opens a new
+        connection for each request.
+
+        Default: 0,4
+
+      -Q <size>[,<deadline (sec)>[,<newest|oldest>]]
+        admission control of the requests waiting to enter the net. When
+        ``size`` requests are waiting, the newest or the oldest one is answered
+        by 503. Requests waiting longer than the deadline are also answered by
+        503. Size 0 means an unbounded queue.
+
+        Default: 0 (no admission control)
+
+      -E <asyncio|uvloop>
+        event loop implementation
+
+        Default: asyncio
+
+      -U <h11|httptools>
+        HTTP parser of Uvicorn servers
+
+        Default: h11
+
+      -s <n>
+        every n-th request records the time spent at each stage: waiting to
+        enter the net (queue), passing through the net (net), connecting to the
+        HTTP server (connect), waiting for the first byte of the response
+        (upstream) and relaying the response (response). Larger values reduce
+        the overhead at high request rates.
+
+        Default: 1
+
+      -b <buffer|delay|stream>
+        how the HTTP servers echo the request body. ``buffer`` reads the
+        whole body and sends it back after the processing time. ``delay``
+        sends each chunk back as soon as it is read after the processing
+        time and ``stream`` ends the response after the processing time.
+        The streaming modes keep a single chunk of the body in memory.
+
+        Default: buffer
+
+      -z <bytes>
+        byte budget of a response cache in front of each HTTP server. The
+        responses are keyed by the method, path and the digest of the request
+        body and the least recently used ones are evicted. Concurrent identical
+        requests wait for the response of the first one. Zero disables the
+        cache.
+
+        Default: 0
+
+      -t <ttl (sec)>
+        lifetime of a cached response. If not provided, the responses are
+        evicted only when the budget is exceeded.
+
+      -u <sleep|busy|hash|numpy>[,<inline|thread|process>[,<workers>]]
+        work model of the processing time of the HTTP servers. ``sleep``
+        waits without using the CPU. ``busy`` runs a pure Python loop,
+        ``hash`` computes SHA-256 over the request body and ``numpy``
+        multiplies matrices for the processing time, where the amount of work
+        done in a second is calibrated at the beginning. The work runs in the
+        event loop of the server (``inline``), in a thread pool or in a process
+        pool of ``workers`` threads or processes.
+
+        Default: sleep
+
+      -W <size>
+        concurrency window of each branch: number of tokens in the controller
+        place ``k{i}`` and maximum number of requests a branch relays to its
+        HTTP server at the same time. The controller ``AW`` adapts the window
+        of each branch up to this size.
+
+        Default: 1
+
+      -j <count>
+        number of proxy processes (shards). Each shard runs its own copy of
+        the PT net and accepts connections on the same port by SO_REUSEPORT.
+        The policies share the per-branch counters through shared memory.
+
+        Default: 1
+
+      -D <path>
+        control socket where the load generator reports that all requests are
+        replied. If provided, the simulation ends then or when the process
+        given by ``-A`` exits, whichever comes first.
+
+      -F <directory>
+        control socket directory of a long-lived backend fleet. If provided,
+        the HTTP servers are not started. Instead, the running servers are
+        reconfigured for the trial and notified at its beginning and end. The
+        servers keep the work model (``-u``) they were started with.
+
     **Example**
 
       python src/http_balancer/main.py -T 8.5 -r exponential,0.05 -p 100 -c none
@@ -227,14 +475,35 @@ def main(argv, OUTPUT_FILE):
     CONTROLLER_TYPE = "C1"
     GENERATE_GRAPH_AND_EXIT = False
     HOST = "127.0.0.1"
-    PORTS = [8888, 8889]
+    PORTS = None
     PROXY_HOST = "127.0.0.1"
     PROXY_PORT = 5000
     K_PI = []
     AB_PID = None
     CONCURRENT_REQUESTS = None
-
-    opts, args = getopt.getopt(argv[1:], "r:c:T:o:l:p:GH:P:K:X:A:C:L:")
+    FLEET_DIR = None
+    DONE_PATH = None
+    SHARDS = 1
+    WINDOW = 1
+    ECHO_MODE = "buffer"
+    CACHE_SIZE = 0
+    CACHE_TTL = None
+    WORK = ("sleep", "inline", None)
+    TRACE_EVERY = 1
+    SEED = None
+    SHARED_SAMPLES = False
+    EVENT_LOOP = "asyncio"
+    HTTP_PARSER = "h11"
+    POOL_SIZE = 0
+    ADMISSION_SIZE = 0
+    ADMISSION_DEADLINE = None
+    SHED_POLICY = "newest"
+    POOL_IDLE_TIMEOUT = 4.0
+    """Uvicorn closes idle connections after 5 seconds."""
+
+    opts, args = getopt.getopt(
+        argv[1:], "r:c:T:o:l:p:GH:P:K:X:A:C:L:D:F:N:S:ME:U:k:Q:j:s:W:b:z:t:u:"
+    )
 
     for o, a in opts:
         if o == "-r":
@@ -269,9 +538,77 @@ def main(argv, OUTPUT_FILE):
             AB_PID = int(a)
         elif o == "-C":
             CONCURRENT_REQUESTS = int(a)
+        elif o == "-D":
+            DONE_PATH = a
+        elif o == "-s":
+            TRACE_EVERY = int(a)
+            if TRACE_EVERY < 1:
+                raise RuntimeError(f"Option -s is invalid '{a}'")
+        elif o == "-W":
+            WINDOW = int(a)
+            if WINDOW < 1:
+                raise RuntimeError(f"Option -W is invalid '{a}'")
+        elif o == "-b":
+            if a not in ECHO_MODES:
+                raise RuntimeError(f"Option -b is invalid '{a}'")
+            ECHO_MODE = a
+        elif o == "-z":
+            CACHE_SIZE = int(a)
+            if CACHE_SIZE < 0:
+                raise RuntimeError(f"Option -z is invalid '{a}'")
+        elif o == "-t":
+            CACHE_TTL = float(a)
+        elif o == "-u":
+            try:
+                WORK = parse_work(a)
+            except ValueError:
+                raise RuntimeError(f"Option -u is invalid '{a}'")
+        elif o == "-j":
+            SHARDS = int(a)
+            if SHARDS < 1:
+                raise RuntimeError(f"Option -j is invalid '{a}'")
+        elif o == "-F":
+            FLEET_DIR = a
+        elif o == "-S":
+            SEED = int(a)
+        elif o == "-M":
+            SHARED_SAMPLES = True
+        elif o == "-k":
+            tmp = a.split(",")
+            POOL_SIZE = int(tmp[0])
+            if len(tmp) > 1:
+                POOL_IDLE_TIMEOUT = float(tmp[1])
+        elif o == "-Q":
+            tmp = a.split(",")
+            ADMISSION_SIZE = int(tmp[0])
+            if len(tmp) > 1:
+                ADMISSION_DEADLINE = float(tmp[1])
+            if len(tmp) > 2:
+                if tmp[2] not in SHED_POLICIES:
+                    raise RuntimeError(f"Option -Q is invalid '{a}'")
+                SHED_POLICY = tmp[2]
+        elif o == "-E":
+            EVENT_LOOP = a
+        elif o == "-U":
+            HTTP_PARSER = a
+        elif o == "-N":
+            PROC_COUNT = int(a)
+            if PROC_COUNT < 2:
+                raise RuntimeError(f"Option -N is invalid '{a}'")
+
+    if PORTS is None:
+        PORTS = [8888 + i for i in range(PROC_COUNT)]
+    elif len(PORTS) != PROC_COUNT:
+        raise RuntimeError(f"Option -P requires {PROC_COUNT} ports")
+
+    if SHARED_SAMPLES and FLEET_DIR is not None:
+        raise RuntimeError("Option -M is not supported with -F")
+        """The servers of a fleet outlive the shared memory of a trial."""
 
     if CONTROLLER_TYPE == "none":
         CONTROLLER_ENABLED = False
+    elif CONTROLLER_TYPE not in POLICIES:
+        raise RuntimeError(f"Option -c is invalid '{CONTROLLER_TYPE}'")
 
     SERVER_RUNTIME = STOP_AFTER + 1
     """Server should run longer than clients."""
@@ -283,10 +620,23 @@ def main(argv, OUTPUT_FILE):
     # [[token-gen-defs-start]]
 
     treg = net.TokenRegistry()
-    req_queue = asyncio.Queue()
 
-    def new_http_request_token(scope, receive, send, cond):
-        token = net.Token(label=L, binding=(scope, receive, send, cond))
+    def shed(token):
+        treg.pop_entry(*token)
+        traced.pop(token[1], None)
+
+    req_queue = AdmissionQueue(ADMISSION_SIZE, ADMISSION_DEADLINE, SHED_POLICY, shed)
+    """Shed tokens never enter the net, so they are removed from the registry."""
+    produced_at = {}
+    """Injection times of the tokens travelling through the net."""
+    traced = {}
+    """Requests recording the timestamps of their stages, keyed by token IDs."""
+    request_count = 0
+    in_flight = InFlight()
+    """Requests not replied yet"""
+
+    def new_http_request_token(request):
+        token = net.Token(label=L, binding=request)
         treg.register(token)
 
         return (token._label, token._id)
@@ -294,16 +644,35 @@ def main(argv, OUTPUT_FILE):
     async def uvicorn_app(scope, receive, send):
         if scope["type"] != "http":
             return
-        cond = asyncio.Condition()
-        token = new_http_request_token(scope, receive, send, cond)
-        await req_queue.put(token)
-        async with cond:
-            await cond.wait()
-        """Wait until endpoint fullfills HTTP request"""
+        nonlocal request_count
+        with in_flight:
+            request_count += 1
+            request = RequestContext(
+                scope, receive, send, traced=request_count % TRACE_EVERY == 0
+            )
+            """Only every TRACE_EVERY-th request is traced to keep overhead low."""
+            token = new_http_request_token(request)
+            if request.stamps is not None:
+                traced[token[1]] = request
+            req_queue.put(token, request)
+            replied = await request.done
+            """Wait until endpoint fullfills HTTP request"""
+            if not replied:
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 503,
+                        "headers": [(b"content-length", b"0")],
+                    }
+                )
+                await send({"type": "http.response.body", "body": b""})
+                """The request is shed by the admission control."""
 
     # [[token-gen-defs-end]]
 
     uvicorn_server = None
+    listen_socket = None
+    """Socket bound by SO_REUSEPORT in sharded mode"""
 
     async def uvicorn_main():
         nonlocal uvicorn_server
@@ -312,15 +681,18 @@ def main(argv, OUTPUT_FILE):
             host=PROXY_HOST,
             port=PROXY_PORT,
             log_level="critical",
-            http="h11",
+            http=http_parser(HTTP_PARSER),
         )
         uvicorn_server = uvicorn.Server(config)
-        await uvicorn_server.serve()
+        await uvicorn_server.serve(None if listen_socket is None else [listen_socket])
 
     # [[producer-defs-start]]
 
     async def producer(place):
         token = await req_queue.get()
+        produced_at[token[1]] = time.time()
+        if token[1] in traced:
+            traced[token[1]].stamp("injected")
         return [token]
 
     """Inject token"""
@@ -329,64 +701,75 @@ def main(argv, OUTPUT_FILE):
 
     sensors = [asyncio.Queue() for i in range(PROC_COUNT)]
     consumer_stats = {}
-
-    async def consumer(place):
-        async def http_proxy(uvicorn_scope, uvicorn_receive, uvicorn_send):
-            http_data = uvicorn_scope.get("method", "").encode("ascii") + b" "
-            http_data += uvicorn_scope.get("raw_path", b"/") + b"?"
-            http_data += uvicorn_scope.get("query_string", b"") + b" "
-            http_data += (
-                b"HTTP/"
-                + uvicorn_scope.get("http_version", "1.0").encode("ascii")
-                + b"\r\n"
-            )
-            for h in uvicorn_scope.get("headers", []):
-                http_data += b": ".join(h) + b"\r\n"
-            http_data += b"\r\n"
-
-            reader, writer = await asyncio.open_connection(HOST, PORTS[index])
-            writer.write(http_data)
-            await writer.drain()
+    latencies = BranchLatencies(PROC_COUNT)
+    """Latency histograms exported with the results."""
+
+    slots = [asyncio.Semaphore(WINDOW) for i in range(PROC_COUNT)]
+    """Requests each branch can process at the same time"""
+    proxying = set()
+    """Tasks relaying the requests, referenced until they complete"""
+
+    async def http_proxy(index, request):
+        async with pools[index].connection() as (reader, writer):
+            request.stamp("connected")
+            version = "1.1" if POOL_SIZE > 0 else None
+            """HTTP/1.1 keeps the connection to the actual HTTP server alive."""
+            chunked = write_request_head(writer, request.scope, version)
             """Redirect header to the actual HTTP server"""
-
-            more_body = True
-            while more_body:
-                message = await uvicorn_receive()
-                body = message.get("body", b"")
-                writer.write(body)
-                await writer.drain()
-                more_body = message.get("more_body", False)
-            """Redirect body to the actual HTTP server"""
-
-            header = await reader.readuntil(b"\r\n" * 2)
-            to_find = b"\r\ncontent-length: "
-            str_start = header.rfind(to_find) + len(to_find)
-            header = header[str_start:]
-            str_end = header.find(b"\r\n")
-            content_length = int(header[:str_end])
-            data = await reader.read(content_length)
-            """Read response from the actual HTTP server."""
-            writer.close()
-            await writer.wait_closed()
-            """Close connection to the actual HTTP server"""
-            await uvicorn_send(
-                {
-                    "type": "http.response.start",
-                    "status": 200,
-                    "headers": [
-                        (b"content-type", b"text/plain"),
-                        (b"content-length", str(len(data)).encode()),
-                    ],
-                }
+            body = asyncio.create_task(
+                relay_request_body(request.receive, writer, chunked)
             )
-            await uvicorn_send(
-                {
-                    "type": "http.response.body",
-                    "body": data,
-                }
+            """Redirect body to the actual HTTP server while the response is
+            relayed, since the server may reply before reading the whole body."""
+            try:
+                _, keep_alive = await relay_response(
+                    reader, request.send, lambda: request.stamp("first_byte")
+                )
+                """Stream response from the actual HTTP server to the requester."""
+            except BaseException:
+                body.cancel()
+                await asyncio.gather(body, return_exceptions=True)
+                """The exception of the body relay is retrieved."""
+                raise
+            await body
+            if not keep_alive:
+                writer.close()
+                """The pool does not reuse a closed connection."""
+
+    async def proxy(index, ident, token_id, request):
+        T = time.time()
+        replied = False
+        try:
+            await http_proxy(index, request)
+            """Fulfill the request."""
+            replied = True
+        except Exception:
+            consumer_stats[ident]["errors"] += 1
+            """The request is counted as failed, the requester gets an error from Uvicorn."""
+        finally:
+            request.complete()
+            """Inform uvicorn_app that request is replied"""
+            policy.finish(index)
+            slots[index].release()
+            started_at = produced_at.pop(token_id, None)
+            is_traced = traced.pop(token_id, None) is not None
+            sensors[index].put_nowait(
+                Reading(True, time.time() - T, len(req_queue), failed=not replied)
             )
-            """Redirect response to the requester"""
+            """Inform the controller, a failed request frees its place in the window too."""
+        if not replied:
+            return
+        latencies.record("end_to_end", index, time.time() - started_at)
+        """Time passed from p0 to the consumer."""
+        if is_traced:
+            request.stamp("completed")
+            for stage, duration in request.stages().items():
+                latencies.record(f"stage_{stage}", index, duration)
 
+        consumer_stats[ident]["count"] += 1
+        consumer_stats[ident]["last_at"] = time.time()
+
+    async def consumer(place):
         # [[actual-token-defs-start]]
 
         t0 = time.time()
@@ -398,29 +781,36 @@ def main(argv, OUTPUT_FILE):
         t0 = time.time()
         ident = place.ident()
         index = int(place._name[1:]) - 1
-        """Get branch index (0 or 1)"""
+        """Get branch index"""
         sensor = sensors[index]
         if ident not in consumer_stats:
             """Initialize stats at first call of the producer."""
-            consumer_stats[ident] = {"started_at": time.time(), "count": 0}
+            consumer_stats[ident] = {"started_at": time.time(), "count": 0, "errors": 0}
             """Store initial time and number of requests processed to calculate requests per second."""
-            sensor.put_nowait((True, dt()))
-            """Initial push to the controllers, otherwise they will stuck at waiting the sensor."""
+            for i in range(WINDOW):
+                sensor.put_nowait(Reading(True, 0.0, len(req_queue)))
+            """Initial push to the controllers for each token of k{i}, otherwise they will stuck at waiting the sensor."""
 
+        await slots[index].acquire()
+        """Wait until the branch has fewer than WINDOW requests in process."""
         label = L
         token = place.get_token(label)
         T = time.time()
         if not token:
+            slots[index].release()
             consumer_stats[ident]["last_at"] = time.time()
-            sensor.put_nowait((False, dt()))
+            sensor.put_nowait(Reading(False, dt(), len(req_queue)))
             """If there is no new token in the buffer, inform the controller."""
             return
 
         actual_token = treg.pop_entry(*token)
         """Get actual SoyutNet.Token object from SoyutNet.TokenRegistry"""
         if actual_token is None:
+            slots[index].release()
+            produced_at.pop(token[1], None)
+            traced.pop(token[1], None)
             consumer_stats[ident]["last_at"] = time.time()
-            sensor.put_nowait((False, dt()))
+            sensor.put_nowait(Reading(False, dt(), len(req_queue)))
             """If there is no actual token in the register, inform the controller."""
             return
 
@@ -428,158 +818,78 @@ def main(argv, OUTPUT_FILE):
 
         # [[token-processing-defs-start]]
 
-        uvicorn_scope, uvicorn_receive, uvicorn_send, cond = actual_token.get_binding()
+        request = actual_token.get_binding()
         """Get object binded to the actual token"""
-        await http_proxy(uvicorn_scope, uvicorn_receive, uvicorn_send)
-        """Fulfill the request."""
-        async with cond:
-            cond.notify_all()
-        """Inform uvicorn_app that request is replied"""
+        request.stamp("picked_up")
+        policy.start(index)
+        task = asyncio.create_task(proxy(index, ident, token[1], request))
+        proxying.add(task)
+        task.add_done_callback(proxying.discard)
+        """The consumer takes the next token while the request is relayed."""
 
         # [[token-processing-defs-end]]
 
-        sensor.put_nowait((True, dt()))
-        """Inform the controller."""
-        consumer_stats[ident]["count"] += 1
-        consumer_stats[ident]["last_at"] = time.time()
-
     # [[controller-defs-start]]
 
-    ci = [0.0, 0.0]
-    """Integrator states"""
-    Kp = 1e-2 if not K_PI else K_PI[0]
-    """Propotional gain"""
-    Ki = 1e-4 if not K_PI else K_PI[1]
-    """Integrator gain"""
-    Zi = 1e-2
-    """Integrator damping"""
-    count = [0, 0]
-    """Total number of times the transitions t13 and t23 fire."""
-    total_delay = [0.0, 0.0]
-    """Total amount of time spent by consumers for completing HTTP requests."""
+    async def controlled_sleep(index, amount):
+        T = time.time()
+        await net.sleep(amount)
+        overshoot = time.time() - T - max(amount, 0.0)
+        latencies.record("sleep_overshoot", index, max(overshoot, 0.0))
+
+    branch_state = BranchState(PROC_COUNT, SHARDS)
+    policy = POLICIES.get(CONTROLLER_TYPE, POLICIES["C1"])(
+        PROC_COUNT,
+        controlled_sleep,
+        K_PI,
+        np.random.default_rng(SEED),
+        branch_state,
+        WINDOW,
+    )
+    """Consumers report the requests to the policy even if the controller is 'none'."""
+
+    permits = [0] * PROC_COUNT
+    """Requests allowed by the policy but not passed to t{i}1 yet"""
 
     async def controller(place):
-        nonlocal ci
         if not CONTROLLER_ENABLED:
             """This happens when controller is chosen 'none'"""
             return True
         index = int(place._name[1:]) - 1
         """Get branch index."""
-        sensor = sensors[index]
-        value: tuple[bool, float] = await sensor.get()
-        """Receive a notification from the consumer."""
-        if CONTROLLER_TYPE == "C2":
-            """This happens when controller is chosen 'C2'"""
-            count[index] += 1
-            err = count[index] - count[1 - index]
-            """Calculate the difference between branches"""
-            sleep_amount = Kp * err + ci[index]
-            ci[index] = (1.0 - Zi) * ci[index] + Ki * err
-            """PI controller"""
-            if abs(sleep_amount) > 1e4:
-                """This should never happen."""
-                print("!!!", sleep_amount, "!!!")
-                ci[index] = 0.0
-            await net.sleep(sleep_amount)
-            """Give a push to the other branch when it is slower."""
-            return True
-        elif CONTROLLER_TYPE == "C3":
-            """This happens when controller is chosen 'C3'"""
-            count[index] += 1
-            total_delay[index] += value[1]
-
-            # [[err-defs-start]]
-
-            err = total_delay[index] - total_delay[1 - index]
-            """Calculate the difference between branches"""
-            err += 0.0 - total_delay[index]
-            """Try to minimize the total time consumed."""
-
-            # [[err-defs-end]]
-
-            sleep_amount = 1e2 * Kp * err + ci[index]
-            ci[index] = (1.0 - Zi) * ci[index] + 1e2 * Ki * err
-            """PI controller"""
-            if abs(sleep_amount) > 1e4:
-                """This should never happen."""
-                print("!!!", sleep_amount, "!!!")
-                ci[index] = 0.0
-            await net.sleep(sleep_amount)
-            """Give a push to the other branch when it is slower."""
-            return True
-
-        return value[0]  # This is the case when controller is 'C1'.
+        gate = place._output_arcs[0]
+        """The arc to t{i}1 holds one token until a request arrives at p1."""
+        if permits[index] == 0 or gate.is_enabled():
+            sensor = sensors[index]
+            T = time.time()
+            reading: Reading = await sensor.get()
+            """Receive a notification from the consumer and the number of waiting requests."""
+            latencies.record("sensor_wait", index, time.time() - T)
+            if await policy(index, reading):
+                permits[index] = min(
+                    permits[index] + 1, place.get_token_count(GENERIC_LABEL)
+                )
+                """The permits are kept while the arc is busy, one for each token of k{i}."""
+        if permits[index] == 0 or gate.is_enabled():
+            return False
+        permits[index] -= 1
+
+        return True
 
     # [[controller-defs-end]]
 
     p0 = net.SpecialPlace("p0", producer=producer)
     t0 = net.Transition("t0")
     p1 = net.Place("p1")
-    p11 = net.Place("p11")
-    o12 = net.Observer(verbose=True)
-    p12 = net.Place("p12", observer=o12)
-    t11 = net.Transition("t11")
-    t12 = net.Transition("t12")
-    t13 = net.Transition("t13")
-    e1 = net.SpecialPlace("e1", consumer=consumer)
-
-    k1 = net.Place(
-        "k1", initial_tokens={GENERIC_LABEL: [GENERIC_ID] * 1}, processor=controller
-    )
-    """Add initial tokens, otherwise PT nets will stuck at its initial state."""
-
-    p21 = net.Place("p21")
-    o22 = net.Observer(verbose=True)
-    p22 = net.Place("p22", observer=o22)
-    t21 = net.Transition("t21")
-    t22 = net.Transition("t22")
-    t23 = net.Transition("t23")
-    e2 = net.SpecialPlace("e2", consumer=consumer)
-
-    k2 = net.Place(
-        "k2", initial_tokens={GENERIC_LABEL: [GENERIC_ID] * 1}, processor=controller
-    )
 
     reg = net.PTRegistry()
     reg.register(p0)
     reg.register(t0)
     reg.register(p1)
-    reg.register(p11)
-    reg.register(p12)
-    reg.register(t11)
-    reg.register(t12)
-    reg.register(t13)
-
-    reg.register(e1)
-    reg.register(k1)
-    reg.register(p21)
-    reg.register(p22)
-    reg.register(t21)
-    reg.register(t22)
-    reg.register(t23)
-    reg.register(e2)
-    reg.register(k2)
-
-    (
-        p0.connect(t0, labels=[L])
-        .connect(p1, labels=[L])
-        .connect(t11, labels=[L])
-        .connect(p11, weight=2, labels=[GENERIC_LABEL, L])
-        .connect(t12, weight=2, labels=[GENERIC_LABEL, L])
-        .connect(p12, labels=[L])
-        .connect(t13, labels=[L])
-        .connect(e1, labels=[L]),
-        t12.connect(k1).connect(t11),
-    )
-    (
-        p1.connect(t21, labels=[L])
-        .connect(p21, weight=2, labels=[GENERIC_LABEL, L])
-        .connect(t22, weight=2, labels=[GENERIC_LABEL, L])
-        .connect(p22, labels=[L])
-        .connect(t23, labels=[L])
-        .connect(e2, labels=[L]),
-        t22.connect(k2).connect(t21),
-    )
+
+    p0.connect(t0, labels=[L]).connect(p1, labels=[L])
+    add_branches(net, reg, p1, PROC_COUNT, L, consumer, controller, WINDOW)
+    """Branch i consists of p{i}1, p{i}2, t{i}1, t{i}2, t{i}3, e{i} and k{i}."""
 
     if GENERATE_GRAPH_AND_EXIT:
         OUTPUT_FILE.truncate(0)
@@ -587,13 +897,22 @@ def main(argv, OUTPUT_FILE):
 
         return 0
 
-    loads = [[], []]
+    loads = [[] for i in range(PROC_COUNT)]
     for l in LOAD:
         loads[0].append((l[0], l[1]))
     """Assign a larger load to consumer 1"""
 
-    procs = set()
-    init_conditions = set()
+    shared_samples = None
+    if SHARED_SAMPLES:
+        shared_samples = SharedSamples(PROC_COUNT, size=16 * BLOCK_SIZE, seed=SEED)
+
+    control_dir = None
+    if (DONE_PATH is not None or CACHE_SIZE > 0) and FLEET_DIR is None:
+        control_dir = tempfile.TemporaryDirectory()
+        """The servers are stopped through their control sockets at the end."""
+
+    procs = []
+    init_conditions = []
     for i in range(PROC_COUNT):
         args = {
             "ID": i,
@@ -603,7 +922,36 @@ def main(argv, OUTPUT_FILE):
             "RNG_PARAMS": RNG_PARAMS,
             "LOAD": loads[i],
             "AB_PID": AB_PID,
+            "SEED": SEED,
+            "LOOP": EVENT_LOOP,
+            "HTTP": HTTP_PARSER,
+            "ECHO": ECHO_MODE,
+            "CACHE": (CACHE_SIZE, CACHE_TTL),
+            "WORK": WORK,
+            "SHARED_SAMPLES": None if shared_samples is None else shared_samples.spec,
+            "CONTROL": (
+                None if control_dir is None else control_path(control_dir.name, i)
+            ),
         }
+        if FLEET_DIR is not None:
+            """Reconfigure the running server instead of starting a new one."""
+            path = control_path(FLEET_DIR, i)
+            params = {
+                key: args[key]
+                for key in (
+                    "RUNTIME",
+                    "RNG_PARAMS",
+                    "LOAD",
+                    "SEED",
+                    "ECHO",
+                    "CACHE",
+                    "WORK",
+                )
+            }
+            if not send_command(path, cmd="configure", args=params)["ok"]:
+                raise RuntimeError("Option -u differs from the backend fleet")
+            send_command(path, cmd="begin")
+            continue
         cond = Semaphore(value=0)
         proc = Process(
             target=server_main,
@@ -613,41 +961,137 @@ def main(argv, OUTPUT_FILE):
             ),
         )
         proc.start()
-        procs.add(proc)
-        init_conditions.add(cond)
+        procs.append(proc)
+        init_conditions.append(cond)
     """Started TCP servers"""
 
     [cond.acquire() for cond in init_conditions]
     """Make sure TCP servers started"""
 
+    pools = [
+        ConnectionPool(HOST, port, max_size=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT)
+        for port in PORTS
+    ]
+    """A pool of size zero opens a new connection for each request."""
+
+    end_fd = None
+    """Read end of a pipe closed by the parent process at the end in sharded mode"""
+
     async def canceller():
         nonlocal uvicorn_server
-        if AB_PID is None:
-            await asyncio.sleep(STOP_AFTER)
+        if end_fd is None:
+            await wait_trial_end(DONE_PATH, AB_PID, STOP_AFTER)
         else:
-            try:
-                ab_proc = psutil.Process(AB_PID)
-                while ab_proc.is_running() and ab_proc.status() != psutil.STATUS_ZOMBIE:
-                    await asyncio.sleep(1)
-            except psutil.NoSuchProcess:
-                pass
-            await asyncio.sleep(1)
-        if uvicorn_server is not None:
-            await uvicorn_server.shutdown()
+            await wait_readable(end_fd)
+        drain = DONE_PATH is not None or AB_PID is not None
+        await stop_server(uvicorn_server, in_flight if drain else None)
+        """Let the tokens in the net reach the consumers if the load generator ended."""
+        for pool in pools:
+            await pool.close()
         soyutnet.terminate()
 
-    """Automatically terminate after an amount of time"""
+    """Automatically terminate after the load generator ends or an amount of time"""
+
+    def shard_main(shard, pipe, results):
+        """
+        Runs a copy of the net and the proxy in a forked process.
+
+        :param shard: Shard index.
+        :param pipe: Read and write ends of the pipe which ends the trial.
+        :param results: Queue to send the stats of the shard.
+        """
+        nonlocal listen_socket, end_fd
+        end_fd = pipe[0]
+        os.close(pipe[1])
+        """Only the parent process keeps the write end open."""
+        branch_state.shard = shard
+        policy.rng = np.random.default_rng(None if SEED is None else [SEED, shard])
+        listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listen_socket.bind((PROXY_HOST, PROXY_PORT))
+        """The kernel distributes the new connections among the shards."""
+
+        use_event_loop(EVENT_LOOP)
+        soyutnet.run(reg, extra_routines=[canceller(), uvicorn_main()])
+        results.put(
+            (
+                consumer_stats,
+                latencies,
+                req_queue.stats(),
+                [pool.stats() for pool in pools],
+            )
+        )
+
+    def run_shards():
+        """
+        Starts the shards and merges their stats.
+
+        :return: Admission and connection pool stats of all shards.
+        """
+        admission_stats = req_queue.stats()
+        pool_stats = [pool.stats() for pool in pools]
+        """Counters of the parent process are zero."""
+        ctx = multiprocessing.get_context("fork")
+        """The shards inherit the net, the servers and the shared memory by fork."""
+        pipe = os.pipe()
+        results = ctx.SimpleQueue()
+        shards = [
+            ctx.Process(target=shard_main, args=(i, pipe, results))
+            for i in range(SHARDS)
+        ]
+        for shard in shards:
+            shard.start()
+        os.close(pipe[0])
+        asyncio.run(wait_trial_end(DONE_PATH, AB_PID, STOP_AFTER))
+        os.close(pipe[1])
+        """The shards end the trial when the pipe is closed."""
+
+        for shard in shards:
+            stats, shard_latencies, admission, pools_ = results.get()
+            merge_consumer_stats(consumer_stats, stats)
+            latencies.merge(shard_latencies)
+            add_counts(
+                admission_stats, admission, ("admitted", "shed_full", "shed_expired")
+            )
+            for total, s in zip(pool_stats, pools_):
+                add_counts(total, s, ("hits", "misses", "evictions"))
+        for shard in shards:
+            shard.join()
+
+        return admission_stats, pool_stats
 
     # [[loop-start-defs-start]]
 
-    soyutnet.run(reg, extra_routines=[canceller(), uvicorn_main()])
-    """Start simulation"""
+    if SHARDS == 1:
+        use_event_loop(EVENT_LOOP)
+        soyutnet.run(reg, extra_routines=[canceller(), uvicorn_main()])
+        """Start simulation"""
+        admission_stats = req_queue.stats()
+        pool_stats = [pool.stats() for pool in pools]
+    else:
+        admission_stats, pool_stats = run_shards()
+        """Start simulation in each shard"""
 
     # [[loop-start-defs-end]]
 
+    cache_stats = [None] * PROC_COUNT
+    if control_dir is not None:
+        cache_stats = end_trial(control_dir.name, PROC_COUNT)
+        stop_fleet(control_dir.name, procs)
+        control_dir.cleanup()
     for proc in procs:
         proc.join()
 
+    if shared_samples is not None:
+        shared_samples.close()
+
+    if FLEET_DIR is not None:
+        cache_stats = end_trial(FLEET_DIR, PROC_COUNT)
+        """Wait until the servers reply all requests of this trial."""
+
+    branch_state.close()
+
     for name in consumer_stats:
         stats = consumer_stats[name]
         count = stats["count"]
@@ -657,19 +1101,35 @@ def main(argv, OUTPUT_FILE):
             )
         else:
             stats["req_per_sec"] = 0
-    print(
-        json.dumps(
-            {
-                "params": {
-                    "rng": RNG_PARAMS,
-                    "control": CONTROLLER_ENABLED,
-                    "controller_type": CONTROLLER_TYPE,
-                    "produce_rate": CONCURRENT_REQUESTS,
-                },
-                "stats": consumer_stats,
-            }
-        ),
-        file=OUTPUT_FILE,
+    write_record(
+        OUTPUT_FILE,
+        {
+            "params": {
+                "rng": RNG_PARAMS,
+                "control": CONTROLLER_ENABLED,
+                "controller_type": CONTROLLER_TYPE,
+                "produce_rate": CONCURRENT_REQUESTS,
+                "branches": PROC_COUNT,
+                "seed": SEED,
+                "event_loop": EVENT_LOOP,
+                "http_parser": HTTP_PARSER,
+                "pool_size": POOL_SIZE,
+                "shards": SHARDS,
+                "window": WINDOW,
+                "trace_every": TRACE_EVERY,
+                "echo": ECHO_MODE,
+                "cache_size": CACHE_SIZE,
+                "cache_ttl": CACHE_TTL,
+                "work": WORK[0],
+                "executor": WORK[1],
+                "work_workers": WORK[2],
+            },
+            "stats": consumer_stats,
+            "admission": admission_stats,
+            "pools": {f"e{i + 1}": stats for i, stats in enumerate(pool_stats)},
+            "latency": latencies.summary(),
+            "caches": {f"e{i + 1}": stats for i, stats in enumerate(cache_stats)},
+        },
     )
     """Dump results"""
 
@@ -0,0 +1,314 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ..common.branches import others_mean
+
+
+class Reading(NamedTuple):
+    """
+    Notification sent by the consumer of a branch to its controller.
+    """
+
+    consumed: bool
+    """``True`` if a request is replied or the consumer has just started."""
+    delay: float
+    """Time spent by the consumer (sec), i.e. the reply time of a request."""
+    waiting: int
+    """Number of requests waiting to enter the net."""
+    failed: bool = False
+    """``True`` if the request ended with an error, so ``delay`` is not a reply time."""
+
+
+class BranchState:
+    """
+    Per-branch counters of a policy.
+
+    When the proxy is sharded, the counters are kept in a
+    ``multiprocessing.shared_memory`` block which the shards inherit by fork.
+    Each shard adds to its own row, so no lock is required, and the policies
+    read the sums over all shards. Hence, the balancing decisions consider the
+    requests of all shards.
+
+    :param branch_count: Number of branches.
+    :param shards: Number of proxy processes.
+    """
+
+    FIELDS = ("dispatched", "started", "completed", "count", "total_delay")
+    _ROWS = {name: i for i, name in enumerate(FIELDS)}
+
+    def __init__(self, branch_count, shards=1):
+        shape = (len(self.FIELDS), shards, branch_count)
+        self._shm = None
+        if shards > 1:
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=int(np.prod(shape)) * np.dtype(np.float64).itemsize
+            )
+            self._values = np.ndarray(shape, dtype=np.float64, buffer=self._shm.buf)
+            self._values[:] = 0.0
+        else:
+            self._values = np.zeros(shape)
+        self.branch_count = branch_count
+        self.shard = 0
+        """Row written by this process"""
+
+    def add(self, field, index, value=1):
+        self._values[self._ROWS[field], self.shard, index] += value
+
+    def total(self, field):
+        """
+        :return: Sum of ``field`` over all shards for each branch.
+        """
+        return self._values[self._ROWS[field]].sum(axis=0)
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+
+
+class Policy(ABC):
+    """
+    Base class of load balancing policies.
+
+    The controller place ``k{i}`` calls the policy with each reading of its
+    sensor. When the policy returns ``True``, ``k{i}`` lets the transition
+    ``t{i}1`` fire once, so branch ``i`` can take one more request from ``p1``.
+    Otherwise, the branch waits for the next reading.
+
+    The consumers report the requests they start and finish, so the policies
+    know the number of requests dispatched to each branch.
+
+    :param branch_count: Number of branches.
+    :param sleep: Coroutine function delaying a branch, called by
+                  ``sleep(index, amount)``.
+    :param gains: Proportional and integral gains of PI controllers.
+    :param rng: NumPy random generator.
+    :param state: :py:class:`BranchState` shared by the shards of the proxy.
+    :param window: Number of tokens in each ``k{i}``.
+    """
+
+    def __init__(self, branch_count, sleep, gains=(), rng=None, state=None, window=1):
+        self._sleep = sleep
+        self.Kp = 1e-2 if not gains else gains[0]
+        """Propotional gain"""
+        self.Ki = 1e-4 if not gains else gains[1]
+        """Integrator gain"""
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.state = BranchState(branch_count) if state is None else state
+        """Number of times ``t{i}1`` is allowed to fire (dispatched) and number
+        of requests taken (started) and replied (completed) by the consumers."""
+        self.max_window = window
+        """Maximum number of requests a branch processes at the same time"""
+
+    def start(self, index):
+        """Called by the consumer of branch ``index`` before sending a request."""
+        self.state.add("started", index)
+
+    def finish(self, index):
+        """Called by the consumer of branch ``index`` after a request is replied."""
+        self.state.add("completed", index)
+
+    def queued(self):
+        """
+        :return: Number of requests waiting at each branch.
+        """
+        return self.state.total("dispatched") - self.state.total("started")
+
+    def outstanding(self):
+        """
+        :return: Number of requests waiting or being processed at each branch.
+        """
+        return self.state.total("dispatched") - self.state.total("completed")
+
+    async def __call__(self, index, reading):
+        """
+        :param index: Branch index.
+        :param reading: :py:class:`Reading` of the branch.
+        :return: ``True`` if the branch can take a request.
+        """
+        allowed = await self.control(index, reading)
+        if allowed:
+            self.state.add("dispatched", index)
+
+        return allowed
+
+    @abstractmethod
+    async def control(self, index, reading):
+        """
+        Decides whether the branch can take a request, see :py:meth:`__call__`.
+        """
+
+
+class C1(Policy):
+    """
+    Lets a branch take a request each time its consumer replies one.
+    """
+
+    async def control(self, index, reading):
+        return reading.consumed
+
+
+class C2(Policy):
+    """
+    Delays a branch by a PI control rule applied to the difference between the
+    number of requests it takes and the mean of the other branches.
+    """
+
+    Zi = 1e-2
+    """Integrator damping"""
+
+    def __init__(self, branch_count, sleep, gains=(), rng=None, state=None, window=1):
+        super().__init__(branch_count, sleep, gains, rng, state, window)
+        self.ci = np.zeros(branch_count)
+        """Integrator states of this shard"""
+
+    async def _pi(self, index, err, scale=1.0):
+        sleep_amount = float(scale * self.Kp * err + self.ci[index])
+        self.ci[index] = (1.0 - self.Zi) * self.ci[index] + scale * self.Ki * err
+        """PI controller"""
+        if abs(sleep_amount) > 1e4:
+            """This should never happen."""
+            print("!!!", sleep_amount, "!!!")
+            self.ci[index] = 0.0
+        await self._sleep(index, sleep_amount)
+        """Give a push to the other branch when it is slower."""
+
+        return True
+
+    async def control(self, index, reading):
+        self.state.add("count", index)
+        """Total number of times the transitions t13, t23, ... fire."""
+        count = self.state.total("count")
+        err = count[index] - others_mean(count, index)
+        """Calculate the difference from the other branches"""
+
+        return await self._pi(index, err)
+
+
+class C3(C2):
+    """
+    Delays a branch by a PI control rule applied to the time consumed by its
+    consumer compared to the mean of the other branches.
+    """
+
+    async def control(self, index, reading):
+        self.state.add("count", index)
+        self.state.add("total_delay", index, reading.delay)
+        total_delay = self.state.total("total_delay")
+        """Total amount of time spent by consumers for completing HTTP requests."""
+
+        # [[err-defs-start]]
+
+        err = total_delay[index] - others_mean(total_delay, index)
+        """Calculate the difference from the other branches"""
+        err += 0.0 - total_delay[index]
+        """Try to minimize the total time consumed."""
+
+        # [[err-defs-end]]
+
+        return await self._pi(index, err, scale=1e2)
+
+
+class JSQ(Policy):
+    """
+    Join the shortest queue: a branch takes a request only if fewer requests
+    are waiting at it than any other branch.
+    """
+
+    def _load(self):
+        return self.queued()
+
+    async def control(self, index, reading):
+        load = self._load()
+        return bool(load[index] <= load.min())
+
+
+class LOR(JSQ):
+    """
+    Least outstanding requests: same as :py:class:`JSQ`, but the requests
+    being processed are also counted.
+    """
+
+    def _load(self):
+        return self.outstanding()
+
+
+class P2C(LOR):
+    """
+    Power of two choices: a branch takes a request if it has no more
+    outstanding requests than another branch chosen at random.
+    """
+
+    async def control(self, index, reading):
+        other = self.rng.integers(self.state.branch_count - 1)
+        other += other >= index
+        """Any branch other than ``index``"""
+        load = self._load()
+
+        return bool(load[index] <= load[other])
+
+
+class AW(Policy):
+    """
+    Adaptive window: a branch takes a request while it has fewer outstanding
+    requests than its window.
+
+    The window starts from one request. It grows additively while requests are
+    waiting to enter the net and the recent reply times of the branch stay
+    within ``TOLERANCE`` times their long term average, and it is halved, at most once per window of replies, when they
+    rise above it since the server starts queueing. The window never exceeds
+    the tokens of ``k{i}``.
+    """
+
+    TOLERANCE = 1.5
+    SHORT = 0.1
+    """Weight of a new reply time in the recent average"""
+    LONG = 0.01
+    """Weight of a new reply time in the long term average"""
+
+    def __init__(self, branch_count, sleep, gains=(), rng=None, state=None, window=1):
+        super().__init__(branch_count, sleep, gains, rng, state, window)
+        self.window = np.ones(branch_count)
+        self._short = np.zeros(branch_count)
+        self._long = np.zeros(branch_count)
+        self._replies = np.zeros(branch_count)
+        """Replies since the window was halved"""
+
+    def _adapt(self, index, delay, backlog):
+        if self._long[index] == 0.0:
+            self._short[index] = self._long[index] = delay
+        self._short[index] += self.SHORT * (delay - self._short[index])
+        self._long[index] += self.LONG * (delay - self._long[index])
+        self._replies[index] += 1
+        window = self.window[index]
+        if self._short[index] <= self.TOLERANCE * self._long[index]:
+            if backlog:
+                self.window[index] = min(window + 1.0 / window, self.max_window)
+            """Without waiting requests, a larger window would not be used."""
+        elif self._replies[index] >= window:
+            self.window[index] = max(window / 2.0, 1.0)
+            self._replies[index] = 0
+
+    async def control(self, index, reading):
+        if reading.consumed and not reading.failed and reading.delay > 0.0:
+            """The initial pushes of the consumers and failed requests carry no reply time."""
+            self._adapt(index, reading.delay, reading.waiting > 0)
+
+        return bool(self.outstanding()[index] < int(self.window[index]))
+
+
+POLICIES = {
+    "C1": C1,
+    "C2": C2,
+    "C3": C3,
+    "JSQ": JSQ,
+    "LOR": LOR,
+    "P2C": P2C,
+    "AW": AW,
+}
+"""Load balancing policies by their ``-c`` option values."""
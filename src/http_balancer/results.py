@@ -2,6 +2,7 @@
 
 import os
 import sys
+import math
 import getopt
 import json
 import glob
@@ -12,6 +13,8 @@ from collections import OrderedDict
 import matplotlib.pyplot as plt
 import numpy as np
 
+from ..common.jsonl import iter_records, results_file
+from ..common.request import STAGES
 
 DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -26,6 +29,9 @@ def load_results():
         parts = p.name.split("_")
         controller_type = parts[1]
         ab_concurrency = int(parts[2])
+        window = int(Path(parts[-1]).stem[1:]) if parts[-1].startswith("W") else 1
+        if window != 1:
+            controller_type += f" W={window}"
         if (ab_concurrency // 8) % 4 != 0:
             continue
 
@@ -85,7 +91,89 @@ def plot_results(results):
     fig.savefig(DIR + "/result_2.png")
 
 
+def stage_table(fn):
+    """
+    Latency decomposition of the proxied requests.
+
+    :param fn: Results file of the simulation.
+    :return: Rows of controller type, number of concurrent requests and the
+             median and 99th percentile (ms) of each stage in :py:data:`STAGES`.
+             The median is the mean of the branches weighted by the number of
+             traced requests and the 99th percentile is the largest one.
+    """
+    rows = []
+    for record in iter_records(fn):
+        branches = record.get("latency", {}).values()
+        row = [record["params"]["controller_type"], record["params"]["produce_rate"]]
+        for stage, _, _ in STAGES:
+            summaries = [b[f"stage_{stage}"] for b in branches if f"stage_{stage}" in b]
+            count = sum(h["count"] for h in summaries)
+            if count == 0:
+                row += [math.nan, math.nan]
+                continue
+            row.append(1e3 * sum(h["p50"] * h["count"] for h in summaries) / count)
+            row.append(1e3 * max(h["p99"] for h in summaries))
+        rows.append(row)
+
+    return rows
+
+
+def print_stage_table(fn):
+    header = f"{'controller':<12}{'concurrency':>12}"
+    header += "".join(f"{stage + ' p50/p99':>22}" for stage, _, _ in STAGES)
+    print(header)
+    for row in stage_table(fn):
+        line = f"{row[0]:<12}{str(row[1]):>12}"
+        for i in range(2, len(row), 2):
+            line += f"{row[i]:>11.2f}/{row[i + 1]:<10.2f}"
+        print(line)
+
+
+def window_table(fn):
+    """
+    Throughput against the concurrency window of the branches.
+
+    :param fn: Results file of the simulation.
+    :return: Rows of controller type, number of concurrent requests, window,
+             total requests per second of the branches and the largest 99th
+             percentile (ms) of end to end latency.
+    """
+    rows = []
+    for record in iter_records(fn):
+        params = record["params"]
+        throughput = sum(s.get("req_per_sec", 0) for s in record["stats"].values())
+        p99 = [
+            b["end_to_end"]["p99"]
+            for b in record.get("latency", {}).values()
+            if "end_to_end" in b
+        ]
+        rows.append(
+            [
+                params["controller_type"],
+                params["produce_rate"],
+                params.get("window", 1),
+                throughput,
+                1e3 * max(p99) if p99 else math.nan,
+            ]
+        )
+
+    return rows
+
+
+def print_window_table(fn):
+    print(f"{'controller':<12}{'concurrency':>12}{'window':>8}{'req/s':>10}{'p99':>10}")
+    for row in window_table(fn):
+        line = f"{row[0]:<12}{str(row[1]):>12}{row[2]:>8}"
+        line += f"{row[3]:>10.1f}{row[4]:>10.2f}"
+        print(line)
+
+
 def main(argv):
+    log_file = results_file(DIR + "/results")
+    if os.path.exists(log_file):
+        print_stage_table(log_file)
+        print_window_table(log_file)
+
     results = load_results()
     plot_results(results)
 
@@ -2,12 +2,12 @@
 
 import os
 import sys
-import shutil
 import subprocess
 import random
 import string
 import time
 import math
+import tempfile
 from itertools import product
 
 from .main import main, USAGE
@@ -16,10 +16,20 @@ from ..common.clean import clean
 from ..pi_controller import results as pi_controller_results
 
 DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.realpath(f"{DIR}/../..")
 MEAN_VALS = [0.1]
-CONT = ["SN", "UV"]
+CONT = ["SN", "SD", "UV"]
 TOTAL_PRODUCED = 1024 * 4
 AB_CONCURRENCY = [1, 2, 4, 8, 16, 32, 64]
+ASSIGNMENTS = ["rr", "least", "p2c"]
+"""Label assignments (``-a``) compared at each concurrency level"""
+CACHE_SIZES = [0, 1 << 20]
+"""Response cache budgets (``-z``), the cache is compared only with ``rr`` assignment"""
+
+
+def _option(argv, name, default):
+    """Value of a simulation option which is also needed by the Uvicorn only case."""
+    return argv[argv.index(name) + 1] if name in argv else default
 
 
 def _results(argv):
@@ -31,48 +41,80 @@ def _results(argv):
 
 
 def _main(argv):
-    ab_path = shutil.which("ab")
-    if ab_path is None:
-        raise RuntimeError(
-            "This simulation requires 'ab' command from apache2-utils package."
-        )
-
     with open(DIR + "/test.txt", "w") as fh:
         i = 1024
         while i > 0:
             fh.write(random.SystemRandom().choice(string.ascii_uppercase))
             i -= 1
 
-    ab_cmd = ["/bin/bash", f"{DIR}/start_ab.sh"]
-    ab_cmd += [f"{TOTAL_PRODUCED}", f"{DIR+'/test.txt'}", "http://localhost:5000/"]
+    loadgen_cmd = [
+        sys.executable,
+        "-m",
+        "src.common.loadgen",
+        "-n",
+        f"{TOTAL_PRODUCED}",
+    ]
+    loadgen_cmd += ["-p", f"{DIR}/test.txt"]
 
     uv_cmd = ["/bin/bash", f"{DIR}/test_uvicorn.sh"]
 
     results_fh = open(DIR + "/results.txt", "w")
     results_fh.truncate(0)
 
-    log_file = f"{DIR}/results.json"
-    with open(log_file, "w") as fh:
-        fh.write('{ "trials": [' + os.linesep)
+    log_file = f"{DIR}/results.jsonl"
+    open(log_file, "w").close()
+    """Each trial appends its result to the log file as a single line."""
 
-    for c, j_ac, mean in product(CONT, enumerate(AB_CONCURRENCY), MEAN_VALS):
+    control_dir = tempfile.TemporaryDirectory()
+    done_path = f"{control_dir.name}/done.sock"
+    """The load generator reports the end of each trial to this socket."""
+
+    for c, j_ac, mean, a, z in product(
+        CONT, enumerate(AB_CONCURRENCY), MEAN_VALS, ASSIGNMENTS, CACHE_SIZES
+    ):
         j, ac = j_ac
-        csv_fn = f"{DIR}/result_{c}_{ac}_{j}.csv"
-        proc = subprocess.Popen(ab_cmd + [str(ac), csv_fn, c], stdout=results_fh)
+        if c == "UV" and a != ASSIGNMENTS[0]:
+            """Uvicorn only case does not assign labels."""
+            continue
+        if z > 0 and a != ASSIGNMENTS[0]:
+            """The cache is compared with the default label assignment only."""
+            continue
+        name = c if a == "rr" or c == "UV" else f"{c}-{a}"
+        if z > 0:
+            name += "-cache"
+        csv_fn = f"{DIR}/result_{name}_{ac}_{j}.csv"
+        results_fh.write(f"Controller {name}\n")
+        results_fh.flush()
+        cmd = loadgen_cmd + ["-c", str(ac), "-e", csv_fn]
+        cmd += ["-l", f"{DIR}/latency_{name}_{ac}_{j}.txt"]
+        if c != "UV":
+            cmd += ["-D", done_path]
+            """Uvicorn only case polls the PID of the load generator."""
+        cmd.append("http://localhost:5000/")
+        proc = subprocess.Popen(cmd, stdout=results_fh, cwd=ROOT_DIR)
 
         if c != "UV":
             args = ["", "-o", log_file, "-A", str(proc.pid), "-C", ac, "-c", c]
+            args += ["-D", done_path]
+            if c == "SD":
+                args += ["-m", "dispatcher"]
+            args += ["-a", a, "-z", str(z)]
             args += argv[1:]
             print("Starting simulation with arguments:")
             print("  ", args)
             main(args)
-            with open(log_file, "a") as fh:
-                fh.write(f",{os.linesep}")
         else:
-            subprocess.call(uv_cmd + [str(proc.pid), str(ac)])
-
-    with open(log_file, "a") as fh:
-        fh.write("{}]}" + os.linesep)
+            loop = _option(argv, "-E", "asyncio")
+            http = _option(argv, "-U", "h11")
+            echo = _option(argv, "-b", "buffer")
+            ttl = _option(argv, "-t", "")
+            work = _option(argv, "-u", "sleep")
+            uv_args = [str(proc.pid), str(ac), loop, http, echo, str(z), ttl, work]
+            uv_args.append(log_file)
+            subprocess.call(uv_cmd + uv_args)
+        proc.wait()
+
+    control_dir.cleanup()
     i += 1
 
     return 0
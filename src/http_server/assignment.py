@@ -0,0 +1,155 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import random
+from abc import ABC, abstractmethod
+
+
+class Assignment(ABC):
+    """
+    Base class of label assignment strategies.
+
+    The label of a request selects the path it follows in the net, i.e. the
+    consumer which serves it. The labels are numbered from 1 to
+    ``label_count``.
+
+    :param label_count: Number of labels.
+    :param rng: ``random.Random`` instance.
+    """
+
+    def __init__(self, label_count, rng=None):
+        self.label_count = label_count
+        self.rng = random.Random() if rng is None else rng
+
+    def pick(self):
+        """
+        :return: Label of a new request.
+        """
+        label = self.choose()
+        self.assigned(label)
+
+        return label
+
+    @abstractmethod
+    def choose(self):
+        """
+        :return: Label of a new request, before it is counted as assigned.
+        """
+
+    def assigned(self, label):
+        """Called when a request is labeled by ``label``."""
+
+    def done(self, label):
+        """Called when a request labeled by ``label`` is replied."""
+
+
+class RoundRobin(Assignment):
+    """
+    Assigns the labels one after another regardless of the load of consumers.
+    """
+
+    def __init__(self, label_count, rng=None):
+        super().__init__(label_count, rng)
+        self._counter = 0
+
+    def choose(self):
+        self._counter %= self.label_count
+        self._counter += 1
+
+        return self._counter
+
+
+class _Loaded(Assignment):
+    """
+    Keeps the number of requests queued or being served on each path.
+    """
+
+    def __init__(self, label_count, rng=None):
+        super().__init__(label_count, rng)
+        self.load = [0] * (label_count + 1)
+        """Indexed by labels, the first item is not used."""
+
+    def assigned(self, label):
+        self.load[label] += 1
+
+    def done(self, label):
+        self.load[label] -= 1
+
+
+class PowerOfTwo(_Loaded):
+    """
+    Power of two choices: assigns the less loaded one of two labels chosen at
+    random.
+    """
+
+    def choose(self):
+        a = self.rng.randint(1, self.label_count)
+        if self.label_count == 1:
+            return a
+        b = self.rng.randint(1, self.label_count - 1)
+        b += b >= a
+        """Any label other than ``a``"""
+
+        return a if self.load[a] <= self.load[b] else b
+
+
+class LeastLoaded(_Loaded):
+    """
+    Assigns a label with the fewest requests queued or being served.
+
+    The labels are kept in doubly linked lists, one for each load value. Since
+    a load changes by one at a time, a label moves to a neighbouring list and
+    the lowest non-empty list is tracked in O(1).
+    """
+
+    def __init__(self, label_count, rng=None):
+        super().__init__(label_count, rng)
+        self._next = list(range(1, label_count + 2))
+        self._next[label_count] = 0
+        self._prev = list(range(-1, label_count))
+        self._prev[1] = 0
+        """0 marks the ends of the lists."""
+        self._head = [1]
+        """First label of the list of each load value"""
+        self._min = 0
+        """Lowest load value"""
+
+    def _unlink(self, label):
+        prev, next_ = self._prev[label], self._next[label]
+        if prev:
+            self._next[prev] = next_
+        else:
+            self._head[self.load[label]] = next_
+        if next_:
+            self._prev[next_] = prev
+
+    def _link(self, label):
+        load = self.load[label]
+        if load == len(self._head):
+            self._head.append(0)
+        next_ = self._head[load]
+        self._next[label] = next_
+        self._prev[label] = 0
+        if next_:
+            self._prev[next_] = label
+        self._head[load] = label
+
+    def choose(self):
+        return self._head[self._min]
+
+    def assigned(self, label):
+        self._unlink(label)
+        super().assigned(label)
+        self._link(label)
+        if not self._head[self._min]:
+            self._min += 1
+            """The label was the last one with the lowest load."""
+
+    def done(self, label):
+        self._unlink(label)
+        super().done(label)
+        self._link(label)
+        self._min = min(self._min, self.load[label])
+
+
+ASSIGNMENTS = {"rr": RoundRobin, "least": LeastLoaded, "p2c": PowerOfTwo}
+"""Label assignment strategies by their ``-a`` option values."""
@@ -0,0 +1,180 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import sys
+import asyncio
+import getopt
+import resource
+import tempfile
+import time
+import multiprocessing
+
+from .main import main as server_main
+from ..common.echo import ECHO_MODES
+from ..common.jsonl import write_record
+from ..common.loadgen import notify_done
+from ..common.loop import use_event_loop
+
+SIZES = [1 << 10, 1 << 16, 1 << 20, 1 << 24, 1 << 26]
+"""Request body sizes from 1 KB to 64 MB."""
+
+
+def USAGE():
+    """
+    Measures the latency, throughput and memory of the
+    :doc:`HTTP server </src.http_server>` simulation for each echo mode and
+    several request body sizes.
+
+    **Arguments:**
+
+      -s <sizes>
+        comma separated body sizes in bytes
+
+        Default: 1024,65536,1048576,16777216,67108864
+      -b <modes>
+        comma separated echo modes
+
+        Default: buffer,delay,stream
+      -n <count>
+        number of requests sent for each size
+
+        Default: 8
+      -o <filename>
+        output file name to write results. If empty, prints to stdout.
+
+    **Example**
+
+      make bench-echo args="-n 4 -b buffer,stream"
+    """
+    print(USAGE.__doc__)
+
+
+def _max_rss():
+    """
+    :return: Maximum resident set size (MB) of this process. ``ru_maxrss`` is
+             used only if ``VmHWM`` is not available, since it is inherited
+             across ``exec`` on Linux.
+    """
+    try:
+        with open("/proc/self/status", "r") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def _server(mode, done_path, trial_file, result):
+    """
+    Runs the simulation and puts its maximum resident set size (MB) to ``result``.
+    """
+    args = ["", "-b", mode, "-C", 1, "-D", done_path, "-o", trial_file]
+    server_main([str(a) for a in args])
+    result.put(_max_rss())
+
+
+async def _client(size, count):
+    """
+    Sends ``count`` requests with a body of ``size`` bytes one after another.
+
+    :return: Average latency (sec).
+    """
+    body = b"X" * size
+    head = b"POST / HTTP/1.0\r\nContent-Length: %d\r\n\r\n" % size
+
+    async def request():
+        reader, writer = await asyncio.open_connection("127.0.0.1", 5000)
+        writer.writelines([head, body])
+        """The response is read while the body is sent, since it may be streamed."""
+        await reader.readuntil(b"\r\n\r\n")
+        received = 0
+        while data := await reader.read(1 << 16):
+            received += len(data)
+        writer.close()
+        if received < size:
+            raise RuntimeError(f"Incomplete response {received} < {size}")
+
+    for i in range(200):
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", 5000)
+            writer.close()
+            break
+        except OSError:
+            await asyncio.sleep(0.05)
+    """Wait until the server starts."""
+
+    T = time.time()
+    for i in range(count):
+        await request()
+
+    return (time.time() - T) / count
+
+
+def main(argv):
+    """
+    Main entry point of the benchmark.
+
+    :param argv: Command line arguments
+    :return: Exit status
+    """
+    sizes = SIZES
+    modes = list(ECHO_MODES)
+    COUNT = 8
+    OUTPUT_FILE = sys.stdout
+
+    opts, args = getopt.getopt(argv[1:], "s:b:n:o:h")
+
+    for o, a in opts:
+        if o == "-s":
+            sizes = [int(val) for val in a.split(",")]
+        elif o == "-b":
+            modes = a.split(",")
+        elif o == "-n":
+            COUNT = int(a)
+        elif o == "-o":
+            OUTPUT_FILE = open(a, "a")
+        elif o == "-h":
+            USAGE()
+            return 0
+
+    print(
+        f"{'mode':<8}{'size (B)':>10}{'latency (ms)':>14}{'MB/s':>10}"
+        f"{'max RSS (MB)':>14}"
+    )
+    use_event_loop("asyncio")
+    ctx = multiprocessing.get_context("spawn")
+    """A forked server would inherit the memory of the client bodies."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        done_path = f"{tmp_dir}/done.sock"
+        for mode in modes:
+            for size in sorted(sizes):
+                result = ctx.SimpleQueue()
+                server = ctx.Process(
+                    target=_server,
+                    args=(mode, done_path, f"{tmp_dir}/trial.jsonl", result),
+                )
+                server.start()
+                latency = asyncio.run(_client(size, COUNT))
+                notify_done(done_path)
+                max_rss = result.get()
+                server.join()
+
+                record = {
+                    "mode": mode,
+                    "size": size,
+                    "latency": latency,
+                    "throughput": size / latency / 1e6,
+                    "max_rss": max_rss,
+                }
+                print(
+                    f"{mode:<8}{size:>10}{1e3 * latency:>14.2f}"
+                    f"{record['throughput']:>10.1f}{max_rss:>14.1f}"
+                )
+                if OUTPUT_FILE is not sys.stdout:
+                    write_record(OUTPUT_FILE, record)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,177 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import os
+import sys
+import csv
+import getopt
+import json
+import resource
+import subprocess
+import tempfile
+
+from .main import LAYOUTS, main as server_main
+from ..common.jsonl import write_record
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.realpath(f"{DIR}/../..")
+CONCURRENCY = [1, 10, 100, 1000, 10000]
+
+
+def USAGE():
+    """
+    Measures the throughput and response time of the
+    :doc:`HTTP server </src.http_server>` simulation for each PT net layout
+    against the number of concurrent clients. The clients keep their
+    connections alive, so the server holds all of them at the same time.
+
+    **Arguments:**
+
+      -c <counts>
+        comma separated numbers of concurrent clients
+
+        Default: 1,10,100,1000,10000
+      -m <layouts>
+        comma separated PT net layouts
+
+        Default: slots,dispatcher
+      -w <count>
+        number of consumers of the ``dispatcher`` layout
+
+        Default: number of CPUs
+      -n <count>
+        minimum number of requests of each trial, each client sends at least
+        two requests
+
+        Default: 2000
+      -x <count>
+        the ``slots`` layout is skipped above this number of clients, since its
+        net grows by the number of clients
+
+        Default: 1000
+      -u <model>[,<executor>[,<workers>]]
+        work model of the processing time, see the ``-u`` option of the
+        simulation
+
+        Default: sleep
+      -o <filename>
+        output file name to write results. If empty, prints to stdout.
+
+    **Example**
+
+      make bench-server args="-c 1,100,10000 -w 4"
+    """
+    print(USAGE.__doc__)
+
+
+def _percentiles(filename):
+    with open(filename, "r") as fh:
+        rows = csv.reader(fh)
+        next(rows, None)
+        return [float(row[1]) for row in rows]
+
+
+def _trial(layout, clients, workers, count, work, tmp_dir):
+    """
+    Runs the simulation against the load generator.
+
+    :return: Record of the trial.
+    """
+    done_path = f"{tmp_dir}/done.sock"
+    csv_fn = f"{tmp_dir}/result.csv"
+    trial_file = f"{tmp_dir}/trial.jsonl"
+    cmd = [sys.executable, "-m", "src.common.loadgen", "-k"]
+    cmd += ["-n", str(max(count, 2 * clients)), "-c", str(clients)]
+    cmd += ["-w", str(min(4, clients)), "-e", csv_fn, "-D", done_path]
+    cmd.append("http://127.0.0.1:5000/")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, cwd=ROOT_DIR)
+
+    args = ["", "-m", layout, "-w", workers, "-C", clients, "-D", done_path]
+    args += ["-u", work, "-o", trial_file]
+    server_main([str(a) for a in args])
+    output, _ = proc.communicate()
+
+    summary = {}
+    for line in output.splitlines():
+        key, sep, value = line.partition(":")
+        if sep and value.split():
+            summary[key.strip()] = value.split()[0]
+    with open(trial_file, "r") as fh:
+        params = json.loads(fh.readlines()[-1])["params"]
+    values = _percentiles(csv_fn)
+
+    return {
+        "layout": layout,
+        "clients": clients,
+        "pt_count": params["pt_count"],
+        "work": work,
+        "requests_per_sec": float(summary["Requests per second"]),
+        "failed": int(summary["Failed requests"]),
+        "p50": values[50],
+        "p99": values[99],
+    }
+
+
+def main(argv):
+    """
+    Main entry point of the benchmark.
+
+    :param argv: Command line arguments
+    :return: Exit status
+    """
+    concurrency = CONCURRENCY
+    layouts = list(LAYOUTS)
+    WORKERS = os.cpu_count() or 1
+    COUNT = 2000
+    SLOTS_MAX = 1000
+    WORK = "sleep"
+    OUTPUT_FILE = sys.stdout
+
+    opts, args = getopt.getopt(argv[1:], "c:m:w:n:x:u:o:h")
+
+    for o, a in opts:
+        if o == "-c":
+            concurrency = [int(val) for val in a.split(",")]
+        elif o == "-m":
+            layouts = a.split(",")
+        elif o == "-w":
+            WORKERS = int(a)
+        elif o == "-n":
+            COUNT = int(a)
+        elif o == "-x":
+            SLOTS_MAX = int(a)
+        elif o == "-u":
+            WORK = a
+        elif o == "-o":
+            OUTPUT_FILE = open(a, "a")
+        elif o == "-h":
+            USAGE()
+            return 0
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    """Each client holds a socket at both the load generator and the server."""
+
+    print(
+        f"{'layout':<12}{'clients':>9}{'PTs':>8}{'requests/sec':>14}"
+        f"{'failed':>8}{'p50 (ms)':>10}{'p99 (ms)':>10}"
+    )
+    for layout in layouts:
+        for clients in concurrency:
+            if layout == "slots" and clients > SLOTS_MAX:
+                print(f"{layout:<12}{clients:>9}{'skipped':>22}")
+                continue
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                r = _trial(layout, clients, WORKERS, COUNT, WORK, tmp_dir)
+            print(
+                f"{r['layout']:<12}{r['clients']:>9}{r['pt_count']:>8}"
+                f"{r['requests_per_sec']:>14.1f}{r['failed']:>8}"
+                f"{r['p50']:>10.1f}{r['p99']:>10.1f}"
+            )
+            if OUTPUT_FILE is not sys.stdout:
+                write_record(OUTPUT_FILE, r)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
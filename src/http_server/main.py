@@ -1,10 +1,10 @@
 # SPDX-License-Identifier:  CC-BY-SA-4.0
 
+import os
 import sys
 import asyncio
 import time
 import getopt
-import json
 import random
 from secrets import token_bytes
 import math
@@ -14,10 +14,18 @@ from soyutnet import SoyutNet
 from soyutnet.constants import GENERIC_ID, GENERIC_LABEL, INVALID_ID
 
 import uvicorn
-import psutil
 
 from . import uvicorn_main
 from ..common import logged
+from ..common.jsonl import write_record
+from ..common.loop import use_event_loop
+from ..common.lifecycle import InFlight, stop_server, wait_trial_end
+from ..common.echo import ECHO_MODES
+from ..common.cache import new_cache
+from ..common.work import new_work, parse_work
+from .assignment import ASSIGNMENTS
+
+LAYOUTS = ("slots", "dispatcher")
 
 
 def USAGE():
@@ -45,10 +53,83 @@ def USAGE():
       -G
         if provided, the script generates PT net graph and exits
 
-      -A ab command's PID
+      -A load generator's PID
+
+      -D <path>
+        control socket where the load generator reports that all requests are
+        replied. If provided, the simulation ends then or when the process
+        given by ``-A`` exits, whichever comes first.
 
       -C number of concurrent requests expected
 
+      -m <slots|dispatcher>
+        layout of the PT net. ``slots`` adds a producer and a consumer for each
+        concurrent request. ``dispatcher`` adds a single producer which routes
+        the requests to a fixed pool of consumers, so the size of the net does
+        not depend on the number of concurrent requests.
+
+        Default: slots
+
+      -w <count>
+        number of consumers of the ``dispatcher`` layout
+
+        Default: number of CPUs
+      -k <count>
+        number of requests each consumer of the ``dispatcher`` layout serves at
+        the same time. The other requests wait in the net.
+
+        Default: 16
+
+      -a <rr|least|p2c>
+        label assignment, i.e. the choice of the consumer serving a new
+        request. ``rr`` assigns the labels one after another, ``least`` assigns
+        the label with the fewest requests queued or being served and ``p2c``
+        assigns the less loaded one of two labels chosen at random.
+
+        Default: rr
+
+      -b <buffer|delay|stream>
+        how the request body is echoed. ``buffer`` reads the whole body and
+        sends it back after the processing time. ``delay`` sends each chunk
+        back as soon as it is read after the processing time and ``stream``
+        ends the response after the processing time. The streaming modes keep
+        a single chunk of the body in memory.
+
+        Default: buffer
+
+      -z <bytes>
+        byte budget of a response cache in front of the HTTP server. The
+        responses are keyed by the method, path and the digest of the request
+        body and the least recently used ones are evicted. Concurrent identical
+        requests wait for the response of the first one. Zero disables the
+        cache.
+
+        Default: 0
+
+      -t <ttl (sec)>
+        lifetime of a cached response. If not provided, the responses are
+        evicted only when the budget is exceeded.
+
+      -u <sleep|busy|hash|numpy>[,<inline|thread|process>[,<workers>]]
+        work model of the processing time. ``sleep`` waits without using the
+        CPU. ``busy`` runs a pure Python loop, ``hash`` computes SHA-256 over
+        the request body and ``numpy`` multiplies matrices for the processing
+        time, where the amount of work done in a second is calibrated at the
+        beginning. The work runs in the event loop (``inline``), in a thread
+        pool or in a process pool of ``workers`` threads or processes.
+
+        Default: sleep
+
+      -E <asyncio|uvloop>
+        event loop implementation
+
+        Default: asyncio
+
+      -U <h11|httptools>
+        HTTP parser of Uvicorn servers
+
+        Default: h11
+
     **Example**
       python src/http_balancer/main.py -p 100
     """
@@ -70,11 +151,22 @@ def main(argv, OUTPUT_FILE):
     HOST = "127.0.0.1"
     PORT = 5000
     AB_PID = None
+    DONE_PATH = None
     CONCURRENT_REQUESTS = 4
     CONTROLLER_TYPE = "SN"
     BRANCH_COUNT = 1
-
-    opts, args = getopt.getopt(argv[1:], "r:o:GH:P:A:C:c:")
+    LAYOUT = "slots"
+    WORKERS = os.cpu_count() or 1
+    WORKER_CONCURRENCY = 16
+    ASSIGNMENT = "rr"
+    ECHO_MODE = "buffer"
+    CACHE_SIZE = 0
+    CACHE_TTL = None
+    WORK = ("sleep", "inline", None)
+    EVENT_LOOP = "asyncio"
+    HTTP_PARSER = "h11"
+
+    opts, args = getopt.getopt(argv[1:], "r:o:GH:P:A:C:c:D:E:U:m:w:k:a:b:z:t:u:")
 
     for o, a in opts:
         if o == "-r":
@@ -93,26 +185,67 @@ def main(argv, OUTPUT_FILE):
             AB_PID = int(a)
         elif o == "-C":
             CONCURRENT_REQUESTS = int(a)
+        elif o == "-D":
+            DONE_PATH = a
         elif o == "-c":
             CONTROLLER_TYPE = a
+        elif o == "-m":
+            if a not in LAYOUTS:
+                raise RuntimeError(f"Option -m is invalid '{a}'")
+            LAYOUT = a
+        elif o == "-a":
+            if a not in ASSIGNMENTS:
+                raise RuntimeError(f"Option -a is invalid '{a}'")
+            ASSIGNMENT = a
+        elif o == "-b":
+            if a not in ECHO_MODES:
+                raise RuntimeError(f"Option -b is invalid '{a}'")
+            ECHO_MODE = a
+        elif o == "-z":
+            CACHE_SIZE = int(a)
+            if CACHE_SIZE < 0:
+                raise RuntimeError(f"Option -z is invalid '{a}'")
+        elif o == "-t":
+            CACHE_TTL = float(a)
+        elif o == "-u":
+            try:
+                WORK = parse_work(a)
+            except ValueError:
+                raise RuntimeError(f"Option -u is invalid '{a}'")
+        elif o == "-w":
+            WORKERS = int(a)
+            if WORKERS < 1:
+                raise RuntimeError(f"Option -w is invalid '{a}'")
+        elif o == "-k":
+            WORKER_CONCURRENCY = int(a)
+            if WORKER_CONCURRENCY < 1:
+                raise RuntimeError(f"Option -k is invalid '{a}'")
+        elif o == "-E":
+            EVENT_LOOP = a
+        elif o == "-U":
+            HTTP_PARSER = a
 
     net = SoyutNet()
 
     treg = net.TokenRegistry()
-    req_queues = [asyncio.Queue() for i in range(CONCURRENT_REQUESTS)]
+    req_queues = {}
+    """Requests waiting to enter the net keyed by the names of producers"""
+    route = {}
+    """Producer of each label, i.e. the entry of the path the label follows"""
+    in_net = {}
+    """Tokens injected by each producer and not taken by a consumer yet"""
+    in_flight = InFlight()
+    """Requests not replied yet"""
+    cache = new_cache(CACHE_SIZE, CACHE_TTL)
+    work = None
 
     # [[producer-defs-start]]
 
-    LABEL_MAX = CONCURRENT_REQUESTS
-
-    label_counter = 0
+    assignment = None
 
     def new_label():
-        nonlocal label_counter
-        label_counter %= LABEL_MAX
-        label_counter += 1
         """Assign a label from 1 to LABEL_MAX to determine the path it will follow in the net."""
-        return label_counter
+        return assignment.pick()
 
     def new_http_request_token(scope, receive, send, cond):
         label = new_label()
@@ -124,16 +257,21 @@ def main(argv, OUTPUT_FILE):
     async def uvicorn_app(scope, receive, send):
         if scope["type"] != "http":
             return
-        cond = asyncio.Semaphore(value=0)
-        token = new_http_request_token(scope, receive, send, cond)
-        label = token[0]
-        req_queues[(label - 1) // BRANCH_COUNT].put_nowait(token)
-        await cond.acquire()
-        """Wait until endpoint fullfills HTTP request"""
+        with in_flight:
+            cond = asyncio.Semaphore(value=0)
+            token = new_http_request_token(scope, receive, send, cond)
+            label = token[0]
+            req_queues[route[label]].put_nowait(token)
+            await cond.acquire()
+            """Wait until endpoint fullfills HTTP request"""
 
     async def producer(place):
-        index = int(place._name[3:])
-        token = await req_queues[index].get()
+        queue = req_queues[place._name]
+        if queue.empty() and in_net[place._name] > 0:
+            return []
+        """A token waiting for a busy output arc is sent before blocking."""
+        token = await queue.get()
+        in_net[place._name] += 1
         return [token]
 
     """Inject token"""
@@ -141,19 +279,47 @@ def main(argv, OUTPUT_FILE):
     # [[producer-defs-end]]
 
     consumer_stats = {}
+    serving = set()
+    """Requests served by the tasks of the dispatcher layout"""
+    worker_slots = {}
+    """Bounds the requests served by each consumer of the dispatcher layout"""
 
     # [[consumer-defs-start]]
 
-    async def consumer(place):
-        async def http_server(uvicorn_scope, uvicorn_receive, uvicorn_send):
-            await uvicorn_main.app(uvicorn_scope, uvicorn_receive, uvicorn_send)
+    async def http_server(
+        ident, label, uvicorn_scope, uvicorn_receive, uvicorn_send, cond, slot=None
+    ):
+        try:
+            await uvicorn_main.app(
+                uvicorn_scope,
+                uvicorn_receive,
+                uvicorn_send,
+                mode=ECHO_MODE,
+                cache=cache,
+                work=work,
+            )
+            """Fulfill the request."""
+        except Exception:
+            consumer_stats[ident]["errors"] += 1
+            """The requester gets an error from Uvicorn."""
+            return
+        finally:
+            cond.release()
+            """Inform uvicorn_app that request is replied"""
+            assignment.done(label)
+            if slot is not None:
+                slot.release()
 
+        consumer_stats[ident]["count"] += 1
+        consumer_stats[ident]["last_at"] = time.time()
+
+    async def consumer(place):
         nonlocal consumer_stats
         t0 = time.time()
         ident = place.ident()
         if ident not in consumer_stats:
             """Initialize stats at first call of the producer."""
-            consumer_stats[ident] = {"started_at": time.time(), "count": 0}
+            consumer_stats[ident] = {"started_at": time.time(), "count": 0, "errors": 0}
             """Store initial time and number of requests processed to calculate requests per second."""
 
         label = place._input_arcs[0]._labels[0]
@@ -162,41 +328,66 @@ def main(argv, OUTPUT_FILE):
         if not token:
             consumer_stats[ident]["last_at"] = time.time()
             return
+        in_net[route[label]] -= 1
 
         actual_token = treg.pop_entry(*token)
         """Get actual SoyutNet.Token object from SoyutNet.TokenRegistry"""
         if actual_token is None:
+            assignment.done(label)
             consumer_stats[ident]["last_at"] = time.time()
             return
 
-        uvicorn_scope, uvicorn_receive, uvicorn_send, cond = actual_token.get_binding()
+        binding = actual_token.get_binding()
         """Get object binded to the actual token"""
-        await http_server(uvicorn_scope, uvicorn_receive, uvicorn_send)
-        """Fulfill the request."""
-        cond.release()
-        """Inform uvicorn_app that request is replied"""
-
-        consumer_stats[ident]["count"] += 1
-        consumer_stats[ident]["last_at"] = time.time()
+        if LAYOUT == "slots":
+            await http_server(ident, label, *binding)
+            return
+        if ident not in worker_slots:
+            worker_slots[ident] = asyncio.Semaphore(WORKER_CONCURRENCY)
+        slot = worker_slots[ident]
+        await slot.acquire()
+        """The consumer takes no more tokens while all of its slots are busy."""
+        task = asyncio.create_task(http_server(ident, label, *binding, slot=slot))
+        serving.add(task)
+        task.add_done_callback(serving.discard)
+        """A consumer of the dispatcher serves many requests at the same time."""
 
     # [[consumer-defs-end]]
 
+    def add_producer(name):
+        place = net.SpecialPlace(name, producer=producer)
+        reg.register(place)
+        req_queues[name] = asyncio.Queue()
+        in_net[name] = 0
+
+        return place
+
+    def add_consumer(place, suffix, label):
+        t = net.Transition(f"t{suffix}")
+        con = net.SpecialPlace(f"con{suffix}", consumer=consumer)
+        reg.register(t)
+        reg.register(con)
+        place.connect(t, labels=[label])
+        t.connect(con, labels=[label])
+        route[label] = place._name
+
     reg = net.PTRegistry()
     label_counter = 0
-    for i in range(CONCURRENT_REQUESTS):
-        proi = net.SpecialPlace(f"pro{i}", producer=producer)
-        reg.register(proi)
-        for j in range(BRANCH_COUNT):
+    if LAYOUT == "slots":
+        for i in range(CONCURRENT_REQUESTS):
+            proi = add_producer(f"pro{i}")
+            for j in range(BRANCH_COUNT):
+                label_counter += 1
+                add_consumer(proi, f"{i}_{j}", label_counter)
+    else:
+        pro = add_producer("pro")
+        for k in range(WORKERS):
             label_counter += 1
-            tij = net.Transition(f"t{i}_{j}")
-            conij = net.SpecialPlace(f"con{i}_{j}", consumer=consumer)
-            reg.register(tij)
-            reg.register(conij)
-            proi.connect(tij, labels=[label_counter])
-            tij.connect(conij, labels=[label_counter])
+            add_consumer(pro, f"{k}", label_counter)
+        """The label of a request selects one of the consumers."""
 
     LABEL_MAX = label_counter
-    label_counter = 0
+    assignment = ASSIGNMENTS[ASSIGNMENT](LABEL_MAX)
 
     if GENERATE_GRAPH_AND_EXIT:
         OUTPUT_FILE.truncate(0)
@@ -206,27 +397,29 @@ def main(argv, OUTPUT_FILE):
 
     # [[loop-start-defs-start]]
 
+    work = new_work(*WORK)
+    """The process pool is started before the event loop."""
     uvicorn_server = [None]
 
     async def canceller():
-        try:
-            ab_proc = psutil.Process(AB_PID)
-            while ab_proc.is_running() and ab_proc.status() != psutil.STATUS_ZOMBIE:
-                await asyncio.sleep(1)
-        except psutil.NoSuchProcess:
-            pass
-        await asyncio.sleep(1)
-        if uvicorn_server[0] is not None:
-            await uvicorn_server[0].shutdown()
+        await wait_trial_end(DONE_PATH, AB_PID)
+        await stop_server(uvicorn_server[0], in_flight)
         soyutnet.terminate()
 
-    """Automatically terminate after ab ends"""
+    """Automatically terminate after the load generator ends"""
 
+    use_event_loop(EVENT_LOOP)
     soyutnet.run(
         reg,
         extra_routines=[
             uvicorn_main.main(
-                uvicorn_app, HOST, PORT, canceller, uvicorn_server, CONCURRENT_REQUESTS
+                uvicorn_app,
+                HOST,
+                PORT,
+                canceller,
+                uvicorn_server,
+                CONCURRENT_REQUESTS,
+                http=HTTP_PARSER,
             )
         ],
     )
@@ -234,6 +427,9 @@ def main(argv, OUTPUT_FILE):
 
     # [[loop-start-defs-end]]
 
+    if work is not None:
+        work.close()
+
     for name in consumer_stats:
         stats = consumer_stats[name]
         count = stats["count"]
@@ -244,16 +440,30 @@ def main(argv, OUTPUT_FILE):
         else:
             stats["req_per_sec"] = 0
 
-    print(
-        json.dumps(
-            {
-                "params": {
-                    "produce_rate": CONCURRENT_REQUESTS,
-                },
-                "stats": consumer_stats,
-            }
-        ),
-        file=OUTPUT_FILE,
+    write_record(
+        OUTPUT_FILE,
+        {
+            "params": {
+                "produce_rate": CONCURRENT_REQUESTS,
+                "layout": LAYOUT,
+                "assignment": ASSIGNMENT,
+                "echo": ECHO_MODE,
+                "cache_size": CACHE_SIZE,
+                "cache_ttl": CACHE_TTL,
+                "work": WORK[0],
+                "executor": WORK[1],
+                "work_workers": WORK[2],
+                "workers": WORKERS if LAYOUT == "dispatcher" else None,
+                "worker_concurrency": (
+                    WORKER_CONCURRENCY if LAYOUT == "dispatcher" else None
+                ),
+                "pt_count": len(req_queues) + 2 * LABEL_MAX,
+                "event_loop": EVENT_LOOP,
+                "http_parser": HTTP_PARSER,
+            },
+            "stats": consumer_stats,
+            "cache": None if cache is None else cache.stats(),
+        },
     )
     """Dump results"""
 
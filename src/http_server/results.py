@@ -12,6 +12,7 @@ from collections import OrderedDict
 import matplotlib.pyplot as plt
 import numpy as np
 
+from ..common.jsonl import iter_records, results_file
 
 DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -125,8 +126,118 @@ def plot_results(results):
     fig.savefig(DIR + "/result_2.png")
 
 
+def assignment_table(fn):
+    """
+    Throughput of each label assignment against the number of concurrent
+    requests.
+
+    :param fn: Results file of the simulation.
+    :return: Rows of layout, label assignment, number of concurrent requests,
+             requests replied per second by all consumers and the share of the
+             busiest consumer.
+    """
+    rows = []
+    for record in iter_records(fn):
+        params = record["params"]
+        stats = [s for s in record["stats"].values() if s["count"] > 0]
+        count = sum(s["count"] for s in stats)
+        if count == 0:
+            continue
+        span = max(s["last_at"] for s in stats) - min(s["started_at"] for s in stats)
+        rows.append(
+            [
+                params.get("layout", "slots"),
+                params.get("assignment", "rr"),
+                params["produce_rate"],
+                count / span,
+                max(s["count"] for s in stats) / count,
+            ]
+        )
+
+    return rows
+
+
+def print_assignment_table(fn):
+    print(
+        f"{'layout':<12}{'assignment':<12}{'concurrency':>12}{'req/s':>10}{'max share':>11}"
+    )
+    for row in assignment_table(fn):
+        line = f"{row[0]:<12}{row[1]:<12}{row[2]:>12}"
+        line += f"{row[3]:>10.1f}{row[4]:>11.3f}"
+        print(line)
+
+
+def cache_table(fn):
+    """
+    Response cache stats against the number of concurrent requests.
+
+    :param fn: Results file of the simulation.
+    :return: Rows of layout, number of concurrent requests, hit ratio, share of
+             the hits coalesced with a concurrent identical request and bytes
+             saved.
+    """
+    rows = []
+    for record in iter_records(fn):
+        cache = record.get("cache")
+        if cache is None:
+            continue
+        hits = cache["hits"] + cache["coalesced"]
+        rows.append(
+            [
+                record["params"].get("layout", "slots"),
+                record["params"]["produce_rate"],
+                cache["hit_ratio"],
+                cache["coalesced"] / hits if hits else 0.0,
+                cache["bytes_saved"],
+            ]
+        )
+
+    return rows
+
+
+def print_cache_table(fn):
+    print(
+        f"{'layout':<12}{'concurrency':>12}{'hit ratio':>11}{'coalesced':>11}{'saved (kB)':>12}"
+    )
+    for row in cache_table(fn):
+        line = f"{row[0]:<12}{row[1]:>12}{row[2]:>11.3f}"
+        line += f"{row[3]:>11.3f}{row[4] / 1e3:>12.1f}"
+        print(line)
+
+
+def print_cache_latency(results):
+    """
+    Compares the response time percentiles of each controller with and
+    without the response cache.
+
+    :param results: Output of :py:func:`load_results`.
+    """
+    print(
+        f"{'controller':<12}{'concurrency':>12}{'p50 (ms)':>10}{'cached':>10}"
+        f"{'p99 (ms)':>10}{'cached':>10}"
+    )
+    for controller_type in results:
+        if not controller_type.endswith("-cache"):
+            continue
+        base = controller_type[: -len("-cache")]
+        for ab_concurrency, cached in sorted(results[controller_type].items()):
+            if ab_concurrency not in results.get(base, {}):
+                continue
+            result = results[base][ab_concurrency]
+            line = f"{base:<12}{ab_concurrency:>12}"
+            line += f"{result[50, 1]:>10.1f}{cached[50, 1]:>10.1f}"
+            line += f"{result[99, 1]:>10.1f}{cached[99, 1]:>10.1f}"
+            print(line)
+
+
 def main(argv):
+    log_file = results_file(DIR + "/results")
+    if os.path.exists(log_file):
+        print_assignment_table(log_file)
+        print_cache_table(log_file)
+
     results = load_results()
+    print_cache_latency(results)
     plot_results(results)
 
     return 0
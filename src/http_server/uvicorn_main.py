@@ -3,51 +3,47 @@
 import sys
 import random
 import asyncio
-import psutil
 import random
 from secrets import token_bytes
 import math
 
 import uvicorn
 
+from ..common.jsonl import write_record
+from ..common.loop import use_event_loop, http_parser
+from ..common.lifecycle import InFlight, stop_server, wait_exit
+from ..common.echo import echo
+from ..common.cache import new_cache
+from ..common.work import new_work, parse_work
 
-async def app(scope, receive, send, mean=0.02, std=0.001):
+
+async def app(
+    scope, receive, send, mean=0.02, std=0.001, mode="buffer", cache=None, work=None
+):
     """
     Echo the request body back in an HTTP response.
-    """
 
-    body = b""
-    more_body = True
-    while more_body:
-        message = await receive()
-        body += message.get("body", b"")
-        more_body = message.get("more_body", False)
-    """Redirect body to the actual HTTP server"""
+    :param mode: One of :py:data:`src.common.echo.ECHO_MODES`.
+    :param cache: :py:class:`src.common.cache.ResponseCache` replying the
+                  repeated requests without the delay.
+    :param work: :py:class:`src.common.work.WorkModel` doing CPU-bound work
+                 instead of sleeping.
+    """
+    if cache is not None:
+        await cache.serve(
+            scope, receive, send, lambda *asgi: app(*asgi, mean, std, mode, work=work)
+        )
+        return
 
     delay = random.gauss(mean, std)
     delay = min(delay, 10.0)
-    await asyncio.sleep(delay)
-
+    await echo(scope, receive, send, delay, mode, work)
     """Imitate a time consuming process by delay."""
-    await send(
-        {
-            "type": "http.response.start",
-            "status": 200,
-            "headers": [
-                (b"content-type", b"text/plain"),
-                (b"content-length", str(len(body)).encode()),
-            ],
-        }
-    )
-    await send(
-        {
-            "type": "http.response.body",
-            "body": body,
-        }
-    )
 
 
-async def main(app_, host, port, canceller, server_ref, concurrent_requesters):
+async def main(
+    app_, host, port, canceller, server_ref, concurrent_requesters, http="h11"
+):
     random.seed(token_bytes(16))
 
     workers = 1
@@ -60,46 +56,85 @@ async def main(app_, host, port, canceller, server_ref, concurrent_requesters):
         port=port,
         log_level="critical",
         workers=workers,
-        http="h11",
+        http=http_parser(http),
+        backlog=max(2048, concurrent_requesters),
     )
+    """Connections of all concurrent requesters can wait to be accepted."""
     server_ref[0] = uvicorn.Server(config)
     """Let parent process know this process started."""
     await server_ref[0].serve()
 
 
 def server_main(args):
+    """
+    Runs the Uvicorn only case until the load generator exits.
+
+    If ``args["OUTPUT"]`` is given, the trial is appended to that results
+    file like the trials of the simulation.
+    """
     uvicorn_server = [None]
+    in_flight = InFlight()
+    """Requests not replied yet"""
+
+    cache = new_cache(*args["CACHE"])
+    work = new_work(*args["WORK"])
+    """The process pool is started before the event loop."""
+
+    async def counted_app(scope, receive, send):
+        with in_flight:
+            await app(scope, receive, send, mode=args["ECHO"], cache=cache, work=work)
 
     async def canceller():
         nonlocal uvicorn_server
-        try:
-            ab_proc = psutil.Process(args["AB_PID"])
-            while ab_proc.is_running() and ab_proc.status() != psutil.STATUS_ZOMBIE:
-                await asyncio.sleep(1)
-        except psutil.NoSuchProcess:
-            pass
-        await asyncio.sleep(3)
-        if uvicorn_server[0] is not None:
-            await uvicorn_server[0].shutdown()
+        await wait_exit(args["AB_PID"])
+        await stop_server(uvicorn_server[0], in_flight)
         for task in asyncio.all_tasks():
             task.cancel()
 
-    """Automatically terminate after ab ends"""
+    """Automatically terminate after the load generator ends"""
 
+    use_event_loop(args["LOOP"])
     try:
         asyncio.run(
             main(
-                app,
+                counted_app,
                 args["HOST"],
                 args["PORT"],
                 canceller,
                 uvicorn_server,
                 args["CONCURRENT_REQUESTS"],
+                http=args["HTTP"],
             )
         )
     except asyncio.exceptions.CancelledError:
         pass
 
+    if work is not None:
+        work.close()
+
+    if args.get("OUTPUT"):
+        with open(args["OUTPUT"], "a") as fh:
+            write_record(
+                fh,
+                {
+                    "params": {
+                        "produce_rate": args["CONCURRENT_REQUESTS"],
+                        "layout": "uvicorn",
+                        "echo": args["ECHO"],
+                        "cache_size": args["CACHE"][0],
+                        "cache_ttl": args["CACHE"][1],
+                        "work": args["WORK"][0],
+                        "executor": args["WORK"][1],
+                        "work_workers": args["WORK"][2],
+                        "event_loop": args["LOOP"],
+                        "http_parser": args["HTTP"],
+                    },
+                    "stats": {},
+                    "cache": None if cache is None else cache.stats(),
+                },
+            )
+            """No consumers, the throughput is measured by the load generator."""
+
     return 0
 
 
@@ -109,6 +144,15 @@ if __name__ == "__main__":
         "PORT": 5000,
         "AB_PID": int(sys.argv[1]),
         "CONCURRENT_REQUESTS": int(sys.argv[2]),
+        "LOOP": sys.argv[3] if len(sys.argv) > 3 else "asyncio",
+        "HTTP": sys.argv[4] if len(sys.argv) > 4 else "h11",
+        "ECHO": sys.argv[5] if len(sys.argv) > 5 else "buffer",
+        "CACHE": (
+            int(sys.argv[6]) if len(sys.argv) > 6 else 0,
+            float(sys.argv[7]) if len(sys.argv) > 7 and sys.argv[7] else None,
+        ),
+        "WORK": parse_work(sys.argv[8] if len(sys.argv) > 8 else "sleep"),
+        "OUTPUT": sys.argv[9] if len(sys.argv) > 9 else None,
     }
 
     server_main(args)
@@ -2,11 +2,14 @@
 
 import os
 import sys
+import tempfile
 from itertools import product
+from concurrent.futures import ProcessPoolExecutor
 
 from .main import main, USAGE
 from .results import main as show_results
 from ..common.clean import clean
+from ..common.jsonl import results_file
 
 DIR = os.path.dirname(os.path.realpath(__file__))
 TIME = 2.0
@@ -14,54 +17,89 @@ MEAN = 0.01
 RNG_PARAMS = f"exponential,{MEAN}"
 K_PIS = ["1e-2,1e-4", "1e-2,0"]
 CONT = ["none", "C1", "C2"]
+CONNECTION_MODES = ["single", "pool"]
 PRODUCE_RATE_SCALER = 25
 END = 30
+WORKERS = 1
+"""Number of trials run concurrently, can be changed by '-j <workers>'"""
+
+
+def _suffix(mode):
+    """Results of the default connection mode keep their original file names."""
+    return "" if mode == CONNECTION_MODES[0] else f"_{mode}"
 
 
 def _results(argv):
-    for i in range(1, len(K_PIS) + 1):
-        log_file = f"{DIR}/results_{i}.json"
-        output_file = f"{DIR}/result_{i}.png"
-        args = ["", "-i", log_file, "-o", output_file]
-        if show_results(args + argv[1:]) != 0:
-            break
+    for mode in CONNECTION_MODES:
+        for i in range(1, len(K_PIS) + 1):
+            log_file = results_file(f"{DIR}/results_{i}{_suffix(mode)}")
+            output_file = f"{DIR}/result_{i}{_suffix(mode)}.png"
+            if not os.path.exists(log_file):
+                continue
+            args = ["", "-i", log_file, "-o", output_file]
+            if show_results(args + argv[1:]) != 0:
+                break
 
     return 0
 
 
+def _trial(args):
+    """
+    Runs a single trial in a worker process and returns its output.
+
+    Each trial writes to its own temporary file, the servers pick free ports
+    so concurrent trials do not interfere.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trial_file = f"{tmp_dir}/trial.jsonl"
+        main(args[:1] + ["-o", trial_file] + args[1:])
+        with open(trial_file, "r") as fh:
+            return fh.read()
+
+
 def _main(argv):
+    workers = WORKERS
+    if "-j" in argv:
+        i = argv.index("-j")
+        workers = int(argv[i + 1])
+        argv = argv[:i] + argv[i + 2 :]
     argv = ["-T", TIME] + argv[1:]
 
-    i = 1
-    for k in K_PIS:
-        log_file = f"{DIR}/results_{i}.json"
-        with open(log_file, "w") as fh:
-            fh.write('{ "trials": [' + os.linesep)
-
-        for c, j in product(CONT, range(1, END + 1)):
-            args = [
-                "",
-                "-c",
-                c,
-                "-r",
-                RNG_PARAMS,
-                "-o",
-                log_file,
-                "-p",
-                PRODUCE_RATE_SCALER * j,
-                "-K",
-                k,
-            ]
-            args += argv
+    trials = []
+    for mode in CONNECTION_MODES:
+        for i, k in enumerate(K_PIS, start=1):
+            log_file = f"{DIR}/results_{i}{_suffix(mode)}.jsonl"
+            for c, j in product(CONT, range(1, END + 1)):
+                args = [
+                    "",
+                    "-c",
+                    c,
+                    "-r",
+                    RNG_PARAMS,
+                    "-p",
+                    PRODUCE_RATE_SCALER * j,
+                    "-K",
+                    k,
+                    "-m",
+                    mode,
+                ]
+                args += argv
+                trials.append((log_file, [str(a) for a in args]))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for log_file, args in trials:
             print("Starting simulation with arguments:")
             print("  ", args)
-            main(args)
-            with open(log_file, "a") as fh:
-                fh.write(f",{os.linesep}")
-
-        with open(log_file, "a") as fh:
-            fh.write("{}]}" + os.linesep)
-        i += 1
+            futures.append((log_file, executor.submit(_trial, args)))
+
+        prev_log_file = None
+        for log_file, future in futures:
+            """Collect outputs in the submission order so results are deterministic."""
+            mode = "a" if log_file == prev_log_file else "w"
+            with open(log_file, mode) as fh:
+                fh.write(future.result())
+            prev_log_file = log_file
 
     return 0
 
@@ -2,61 +2,48 @@
 
 import sys
 import asyncio
-from multiprocessing import Process, Semaphore
+from multiprocessing import Process, SimpleQueue
 import time
 import getopt
-import json
+import struct
 
+import numpy as np
 import soyutnet
 from soyutnet import SoyutNet
-from soyutnet.constants import GENERIC_ID, GENERIC_LABEL
+from soyutnet.constants import GENERIC_LABEL
+
+from ..common.pool import ConnectionPool
+from ..common import virtual_time
+from ..common.jsonl import write_record
+from ..common.branches import add_branches, others_mean
+from ..common.histogram import BranchLatencies
+from ..common.arrivals import ARRIVAL_KINDS, ArrivalSchedule, arrival_times
+from ..common.sampler import BLOCK_SIZE, ServiceTimeSampler, SharedSamples
+from ..common.loop import use_event_loop
 
 MESSAGE = b"EXCHANGED"
 MESSAGE_SIZE = len(MESSAGE)
+FRAME_HEADER = struct.Struct("!H")
+"""Each message is prefixed by its length so a connection can carry many messages."""
+CONNECTION_MODES = ("single", "pool")
 
 
-def server_main(args, cond):
-    import random
-    from secrets import token_bytes
+async def read_frame(reader):
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (size,) = FRAME_HEADER.unpack(header)
+    return await reader.readexactly(size)
 
-    random.seed(token_bytes(16))
 
-    RNG_PARAMS = list(args["RNG_PARAMS"])
+def write_frame(writer, data):
+    writer.write(FRAME_HEADER.pack(len(data)) + data)
 
-    def normal_rng(*args):
-        return random.gauss(*args)
 
-    def exponential_rng(*args):
-        return random.expovariate(1.0 / args[0])
+def server_main(args, ready):
+    use_event_loop(args["LOOP"])
 
     print(f"Process {args['ID']} started")
 
-    _rand = None
-    match RNG_PARAMS[0]:
-        case "normal":
-            _rand = normal_rng
-        case _:
-            _rand = exponential_rng
-
-    start_time = None
-    total_time = args["RUNTIME"]
-    load_vs_time = args["LOAD"]
-
-    def rand():
-        nonlocal start_time
-        nonlocal RNG_PARAMS
-        if start_time is None:
-            start_time = time.time()
-
-        def adjust_load():
-            delta_time = (time.time() - start_time) / total_time
-            for l in load_vs_time:
-                if l[0] >= delta_time:
-                    RNG_PARAMS[1] = l[1] * args["RNG_PARAMS"][1]
-                    break
-
-        adjust_load()
-        return _rand(*(RNG_PARAMS[1:]))
+    rand = ServiceTimeSampler(args)
 
     async def canceller():
         await asyncio.sleep(args["RUNTIME"])
@@ -66,14 +53,17 @@ def server_main(args, cond):
     # [[tcp-server-defs-start]]
 
     async def handle_echo(reader, writer):
-        data = await reader.read(MESSAGE_SIZE)
-        delay_amount = rand()
-        await asyncio.sleep(delay_amount)
-        """Imitate a time consuming process by delay."""
-        writer.write(data)
-        await writer.drain()
+        try:
+            while True:
+                data = await read_frame(reader)
+                delay_amount = rand()
+                await asyncio.sleep(delay_amount)
+                """Imitate a time consuming process by delay."""
+                write_frame(writer, data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            """Client closed the connection."""
         writer.close()
-        await writer.wait_closed()
 
     # [[tcp-server-defs-end]]
 
@@ -85,7 +75,8 @@ def server_main(args, cond):
         addrs = ", ".join(str(sock.getsockname()) for sock in server.sockets)
         print(f"Serving on {addrs}")
         async with server:
-            cond.release()
+            ready.put(server.sockets[0].getsockname()[1])
+            """Let parent process know the port this process listens."""
             await server.serve_forever()
 
     try:
@@ -129,9 +120,9 @@ def USAGE():
       -H hostname
         Default: 127.0.0.1
       -P ports
-        port1,port2
+        port1,port2,...
 
-        Default: 8888,8889
+        Default: 0 for each branch (each server picks a free port)
       -r <option>
         random number generator params
           e.g. exponential,0.1
@@ -147,6 +138,40 @@ def USAGE():
           e.g. 1e-1,1e-2
 
         Default: 1e-2,1e-4
+      -m <single|pool>
+        TCP connection mode of the consumers. 'single' opens a new connection
+        for each token, 'pool' keeps a persistent connection to each server.
+
+        Default: single
+      -V
+        if provided, runs the simulation on a virtual clock. Producer and
+        controller delays and the processing time of servers advance a simulated
+        clock and the TCP servers are replaced by in-process delays.
+
+      -a <constant|poisson|trace:filename>
+        arrival schedule of the producer. 'constant' produces a token at each
+        1/rate seconds, 'poisson' draws exponential inter-arrival times with the
+        same average and 'trace' replays the arrival times (sec) at each line of
+        the file. The schedule is absolute, so the tokens which are due are
+        produced at once when the producer wakes up late.
+
+        Default: constant
+      -S <seed>
+        seed of the processing times of servers and the poisson arrivals. If
+        provided, the same random values are generated at each run.
+      -M
+        if provided, the processing times are generated once by the main process
+        and shared with the TCP servers through shared memory.
+      -E <asyncio|uvloop>
+        event loop implementation
+
+        The simulation on a virtual clock (-V) always uses its own loop.
+
+        Default: asyncio
+      -N <count>
+        number of branches (consumers), at least 2
+
+        Default: 2
 
     **Example**
 
@@ -175,10 +200,17 @@ def main(argv):
     PRODUCE_RATE = 10
     GENERATE_GRAPH_AND_EXIT = False
     HOST = "127.0.0.1"
-    PORTS = [8888, 8889]
+    PORTS = None
     K_PI = []
+    CONNECTION_MODE = "single"
+    VIRTUAL_TIME = False
+    ARRIVALS = "constant"
+    ARRIVAL_TRACE = None
+    SEED = None
+    SHARED_SAMPLES = False
+    EVENT_LOOP = "asyncio"
 
-    opts, args = getopt.getopt(argv[1:], "r:c:T:o:l:p:GH:P:K:")
+    opts, args = getopt.getopt(argv[1:], "r:c:T:o:l:p:GH:P:K:m:VN:a:S:ME:")
 
     for o, a in opts:
         if o == "-r":
@@ -208,11 +240,48 @@ def main(argv):
             K_PI = [float(val) for val in a.split(",")]
             if len(K_PI) != 2:
                 raise RuntimeError(f"Option -K is invalid '{a}'")
+        elif o == "-m":
+            if a not in CONNECTION_MODES:
+                raise RuntimeError(f"Option -m is invalid '{a}'")
+            CONNECTION_MODE = a
+        elif o == "-V":
+            VIRTUAL_TIME = True
+        elif o == "-a":
+            ARRIVALS, _, ARRIVAL_TRACE = a.partition(":")
+            if ARRIVALS not in ARRIVAL_KINDS or (ARRIVALS == "trace") != bool(
+                ARRIVAL_TRACE
+            ):
+                raise RuntimeError(f"Option -a is invalid '{a}'")
+        elif o == "-S":
+            SEED = int(a)
+        elif o == "-M":
+            SHARED_SAMPLES = True
+        elif o == "-E":
+            EVENT_LOOP = a
+        elif o == "-N":
+            PROC_COUNT = int(a)
+            if PROC_COUNT < 2:
+                raise RuntimeError(f"Option -N is invalid '{a}'")
+
+    if PORTS is None:
+        PORTS = [0] * PROC_COUNT
+        """Port 0 lets the operating system assign a free port to each server."""
+    elif len(PORTS) != PROC_COUNT:
+        raise RuntimeError(f"Option -P requires {PROC_COUNT} ports")
 
     if CONTROLLER_TYPE == "none":
         CONTROLLER_ENABLED = False
 
-    PRODUCE_DELAY = 1.0 / PRODUCE_RATE
+    schedule = ArrivalSchedule(
+        arrival_times(
+            ARRIVALS,
+            PRODUCE_RATE,
+            STOP_AFTER,
+            trace=ARRIVAL_TRACE,
+            rng=np.random.default_rng(SEED),
+        )
+    )
+    """Arrival times are precomputed, so the overhead of the net does not lower the rate."""
 
     SERVER_RUNTIME = STOP_AFTER + 1
     """Server should run longer than clients."""
@@ -225,15 +294,45 @@ def main(argv):
 
     # [[loop-delay-defs-end]]
 
+    clock = time.time
+    if VIRTUAL_TIME:
+        clock = net.time
+        net.sleep = virtual_time.sleep
+        """
+        Transitions poll their input arcs in a loop. On the virtual clock, they are
+        parked until another task makes progress instead of spinning.
+        """
+
     # [[producer-defs-start]]
 
     token_id = 0
+    produced_at = {}
+    """Production times of the tokens travelling through the net."""
+    produce_start = None
+    last_produced_at = None
 
     async def producer(place):
-        nonlocal token_id
-        await net.sleep(PRODUCE_DELAY)
-        token_id += 1
-        return [(L, token_id)]
+        nonlocal token_id, produce_start, last_produced_at
+        if produce_start is None:
+            produce_start = clock()
+        while (due := schedule.due(clock() - produce_start)) == 0:
+            next_at = schedule.next_at()
+            if next_at is None:
+                await net.sleep(STOP_AFTER)
+                """The schedule is finished."""
+                continue
+            await net.sleep(next_at - (clock() - produce_start))
+            """Sleep until the next arrival instead of a fixed delay."""
+
+        tokens = []
+        last_produced_at = clock()
+        for i in range(due):
+            token_id += 1
+            produced_at[token_id] = last_produced_at
+            tokens.append((L, token_id))
+        """Produce all tokens which are due when the producer is behind."""
+
+        return tokens
 
     # [[producer-defs-end]]
 
@@ -241,52 +340,58 @@ def main(argv):
 
     sensors = [asyncio.Queue() for i in range(PROC_COUNT)]
     consumer_stats = {}
+    latencies = BranchLatencies(PROC_COUNT)
+    """Latency histograms exported with the results."""
 
     async def consumer(place):
         async def echo_client():
             """Simple TCP echo client"""
-            reader, writer = await asyncio.open_connection(HOST, PORTS[index])
-            writer.write(MESSAGE)
-            await writer.drain()
-            data = await reader.read(MESSAGE_SIZE)
-            writer.close()
-            await writer.wait_closed()
+            async with pools[index].connection() as (reader, writer):
+                write_frame(writer, MESSAGE)
+                await writer.drain()
+                data = await read_frame(reader)
 
         nonlocal consumer_stats
         start_time = 0
         ident = place.ident()
         index = int(place._name[1:]) - 1
-        """Get branch index (0 or 1)"""
+        """Get branch index"""
         sensor = sensors[index]
         if ident not in consumer_stats:
             """Initialize stats at first call of the producer."""
-            consumer_stats[ident] = {"started_at": time.time(), "count": 0}
+            consumer_stats[ident] = {"started_at": clock(), "count": 0}
             """Store initial time and number of requests processed to calculate requests per second."""
             sensor.put_nowait(1)
             """Initial push to the controllers, otherwise they will stuck at waiting the sensor."""
 
         label = L
         token = place.get_token(label)
-        T = time.time()
+        T = clock()
         if not token:
-            consumer_stats[ident]["last_at"] = time.time()
+            consumer_stats[ident]["last_at"] = clock()
             sensor.put_nowait(0)
             """If there is no new token in the buffer, inform the controller."""
             return
 
-        await echo_client()
+        if VIRTUAL_TIME:
+            await asyncio.sleep(service_times[index]())
+            """Stand-in for the TCP server which only delays the request."""
+        else:
+            await echo_client()
         """Fullfill the request."""
+        latencies.record("end_to_end", index, clock() - produced_at.pop(token[1]))
+        """Time passed from p0 to the consumer."""
 
         sensor.put_nowait(1)
         """Inform the controller."""
         consumer_stats[ident]["count"] += 1
-        consumer_stats[ident]["last_at"] = time.time()
+        consumer_stats[ident]["last_at"] = clock()
 
     # [[consumer-defs-end]]
 
     # [[controller-defs-start]]
 
-    ci = [0.0, 0.0]
+    ci = np.zeros(PROC_COUNT)
     """Integrator states"""
     Kp = 1e-2 if not K_PI else K_PI[0]
     """Propotional gain"""
@@ -294,8 +399,8 @@ def main(argv):
     """Integrator gain"""
     Zi = 1e-2
     """Integrator damping"""
-    count = [0, 0]
-    """Total number of times the transitions t13 and t23 fire."""
+    count = np.zeros(PROC_COUNT, dtype=np.int64)
+    """Total number of times the transitions t13, t23, ... fire."""
 
     async def controller(place):
         nonlocal ci
@@ -305,22 +410,27 @@ def main(argv):
         index = int(place._name[1:]) - 1
         """Get branch index."""
         sensor = sensors[index]
+        T = clock()
         value = await sensor.get()
         """Receive a notification from the consumer."""
+        latencies.record("sensor_wait", index, clock() - T)
         if CONTROLLER_TYPE == "C2":
             """This happens when controller is chosen 'C2'"""
             count[index] += 1
-            err = count[index] - count[1 - index]
-            """Calculate the difference between branches"""
-            sleep_amount = Kp * err + ci[index]
+            err = count[index] - others_mean(count, index)
+            """Calculate the difference from the other branches"""
+            sleep_amount = float(Kp * err + ci[index])
             ci[index] = (1.0 - Zi) * ci[index] + Ki * err
             """PI controller"""
             if abs(sleep_amount) > 1e4:
                 """This should never happen."""
                 print("!!!", sleep_amount, "!!!")
                 ci[index] = 0.0
+            T = clock()
             await net.sleep(sleep_amount)
             """Give a push to the other branch when it is slower."""
+            overshoot = clock() - T - max(sleep_amount, 0.0)
+            latencies.record("sleep_overshoot", index, max(overshoot, 0.0))
             return True
 
         return value > 0  # This is the case when controller is 'C1'.
@@ -330,71 +440,15 @@ def main(argv):
     p0 = net.SpecialPlace("p0", producer=producer)
     t0 = net.Transition("t0")
     p1 = net.Place("p1")
-    p11 = net.Place("p11")
-    o12 = net.Observer(verbose=True)
-    p12 = net.Place("p12", observer=o12)
-    t11 = net.Transition("t11")
-    t12 = net.Transition("t12")
-    t13 = net.Transition("t13")
-    e1 = net.SpecialPlace("e1", consumer=consumer)
-
-    k1 = net.Place(
-        "k1", initial_tokens={GENERIC_LABEL: [GENERIC_ID] * 1}, processor=controller
-    )
-    """Add initial tokens, otherwise PT nets will stuck at its initial state."""
-
-    p21 = net.Place("p21")
-    o22 = net.Observer(verbose=True)
-    p22 = net.Place("p22", observer=o22)
-    t21 = net.Transition("t21")
-    t22 = net.Transition("t22")
-    t23 = net.Transition("t23")
-    e2 = net.SpecialPlace("e2", consumer=consumer)
-
-    k2 = net.Place(
-        "k2", initial_tokens={GENERIC_LABEL: [GENERIC_ID] * 1}, processor=controller
-    )
 
     reg = net.PTRegistry()
     reg.register(p0)
     reg.register(t0)
     reg.register(p1)
-    reg.register(p11)
-    reg.register(p12)
-    reg.register(t11)
-    reg.register(t12)
-    reg.register(t13)
-
-    reg.register(e1)
-    reg.register(k1)
-    reg.register(p21)
-    reg.register(p22)
-    reg.register(t21)
-    reg.register(t22)
-    reg.register(t23)
-    reg.register(e2)
-    reg.register(k2)
-
-    (
-        p0.connect(t0, labels=[L])
-        .connect(p1, labels=[L])
-        .connect(t11, labels=[L])
-        .connect(p11, weight=2, labels=[GENERIC_LABEL, L])
-        .connect(t12, weight=2, labels=[GENERIC_LABEL, L])
-        .connect(p12, labels=[L])
-        .connect(t13, labels=[L])
-        .connect(e1, labels=[L]),
-        t12.connect(k1).connect(t11),
-    )
-    (
-        p1.connect(t21, labels=[L])
-        .connect(p21, weight=2, labels=[GENERIC_LABEL, L])
-        .connect(t22, weight=2, labels=[GENERIC_LABEL, L])
-        .connect(p22, labels=[L])
-        .connect(t23, labels=[L])
-        .connect(e2, labels=[L]),
-        t22.connect(k2).connect(t21),
-    )
+
+    p0.connect(t0, labels=[L]).connect(p1, labels=[L])
+    add_branches(net, reg, p1, PROC_COUNT, L, consumer, controller)
+    """Branch i consists of p{i}1, p{i}2, t{i}1, t{i}2, t{i}3, e{i} and k{i}."""
 
     if GENERATE_GRAPH_AND_EXIT:
         OUTPUT_FILE.close()
@@ -403,13 +457,21 @@ def main(argv):
 
         return 0
 
-    loads = [[], []]
+    loads = [[] for i in range(PROC_COUNT)]
     for l in LOAD:
         loads[1].append((l[0], l[1]))
     """Assign a larger load to consumer 2"""
 
+    shared_samples = None
+    if SHARED_SAMPLES and not VIRTUAL_TIME:
+        shared_samples = SharedSamples(
+            PROC_COUNT, size=len(schedule) + BLOCK_SIZE, seed=SEED
+        )
+        """Each server needs at most one sample for each produced token."""
+
     procs = set()
-    init_conditions = set()
+    init_conditions = []
+    service_times = []
     for i in range(PROC_COUNT):
         args = {
             "ID": i,
@@ -418,35 +480,62 @@ def main(argv):
             "PORT": PORTS[i],
             "RNG_PARAMS": RNG_PARAMS,
             "LOAD": loads[i],
+            "SEED": SEED,
+            "LOOP": EVENT_LOOP,
+            "SHARED_SAMPLES": None if shared_samples is None else shared_samples.spec,
         }
-        cond = Semaphore(value=0)
+        if VIRTUAL_TIME:
+            service_times.append(ServiceTimeSampler(args, clock=clock))
+            continue
+        ready = SimpleQueue()
         proc = Process(
             target=server_main,
             args=(
                 args,
-                cond,
+                ready,
             ),
         )
         proc.start()
         procs.add(proc)
-        init_conditions.add(cond)
+        init_conditions.append(ready)
     """Started TCP servers"""
 
-    [cond.acquire() for cond in init_conditions]
-    """Make sure TCP servers started"""
+    PORTS = [ready.get() for ready in init_conditions]
+    """Make sure TCP servers started and get their ports"""
+
+    pools = [
+        ConnectionPool(HOST, port, max_size=int(CONNECTION_MODE == "pool"))
+        for port in PORTS
+    ]
+    """A pool of size zero opens a new connection for each token."""
 
     async def scheduled():
         await asyncio.sleep(STOP_AFTER)
+        for pool in pools:
+            await pool.close()
         soyutnet.terminate()
 
     """Automatically terminate after an amount of time"""
 
-    soyutnet.run(reg, extra_routines=[scheduled()])
+    if VIRTUAL_TIME:
+        try:
+            virtual_time.run(
+                soyutnet.main(reg, extra_routines=[scheduled()]),
+                state_probe=virtual_time.marking_probe(reg),
+            )
+        except asyncio.exceptions.CancelledError:
+            pass
+    else:
+        use_event_loop(EVENT_LOOP)
+        soyutnet.run(reg, extra_routines=[scheduled()])
     """Start simulation"""
 
     for proc in procs:
         proc.join()
 
+    if shared_samples is not None:
+        shared_samples.close()
+
     for name in consumer_stats:
         stats = consumer_stats[name]
         count = stats["count"]
@@ -456,19 +545,34 @@ def main(argv):
             )
         else:
             stats["req_per_sec"] = 0
-    print(
-        json.dumps(
-            {
-                "params": {
-                    "rng": RNG_PARAMS,
-                    "control": CONTROLLER_ENABLED,
-                    "controller_type": CONTROLLER_TYPE,
-                    "produce_rate": PRODUCE_RATE,
-                },
-                "stats": consumer_stats,
-            }
-        ),
-        file=OUTPUT_FILE,
+    achieved_rate = 0.0
+    if token_id > 0 and last_produced_at > produce_start:
+        achieved_rate = token_id / (last_produced_at - produce_start)
+    write_record(
+        OUTPUT_FILE,
+        {
+            "params": {
+                "rng": RNG_PARAMS,
+                "control": CONTROLLER_ENABLED,
+                "controller_type": CONTROLLER_TYPE,
+                "produce_rate": PRODUCE_RATE,
+                "connection": CONNECTION_MODE,
+                "virtual_time": VIRTUAL_TIME,
+                "branches": PROC_COUNT,
+                "arrivals": ARRIVALS,
+                "seed": SEED,
+                "event_loop": EVENT_LOOP,
+            },
+            "producer": {
+                "requested_rate": PRODUCE_RATE,
+                "scheduled_rate": schedule.rate(),
+                "achieved_rate": achieved_rate,
+                "produced": token_id,
+                "max_burst": schedule.max_burst,
+            },
+            "stats": consumer_stats,
+            "latency": latencies.summary(),
+        },
     )
     OUTPUT_FILE.close()
     """Dump results"""
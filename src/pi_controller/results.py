@@ -2,27 +2,40 @@
 
 import sys
 import getopt
-import json
 from collections import OrderedDict
 
 import matplotlib.pyplot as plt
 import numpy as np
 
+from ..common.jsonl import iter_records
 
-def load_result(fn):
-    result_obj = None
-    with open(fn, "r") as fh:
-        result_obj = json.load(fh)
 
+class _Rows:
+    """Two dimensional array growing by rows, its capacity doubles when full."""
+
+    def __init__(self, width):
+        self._data = np.empty((16, width))
+        self._size = 0
+
+    def append(self, row):
+        if self._size == len(self._data):
+            self._data = np.resize(self._data, (2 * len(self._data), len(row)))
+        self._data[self._size] = row
+        self._size += 1
+
+    def array(self):
+        return self._data[: self._size].copy()
+
+
+def load_result(fn):
     result_vs_controller = OrderedDict()
 
-    for trial in result_obj["trials"]:
+    for trial in iter_records(fn):
+        """Trials are read one by one, so a sweep can be plotted while running."""
         if "params" not in trial:
             continue
         params = trial["params"]
         controller_type = params["controller_type"]
-        if controller_type not in result_vs_controller:
-            result_vs_controller[controller_type] = []
         stats = trial["stats"]
         result_vs_place = []
         for name in stats:
@@ -33,10 +46,13 @@ def load_result(fn):
 
         var = params["rng"][-1]
         rate = params["produce_rate"]
-        result_vs_controller[controller_type].append((rate,) + tuple(result_vs_place))
+        row = (rate,) + tuple(result_vs_place)
+        if controller_type not in result_vs_controller:
+            result_vs_controller[controller_type] = _Rows(len(row))
+        result_vs_controller[controller_type].append(row)
 
     for name in result_vs_controller:
-        result_vs_controller[name] = np.array(result_vs_controller[name])
+        result_vs_controller[name] = result_vs_controller[name].array()
 
     return result_vs_controller
 
@@ -46,7 +62,8 @@ def plot_results(results, output_file=""):
     for name in results:
         x = results[name][:, :1]
         tmp = np.array(results[name][:, 2::2])
-        y = np.abs(tmp[:, 0] - tmp[:, 1])
+        y = np.ptp(tmp, axis=1)
+        """Difference between the busiest and the idlest consumers"""
         (line,) = axes[0].plot(x, y)
         line.set_label(name)
         y = np.sum(tmp, axis=1)
@@ -50,9 +50,9 @@ def _results(argv):
 
 
 def _main(argv):
-    log_file = f"{DIR}/results.json"
-    with open(log_file, "w") as fh:
-        fh.write('{ "trials": [' + os.linesep)
+    log_file = f"{DIR}/results.jsonl"
+    open(log_file, "w").close()
+    """Each trial appends its result to the log file as a single line."""
 
     for bw, eps, cont, rng in product(
         DEN_BIT_WIDTH, EPSILONS, CONTROLLER_TYPE, RNG_PARAMS
@@ -76,11 +76,6 @@ def _main(argv):
         print("Starting simulation with arguments:")
         print("  ", args)
         main(args)
-        with open(log_file, "a") as fh:
-            fh.write(f",{os.linesep}")
-
-    with open(log_file, "a") as fh:
-        fh.write("{}]}" + os.linesep)
 
     return 0
 
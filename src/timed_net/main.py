@@ -4,7 +4,6 @@ import sys
 import asyncio
 import time
 import getopt
-import json
 import random
 from secrets import token_bytes
 import math
@@ -20,6 +19,8 @@ from soyutnet.constants import GENERIC_ID, GENERIC_LABEL, INVALID_ID
 
 from . import results
 from ..common import logged
+from ..common.jsonl import write_record
+from ..common.loop import use_event_loop
 
 
 def USAGE():
@@ -58,6 +59,11 @@ def USAGE():
       -b denominator bit width (bw)
         The denominator of Fraction used in calculations are limited to 2^(bw)-1
 
+      -E <asyncio|uvloop>
+        event loop implementation
+
+        Default: asyncio
+
     **Example**
       python src/timed_net/main.py -r 100,10,200,25 -T 2
     """
@@ -81,6 +87,7 @@ def main(argv, OUTPUT_FILE):
     CONTROLLER_TYPE = "strict"
     EPSILON = 1e-2
     BIT_WIDTH = 1
+    EVENT_LOOP = "asyncio"
 
     MINS = 60
 
@@ -90,7 +97,7 @@ def main(argv, OUTPUT_FILE):
     PRODUCER2_LABEL = 2
     T0 = 0
 
-    opts, args = getopt.getopt(argv[1:], "r:o:GT:WC:e:b:")
+    opts, args = getopt.getopt(argv[1:], "r:o:GT:WC:e:b:E:")
 
     for o, a in opts:
         if o == "-r":
@@ -111,6 +118,8 @@ def main(argv, OUTPUT_FILE):
             EPSILON = float(a)
         elif o == "-b":
             BIT_WIDTH = int(a)
+        elif o == "-E":
+            EVENT_LOOP = a
 
     if CONTROLLER_TYPE == "weak":
         WEAK_COMPARISON = True
@@ -633,24 +642,25 @@ def main(argv, OUTPUT_FILE):
             await converged.wait()
         soyutnet.terminate()
 
+    use_event_loop(EVENT_LOOP)
     soyutnet.run(reg, extra_routines=[canceller()])
     """Start simulation"""
 
     # [[loop-start-defs-end]]
 
-    OUTPUT_FILE.write(
-        json.dumps(
-            {
-                "params": {
-                    "PRODUCER1_DELAY": PRODUCER1_DELAY,
-                    "PRODUCER2_DELAY": PRODUCER2_DELAY,
-                    "CONTROLLER_TYPE": CONTROLLER_TYPE,
-                },
-                "production_time": production_time.data,
-                "arrival_time": t31.arrival_time,
-                "controller_stats": controller.get_stats(),
-            }
-        )
+    write_record(
+        OUTPUT_FILE,
+        {
+            "params": {
+                "PRODUCER1_DELAY": PRODUCER1_DELAY,
+                "PRODUCER2_DELAY": PRODUCER2_DELAY,
+                "CONTROLLER_TYPE": CONTROLLER_TYPE,
+                "EVENT_LOOP": EVENT_LOOP,
+            },
+            "production_time": production_time.data,
+            "arrival_time": t31.arrival_time,
+            "controller_stats": controller.get_stats(),
+        },
     )
 
     return 0
@@ -3,7 +3,6 @@
 import os
 import sys
 import getopt
-import json
 import glob
 from pathlib import Path
 import math
@@ -12,6 +11,7 @@ from functools import partial
 import statistics
 import operator
 
+from ..common.jsonl import iter_records, results_file
 
 DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -63,18 +63,19 @@ def joint_variance(dist1, dist2):
 
 
 def load_results():
-    data = None
-    with open(DIR + "/results.json") as fh:
-        data = json.load(fh)
-
-    if data is None:
-        raise RuntimeError("Could not load results")
-
+    trials = []
     moments = []
 
-    for trial in data["trials"]:
+    for trial in iter_records(results_file(DIR + "/results")):
         if "production_time" not in trial:
             continue
+        trials.append(
+            {
+                "params": trial["params"],
+                "controller_stats": trial["controller_stats"],
+            }
+        )
+        """Only keep the fields printed in the tables, not the time series."""
         controller_stats = trial["controller_stats"]
         if controller_stats["weak"] == 1 or controller_stats["eps"] > 1e-2:
             continue
@@ -92,9 +93,10 @@ def load_results():
         res = [mu, mu0, std, std0]
         moments.append(res)
 
-    data["moments"] = moments
+    if not trials:
+        raise RuntimeError("Could not load results")
 
-    return data
+    return {"trials": trials, "moments": moments}
 
 
 def main(argv):
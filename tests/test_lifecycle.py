@@ -0,0 +1,76 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from src.common.control import send_command
+from src.common.lifecycle import wait_trial_end
+
+ROOT_DIR = os.path.realpath(f"{os.path.dirname(__file__)}/..")
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _loadgen(done_path):
+    """
+    Starts a load generator which waits for a server that never starts, so it
+    does not send ``done`` by itself.
+    """
+    cmd = [sys.executable, "-m", "src.common.loadgen", "-n", "10", "-c", "1"]
+    cmd += ["-D", done_path, f"http://127.0.0.1:{_free_port()}/"]
+    return subprocess.Popen(cmd, cwd=ROOT_DIR, stdout=subprocess.DEVNULL)
+
+
+def test_trial_ends_when_load_generator_dies_before_done(tmp_path):
+    done_path = str(tmp_path / "done.sock")
+    proc = _loadgen(done_path)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.5, proc.kill)
+        await asyncio.wait_for(wait_trial_end(done_path, proc.pid), 60.0)
+        """Only a safety net, the trial ends when the process exits."""
+        return proc.poll()
+
+    try:
+        returncode = asyncio.run(main())
+    finally:
+        proc.kill()
+        proc.wait()
+
+    assert returncode is not None
+    """The trial ended because the load generator exited."""
+    with pytest.raises(OSError):
+        send_command(done_path, cmd="done")
+    """The control server is closed after the trial."""
+
+
+def test_trial_ends_at_done_while_load_generator_runs(tmp_path):
+    done_path = str(tmp_path / "done.sock")
+    proc = _loadgen(done_path)
+
+    async def done():
+        await asyncio.sleep(0.5)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lambda: send_command(done_path, cmd="done"))
+
+    async def main():
+        sender = asyncio.create_task(done())
+        await asyncio.wait_for(wait_trial_end(done_path, proc.pid), 60.0)
+        await sender
+
+    try:
+        asyncio.run(main())
+        assert proc.poll() is None
+    finally:
+        proc.kill()
+        proc.wait()
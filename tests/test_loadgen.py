@@ -0,0 +1,78 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import socket
+
+import uvicorn
+
+from src.common.echo import echo
+from src.common.loadgen import _Client, _read_response, _request_bytes
+
+
+def test_read_chunked_response():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(
+            b"HTTP/1.1 200 OK\r\ntransfer-encoding: chunked\r\n\r\n"
+            b"5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n"
+            b"HTTP/1.1 204 No Content\r\ncontent-length: 0\r\n\r\n"
+        )
+        reader.feed_eof()
+        first = await _read_response(reader)
+        second = await _read_response(reader)
+        return first, second
+
+    first, second = asyncio.run(main())
+
+    assert first == (200, True)
+    assert second == (204, True)
+    """The chunked body ends at the last chunk, so the next response follows."""
+
+
+clients = set()
+"""Client addresses of the connections served by ``_chunked_echo``"""
+
+
+async def _chunked_echo(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    clients.add(scope["client"])
+    await echo(scope, receive, send, 0.0, "delay")
+    """A GET has no Content-Length, so the response is chunked."""
+
+
+def test_keep_alive_with_chunked_responses():
+    count = 20
+    clients.clear()
+
+    async def main():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        config = uvicorn.Config(_chunked_echo, log_level="critical")
+        server = uvicorn.Server(config)
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started:
+            await asyncio.sleep(0.01)
+
+        url = f"http://127.0.0.1:{port}/"
+        client = _Client("127.0.0.1", port, _request_bytes(url, None, True), True)
+        try:
+            await asyncio.wait_for(client.closed_loop(count, 1), 60.0)
+            """
+            Only a safety net: a body read until the keep-alive timeout of the
+            server would take 5 sec per request.
+            """
+        finally:
+            client.close()
+            server.should_exit = True
+            await serving
+
+        return client
+
+    client = asyncio.run(main())
+
+    assert client.failed == 0
+    assert len(client.latencies) == count
+    assert len(clients) == 1
+    """A single connection is reused by all requests."""
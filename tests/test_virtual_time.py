@@ -0,0 +1,41 @@
+# SPDX-License-Identifier:  CC-BY-SA-4.0
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from src.common.virtual_time import VirtualTimeEventLoop
+
+ROOT_DIR = os.path.realpath(f"{os.path.dirname(__file__)}/..")
+
+
+def test_asyncio_internals():
+    assert hasattr(asyncio.BaseEventLoop, "_asyncgen_finalizer_hook")
+    """Overridden by the virtual time loop, a rename would silently bypass it."""
+    loop = VirtualTimeEventLoop()
+    try:
+        assert callable(loop._asyncgens.discard)
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize("controller", ["C1", "C3"])
+def test_virtual_time_trial(tmp_path, controller):
+    output = tmp_path / "results.jsonl"
+    cmd = [sys.executable, "-m", "src.pi_controller.main", "-V", "-T", "5"]
+    cmd += ["-c", controller, "-o", str(output)]
+    subprocess.run(
+        cmd, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, check=True, timeout=120
+    )
+    """The marking probe reads the private attributes of the soyutnet PTs."""
+
+    with open(output) as fh:
+        record = json.loads(fh.readlines()[-1])
+    assert record["params"]["virtual_time"]
+    assert record["producer"]["produced"] >= 45
+    """10 Hz for 5 virtual seconds"""
+    assert sum(stats["count"] for stats in record["stats"].values()) > 0